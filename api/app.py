@@ -1,28 +1,123 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Optional
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Literal, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+import itertools
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import uuid
+import json
 import os
 import logging
-from api.tasks import run_spider
+from api.batches import BatchStore
+from api.cache import ResponseCache, redis_url_from_env
+from api.coalesce import SingleFlight
+from api.db import DatabasePool, PoolTimeout
+from api.export import EXPORT_COLUMNS, csv_chunks, gzip_chunks, ndjson_chunks
+from api.metrics import ApiStateCollector, MetricsMiddleware, RedisMetricsCollector, SPIDER_QUEUES, registry, render
+from api.progress import ProgressFeed
+from api.pagination import (
+    CachedCount, InvalidCursor, decode_cursor, decode_search_cursor, encode_cursor, encode_search_cursor
+)
+from api.search import SearchQueryError, normalize_query, search_quotes
+from api.tasks import DEFAULT_PRIORITY, run_spider, submit_batch
+from celery.states import READY_STATES
+from scraper import migrations
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared connection pool, opened at startup and closed at shutdown
+db_pool = DatabasePool.from_env()
+
+# Read-through cache for /api/quotes, invalidated by the scraper's generation counter
+response_cache = ResponseCache.from_env()
+
+# Live crawl progress published by the scraper's CrawlProgressPublisher
+progress_feed = ProgressFeed(redis_url_from_env())
+
+# Aggregate progress of batches submitted through /api/scrape/batch
+batch_store = BatchStore(redis_url_from_env())
+BATCH_MAX_JOBS = int(os.getenv('BATCH_MAX_JOBS', 100))
+
+# Concurrent identical polls of /api/quotes and /api/task/{id} share one
+# backend call instead of each issuing their own
+REQUEST_COALESCING = os.getenv('API_REQUEST_COALESCING', 'true').lower() == 'true'
+quotes_flight = SingleFlight('quotes', enabled=REQUEST_COALESCING)
+task_flight = SingleFlight('task_status', enabled=REQUEST_COALESCING)
+
+# Totals for /api/quotes are cached so listing cost does not grow with the table
+quotes_count = CachedCount('quotes', ttl=float(os.getenv('QUOTES_COUNT_TTL', 30)))
+
+# Rows fetched per round-trip by /api/quotes/export
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 2000))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db_pool.open()
+    yield
+    await progress_feed.close()
+    await batch_store.close()
+    await response_cache.close()
+    db_pool.close()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Web Scraper API",
     description="API to trigger web scraping tasks and retrieve scraped data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+app.add_middleware(MetricsMiddleware)
+
+# Sampled on every /metrics scrape: pool and cache state from this process,
+# queue depth, task durations and pipeline counters from Redis
+registry.register(ApiStateCollector(db_pool, response_cache, [quotes_flight, task_flight]))
+registry.register(RedisMetricsCollector(redis_url_from_env(), os.getenv('CELERY_BROKER_URL')))
 
 
 class SpiderRequest(BaseModel):
     """Request model for triggering spider"""
     spider_name: str = "example_spider"
+    # Skip pages unchanged since the last crawl; None keeps the scraper's default
+    incremental: Optional[bool] = None
+    # 'record' caches responses locally, 'replay' crawls from that cache unthrottled
+    cache_mode: Optional[Literal["off", "record", "replay"]] = None
+
+
+class BatchJob(BaseModel):
+    """One spider run within a batch"""
+    spider_name: str = "example_spider"
+    # Passed to the spider as a comma-separated start_urls argument
+    start_urls: Optional[List[str]] = None
+    # Other spider arguments (scrapy crawl -a name=value)
+    args: Dict[str, str] = {}
+    # Redis broker semantics: 0 runs first, 9 last
+    priority: int = Field(DEFAULT_PRIORITY, ge=0, le=9)
+    # One of CELERY_SPIDER_QUEUES; defaults to the first
+    queue: Optional[str] = None
+    incremental: Optional[bool] = None
+    cache_mode: Optional[Literal["off", "record", "replay"]] = None
+
+    @field_validator('args')
+    @classmethod
+    def check_arg_names(cls, value):
+        for name in value:
+            if not name.isidentifier():
+                raise ValueError(f"Invalid spider argument name: {name!r}")
+        return value
+
+
+class BatchRequest(BaseModel):
+    """Request model for a batch of spider runs"""
+    jobs: List[BatchJob] = Field(..., min_length=1)
 
 
 class SpiderResponse(BaseModel):
@@ -32,22 +127,6 @@ class SpiderResponse(BaseModel):
     message: str
 
 
-def get_db_connection():
-    """Get database connection"""
-    try:
-        conn = psycopg2.connect(
-            host=os.getenv('POSTGRES_HOST', 'postgres'),
-            port=int(os.getenv('POSTGRES_PORT', 5432)),
-            database=os.getenv('POSTGRES_DB', 'scraperdb'),
-            user=os.getenv('POSTGRES_USER', 'scraperuser'),
-            password=os.getenv('POSTGRES_PASSWORD', 'scraperpass123')
-        )
-        return conn
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
-
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -56,8 +135,18 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "trigger_spider": "/api/scrape",
+            "trigger_batch": "/api/scrape/batch",
+            "batch_status": "/api/batch/{batch_id}",
             "get_quotes": "/api/quotes",
+            "export_quotes": "/api/quotes/export",
+            "search_quotes": "/api/quotes/search",
             "task_status": "/api/task/{task_id}",
+            "task_events": "/api/task/{task_id}/events",
+            "crawl_runs": "/api/runs",
+            "run_trends": "/api/runs/trends",
+            "db_pool": "/api/db/pool",
+            "cache": "/api/cache",
+            "metrics": "/metrics",
             "health": "/health"
         }
     }
@@ -77,8 +166,13 @@ async def trigger_spider(request: SpiderRequest):
     try:
         logger.info(f"Triggering spider: {request.spider_name}")
         
-        # Trigger Celery task
-        task = run_spider.delay(request.spider_name)
+        # Trigger Celery task; publishing blocks, so keep it off the event loop
+        task = await run_in_threadpool(
+            run_spider.delay,
+            request.spider_name,
+            incremental=request.incremental,
+            cache_mode=request.cache_mode
+        )
         
         return SpiderResponse(
             task_id=task.id,
@@ -91,6 +185,111 @@ async def trigger_spider(request: SpiderRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/scrape/batch")
+async def trigger_batch(request: BatchRequest):
+    """
+    Queue many spider runs at once
+    
+    Args:
+        request: BatchRequest with one entry per run (spider, start URLs or
+            arguments, priority and queue)
+        
+    Returns:
+        Batch id and the task id of every job; progress is available from
+        /api/batch/{batch_id} and the chord result from /api/task/{batch_id}
+    """
+    if len(request.jobs) > BATCH_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {BATCH_MAX_JOBS} jobs")
+
+    jobs = []
+    for job in request.jobs:
+        queue = job.queue or SPIDER_QUEUES[0]
+        if queue not in SPIDER_QUEUES:
+            raise HTTPException(status_code=400, detail=f"Unknown queue {queue!r}, expected one of {SPIDER_QUEUES}")
+        spider_args = dict(job.args)
+        if job.start_urls:
+            spider_args['start_urls'] = ','.join(job.start_urls)
+        jobs.append({
+            'task_id': str(uuid.uuid4()),
+            'spider_name': job.spider_name,
+            'spider_args': spider_args,
+            'incremental': job.incremental,
+            'cache_mode': job.cache_mode,
+            'queue': queue,
+            'priority': job.priority
+        })
+
+    batch_id = str(uuid.uuid4())
+    try:
+        await batch_store.create(batch_id, [
+            {key: job[key] for key in ('task_id', 'spider_name', 'queue', 'priority')} for job in jobs
+        ])
+        # Publishing one message per job blocks; keep it off the event loop
+        await run_in_threadpool(submit_batch, batch_id, jobs)
+    except Exception as e:
+        logger.error(f"Error queueing batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    logger.info(f"Queued batch {batch_id} with {len(jobs)} jobs")
+    return {
+        "batch_id": batch_id,
+        "status": "queued",
+        "jobs": [{"task_id": job['task_id'], "spider": job['spider_name'], "queue": job['queue']} for job in jobs]
+    }
+
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """
+    Get the aggregate progress of a batch
+    
+    Args:
+        batch_id: Id returned by /api/scrape/batch
+        
+    Returns:
+        Job counts by state, items and pages scraped by finished jobs and
+        throughput over the batch's wall-clock time
+    """
+    try:
+        summary = await batch_store.get(batch_id)
+    except Exception as e:
+        logger.error(f"Error fetching batch status: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return summary
+
+
+def read_task_state(task_id):
+    """
+    Status of a Celery task from a single result backend read
+
+    AsyncResult's state, ready(), result and info each re-read the backend
+    until the task has finished; reading the meta once avoids that.
+    """
+    meta = run_spider.backend.get_task_meta(task_id)
+    status = meta.get('status')
+    result = meta.get('result')
+    if isinstance(result, Exception):
+        result = f"{type(result).__name__}: {result}"
+
+    response = {
+        "task_id": task_id,
+        "status": status,
+        "result": result if status in READY_STATES else None
+    }
+    if status == 'PROGRESS':
+        response['meta'] = result
+    return response
+
+
+async def load_task_status(task_id):
+    response = await run_in_threadpool(read_task_state, task_id)
+    # Latest stats snapshot published by the running spider
+    response['progress'] = await progress_feed.latest(task_id)
+    return response
+
+
 @app.get("/api/task/{task_id}")
 async def get_task_status(task_id: str):
     """
@@ -103,92 +302,455 @@ async def get_task_status(task_id: str):
         Task status information
     """
     try:
-        from celery.result import AsyncResult
-        
-        task = AsyncResult(task_id, app=run_spider.app)
-        
-        response = {
-            "task_id": task_id,
-            "status": task.state,
-            "result": task.result if task.ready() else None
-        }
-        
-        if task.state == 'PROGRESS':
-            response['meta'] = task.info
-            
-        return response
+        return await task_flight.do(task_id, load_task_status, task_id)
         
     except Exception as e:
         logger.error(f"Error fetching task status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/task/{task_id}/events")
+async def stream_task_progress(task_id: str, request: Request):
+    """
+    Stream live crawl progress as Server-Sent Events
+    
+    Args:
+        task_id: Celery task ID
+        
+    Returns:
+        text/event-stream with one JSON snapshot per event, ending when the
+        crawl finishes
+    """
+    return StreamingResponse(
+        progress_feed.events(task_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def fetch_quotes_page(limit, offset, position, count):
+    """
+    Query one page of quotes, by keyset position or by offset
+    """
+    if position:
+        # Keyset pagination: seek past the last row of the previous page.
+        # The redundant scraped_at bound lets the planner prune the newer
+        # partitions when quotes is partitioned; row comparisons cannot
+        quotes = await db_pool.fetch_all("""
+            SELECT id, title, link, scraped_at
+            FROM quotes
+            WHERE (scraped_at, id) < (%s, %s) AND scraped_at <= %s
+            ORDER BY scraped_at DESC, id DESC
+            LIMIT %s
+        """, (position[0], position[1], position[0], limit))
+    else:
+        quotes = await db_pool.fetch_all("""
+            SELECT id, title, link, scraped_at
+            FROM quotes
+            ORDER BY scraped_at DESC, id DESC
+            LIMIT %s OFFSET %s
+        """, (limit, offset))
+
+    total = None
+    if count != "none":
+        total = await db_pool.run(quotes_count.get, count)
+
+    next_cursor = None
+    if len(quotes) == limit:
+        next_cursor = encode_cursor(quotes[-1]['scraped_at'], quotes[-1]['id'])
+
+    return {
+        "total": total,
+        "total_is_estimate": count == "estimate",
+        "limit": limit,
+        "offset": None if position else offset,
+        "next_cursor": next_cursor,
+        "quotes": quotes
+    }
+
+
+async def load_quotes_body(cache_key, limit, offset, position, count):
+    """
+    Serialized /api/quotes response, from the response cache or the database
+    """
+    body = await response_cache.get(cache_key) if cache_key else None
+    if body is None:
+        page = await fetch_quotes_page(limit, offset, position, count)
+        body = json.dumps(jsonable_encoder(page)).encode()
+        if cache_key:
+            await response_cache.set(cache_key, body)
+    return body
+
+
 @app.get("/api/quotes")
 async def get_quotes(
-    limit: int = 50,
-    offset: int = 0
+    request: Request,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    count: Literal["estimate", "exact", "none"] = "estimate"
 ):
     """
     Retrieve scraped quotes from database
     
     Args:
         limit: Number of quotes to return (default: 50)
-        offset: Offset for pagination (default: 0)
+        offset: Offset for pagination (default: 0), ignored when cursor is set
+        cursor: Opaque next_cursor from a previous page for keyset pagination
+        count: How to compute total: cached planner estimate, cached exact
+            COUNT(*), or none (default: estimate)
         
     Returns:
-        List of scraped quotes
+        List of scraped quotes and the cursor of the next page; responses
+        are cached per query and carry an ETag for conditional requests
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get total count
-        cursor.execute("SELECT COUNT(*) as total FROM quotes")
-        total = cursor.fetchone()['total']
-        
-        # Get quotes with pagination
-        cursor.execute("""
-            SELECT id, title, link, scraped_at
-            FROM quotes
-            ORDER BY scraped_at DESC
-            LIMIT %s OFFSET %s
-        """, (limit, offset))
-        
-        quotes = cursor.fetchall()
-        
-        cursor.close()
-        
-        return {
-            "total": total,
-            "limit": limit,
-            "offset": offset,
-            "quotes": quotes
-        }
+        position = decode_cursor(cursor) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # ETag and cache key are derived from the data generation, so a repeat
+    # poll with a matching If-None-Match costs no database work at all
+    generation = await response_cache.generation()
+    params = {"limit": limit, "offset": offset, "cursor": cursor, "count": count}
+    cache_key = None
+    etag = None
+    if generation is not None:
+        cache_key = response_cache.key("quotes", params, generation)
+        etag = f'W/"{cache_key.rsplit(":", 1)[-1]}-{generation}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+    try:
+        flight_key = cache_key or json.dumps(params, sort_keys=True)
+        body = await quotes_flight.do(flight_key, load_quotes_body, cache_key, limit, offset, position, count)
+
+        headers = {"Cache-Control": "no-cache"}
+        if etag:
+            headers["ETag"] = etag
+        return Response(content=body, media_type="application/json", headers=headers)
         
+    except PoolTimeout as e:
+        logger.error(f"Error fetching quotes: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching quotes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/quotes/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    mode: Literal["text", "fuzzy", "substring"] = "text",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """
+    Search quote text and author links
+
+    Args:
+        q: Search terms; in text mode quoted phrases, OR and -exclusions work
+        mode: text (full-text, ranked), fuzzy (trigram similarity, ranked,
+            tolerates typos) or substring (case-insensitive, newest first)
+        limit: Number of results to return (default: 20)
+        cursor: Opaque next_cursor from a previous page
+
+    Returns:
+        Matching quotes with their rank, whether results are ranked (broad
+        queries are returned newest first instead), the planner's estimate
+        of the number of matches on the first page, and the next cursor
+    """
+    try:
+        position = decode_search_cursor(cursor) if cursor else None
+        q = normalize_query(q, mode)
+    except (InvalidCursor, SearchQueryError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        result = await db_pool.run(search_quotes, q, mode, limit, position)
+    except psycopg2.errors.QueryCanceled:
+        raise HTTPException(status_code=503, detail="Search took too long, try a more specific query")
+    except PoolTimeout as e:
+        logger.error(f"Error searching quotes: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching quotes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    next_position = result['next_position']
+    return {
+        "query": q,
+        "mode": mode,
+        "ranked": result['ranked'],
+        "estimated_matches": result['estimated_matches'],
+        "limit": limit,
+        "next_cursor": encode_search_cursor(*next_position) if next_position else None,
+        "quotes": result['quotes']
+    }
+
+
+@app.get("/api/quotes/export")
+async def export_quotes(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Stream all scraped quotes as NDJSON or CSV
+    
+    Rows are read from a server-side cursor in fixed-size batches, so memory
+    use does not depend on the number of rows exported. The body is gzipped
+    when the client sends ``Accept-Encoding: gzip``.
+    
+    Args:
+        format: Output format, ndjson or csv (default: ndjson)
+        since: Only export quotes scraped at or after this time
+        until: Only export quotes scraped before this time
         
-    finally:
-        if conn:
-            conn.close()
+    Returns:
+        Streaming response with one record per quote
+    """
+    conditions = []
+    params = []
+    if since:
+        conditions.append("scraped_at >= %s")
+        params.append(since)
+    if until:
+        conditions.append("scraped_at < %s")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    batches = db_pool.stream(f"""
+        SELECT {', '.join(EXPORT_COLUMNS)}
+        FROM quotes
+        {where}
+        ORDER BY scraped_at, id
+    """, params, batch_size=EXPORT_BATCH_SIZE)
+
+    # Run the query before sending headers so failures still map to a status code
+    try:
+        first = await run_in_threadpool(next, batches, None)
+    except PoolTimeout as e:
+        logger.error(f"Error exporting quotes: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error exporting quotes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    rows = itertools.chain([first] if first else [], batches)
+    if format == "csv":
+        chunks = csv_chunks(rows)
+        media_type = "text/csv"
+    else:
+        chunks = ndjson_chunks(rows)
+        media_type = "application/x-ndjson"
+
+    headers = {"Content-Disposition": f'attachment; filename="quotes.{format}"'}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+RUN_COLUMNS = """
+    id, spider, task_id, status, finish_reason, started_at, finished_at, duration_seconds,
+    items_scraped, items_inserted, items_duplicate, items_dropped, pages, bytes, errors, download_errors,
+    items_scraped / NULLIF(duration_seconds, 0) AS items_per_sec,
+    pages / NULLIF(duration_seconds, 0) AS pages_per_sec
+"""
+
+
+@app.get("/api/runs")
+async def get_runs(
+    spider: Optional[str] = None,
+    status: Optional[Literal["running", "finished", "failed"]] = None,
+    limit: int = Query(50, ge=1, le=500),
+    before_id: Optional[int] = None
+):
+    """
+    List recorded crawl runs, newest first
+
+    Args:
+        spider: Only runs of this spider
+        status: Only runs in this state
+        limit: Number of runs to return (default: 50)
+        before_id: Only runs older than this run id, for paging
+
+    Returns:
+        Runs with their item, page and error counts and throughput; pass
+        the returned next_before_id to get the next page
+    """
+    conditions = []
+    params = []
+    if spider:
+        conditions.append("spider = %s")
+        params.append(spider)
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    if before_id:
+        conditions.append("id < %s")
+        params.append(before_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    try:
+        runs = await db_pool.fetch_all(f"""
+            SELECT {RUN_COLUMNS}
+            FROM crawl_runs
+            {where}
+            ORDER BY id DESC
+            LIMIT %s
+        """, params + [limit])
+    except PoolTimeout as e:
+        logger.error(f"Error fetching crawl runs: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching crawl runs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "runs": runs,
+        "next_before_id": runs[-1]['id'] if len(runs) == limit else None
+    }
+
+
+@app.get("/api/runs/trends")
+async def get_run_trends(
+    spider: Optional[str] = None,
+    bucket: Literal["run", "hour", "day", "week"] = "day",
+    days: int = Query(30, ge=1, le=365)
+):
+    """
+    Throughput of finished runs over time
+
+    Args:
+        spider: Only runs of this spider
+        bucket: Group runs by hour, day or week, or list each run (default: day)
+        days: How far back to look (default: 30)
+
+    Returns:
+        One point per bucket with run count, median and average items/sec
+        and pages/sec, duration and error totals, oldest first
+    """
+    conditions = ["status = 'finished'", "started_at >= (NOW() AT TIME ZONE 'UTC') - make_interval(days => %s)"]
+    params = [days]
+    if spider:
+        conditions.append("spider = %s")
+        params.append(spider)
+    where = " AND ".join(conditions)
+
+    if bucket == "run":
+        query = f"""
+            SELECT {RUN_COLUMNS}
+            FROM crawl_runs
+            WHERE {where}
+            ORDER BY started_at
+        """
+    else:
+        query = f"""
+            SELECT date_trunc(%s, started_at) AS bucket,
+                   COUNT(*) AS runs,
+                   percentile_cont(0.5) WITHIN GROUP (
+                       ORDER BY items_scraped / NULLIF(duration_seconds, 0)) AS items_per_sec_p50,
+                   AVG(items_scraped / NULLIF(duration_seconds, 0)) AS items_per_sec_avg,
+                   percentile_cont(0.5) WITHIN GROUP (
+                       ORDER BY pages / NULLIF(duration_seconds, 0)) AS pages_per_sec_p50,
+                   AVG(duration_seconds) AS duration_seconds_avg,
+                   SUM(items_inserted) AS items_inserted,
+                   SUM(items_duplicate) AS items_duplicate,
+                   SUM(errors) AS errors
+            FROM crawl_runs
+            WHERE {where}
+            GROUP BY 1
+            ORDER BY 1
+        """
+        params = [bucket] + params
+
+    try:
+        points = await db_pool.fetch_all(query, params)
+    except PoolTimeout as e:
+        logger.error(f"Error fetching run trends: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching run trends: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"spider": spider, "bucket": bucket, "days": days, "points": points}
+
+
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: int):
+    """
+    One crawl run with its full stats dump
+
+    Args:
+        run_id: Crawl run id (see /api/runs)
+
+    Returns:
+        The run's summary columns, throughput, stats and the number of
+        quotes it inserted
+    """
+    try:
+        run = await db_pool.fetch_one(f"""
+            SELECT {RUN_COLUMNS}, stats,
+                   (SELECT COUNT(*) FROM quotes WHERE quotes.run_id = crawl_runs.id) AS quotes
+            FROM crawl_runs
+            WHERE id = %s
+        """, (run_id,))
+    except PoolTimeout as e:
+        logger.error(f"Error fetching crawl run: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching crawl run: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Crawl run {run_id} not found")
+    return run
+
+
+@app.get("/api/db/pool")
+async def get_pool_metrics():
+    """Connection pool usage and acquire latency"""
+    return db_pool.metrics()
+
+
+@app.get("/api/cache")
+async def get_cache_metrics():
+    """Response cache hit counters, current data generation and request coalescing"""
+    return {
+        **response_cache.metrics(),
+        "coalescing": {flight.name: flight.metrics() for flight in (quotes_flight, task_flight)}
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics: request latency per route, database timings,
+    Celery queue depth and task durations, pipeline throughput
+    """
+    # Collectors read from Redis, so render off the event loop
+    body = await run_in_threadpool(render)
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
-        # Check database connection
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-        conn.close()
+        # Check database connection and the schema version init_db applied
+        schema_version = await db_pool.run(migrations.schema_version)
         
         return {
             "status": "healthy",
-            "database": "connected"
+            "database": "connected",
+            "schema_version": schema_version,
+            "schema_current": schema_version >= migrations.SCHEMA_VERSION,
+            "pool": db_pool.metrics()
         }
         
     except Exception as e:
@@ -197,7 +759,8 @@ async def health_check():
             status_code=503,
             content={
                 "status": "unhealthy",
-                "error": str(e)
+                "error": str(e),
+                "pool": db_pool.metrics()
             }
         )
 
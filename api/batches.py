@@ -0,0 +1,128 @@
+import redis.asyncio as aioredis
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Batch progress hashes expire this long after the batch was submitted
+BATCH_TTL = int(os.getenv('BATCH_TTL', 7 * 24 * 3600))
+
+
+def batch_key(batch_id):
+    """Redis hash holding a batch's counters, written by run_spider"""
+    return f'crawl:batch:{batch_id}'
+
+
+def record_job_started(client, batch_id):
+    """
+    Count a batch job as running; called by the worker when the task starts
+    """
+    key = batch_key(batch_id)
+    pipe = client.pipeline(transaction=False)
+    pipe.hincrby(key, 'started', 1)
+    pipe.hsetnx(key, 'first_started_at', time.time())
+    pipe.execute()
+
+
+def record_job_finished(client, batch_id, result):
+    """
+    Add a finished run_spider result to its batch's counters
+    """
+    key = batch_key(batch_id)
+    stats = result.get('stats') or {}
+    pipe = client.pipeline(transaction=False)
+    pipe.hincrby(key, 'completed' if result.get('status') == 'completed' else 'failed', 1)
+    pipe.hincrby(key, 'items', stats.get('item_scraped_count', 0))
+    pipe.hincrby(key, 'pages', stats.get('response_received_count', 0))
+    pipe.hincrbyfloat(key, 'job_seconds', result.get('duration_seconds') or 0)
+    pipe.hset(key, 'last_finished_at', time.time())
+    pipe.execute()
+
+
+def batch_summary(batch_id, fields, now=None):
+    """
+    Aggregate progress and throughput from a batch hash
+
+    Throughput is measured over the batch's wall-clock span, from the
+    first job starting to the last one finishing (or now, while running),
+    and counts the items and pages of finished jobs.
+    """
+    now = now or time.time()
+    total = int(fields.get('total', 0))
+    started = int(fields.get('started', 0))
+    completed = int(fields.get('completed', 0))
+    failed = int(fields.get('failed', 0))
+    finished = completed + failed
+    items = int(fields.get('items', 0))
+    pages = int(fields.get('pages', 0))
+
+    first_started = float(fields['first_started_at']) if 'first_started_at' in fields else None
+    if finished >= total:
+        status = 'finished'
+        end = float(fields.get('last_finished_at', now))
+    else:
+        status = 'running' if started else 'queued'
+        end = now
+    elapsed = max(end - first_started, 0.0) if first_started else 0.0
+
+    return {
+        'batch_id': batch_id,
+        'status': status,
+        'total': total,
+        'queued': max(total - started, 0),
+        'running': max(started - finished, 0),
+        'completed': completed,
+        'failed': failed,
+        'progress': round(finished / total, 4) if total else 1.0,
+        'items': items,
+        'pages': pages,
+        'elapsed_seconds': round(elapsed, 3),
+        'job_seconds': round(float(fields.get('job_seconds', 0)), 3),
+        'items_per_sec': round(items / elapsed, 3) if elapsed else None,
+        'pages_per_sec': round(pages / elapsed, 3) if elapsed else None,
+        'created_at': float(fields.get('created_at', 0)) or None,
+        'jobs': json.loads(fields.get('jobs', '[]')),
+    }
+
+
+class BatchStore:
+    """
+    Progress of spider batches submitted through /api/scrape/batch
+
+    Each batch is one Redis hash: the API writes the job list and total
+    when the batch is submitted and the worker increments counters as
+    jobs start and finish, so reading progress is a single HGETALL no
+    matter how many jobs the batch has.
+    """
+
+    def __init__(self, redis_url, ttl=BATCH_TTL):
+        self.redis = aioredis.Redis.from_url(redis_url)
+        self.ttl = ttl
+
+    async def create(self, batch_id, jobs):
+        """
+        Register a batch before its tasks are queued
+        """
+        key = batch_key(batch_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(key, mapping={
+            'total': len(jobs),
+            'created_at': time.time(),
+            'jobs': json.dumps(jobs),
+        })
+        pipe.expire(key, self.ttl)
+        await pipe.execute()
+
+    async def get(self, batch_id):
+        """
+        Batch summary, or None if the batch is unknown or expired
+        """
+        fields = await self.redis.hgetall(batch_key(batch_id))
+        if not fields:
+            return None
+        return batch_summary(batch_id, {key.decode(): value.decode() for key, value in fields.items()})
+
+    async def close(self):
+        await self.redis.aclose()
@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import redis.asyncio as aioredis
+import hashlib
+import json
+import threading
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bumped by the scraper's PostgresPipeline whenever a flush inserts new rows
+GENERATION_KEY = os.getenv('CACHE_GENERATION_KEY', 'quotes:generation')
+
+
+def redis_url_from_env():
+    return os.getenv(
+        'REDIS_URL',
+        f"redis://{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', 6379)}/0"
+    )
+
+
+class LocalLRU:
+    """
+    Small in-process LRU with per-entry expiry
+    """
+
+    def __init__(self, max_size=256, ttl=5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class ResponseCache:
+    """
+    Read-through response cache: in-process LRU in front of Redis
+
+    Keys embed the current data generation, which the scraper bumps after
+    writing new rows, so stale entries are never read and simply expire.
+    The generation is itself cached locally for ``generation_ttl`` seconds
+    to keep Redis off the hot path. Redis errors disable caching for the
+    request instead of failing it.
+    """
+
+    def __init__(self, redis_url, ttl=60, local_size=256, local_ttl=5.0, generation_ttl=1.0):
+        self.redis = aioredis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.ttl = ttl
+        self.local = LocalLRU(local_size, min(local_ttl, ttl))
+        self.generation_ttl = generation_ttl
+        self._generation = None
+        self._generation_checked = 0.0
+
+        # Metrics
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            redis_url=redis_url_from_env(),
+            ttl=int(os.getenv('CACHE_TTL', 60)),
+            local_size=int(os.getenv('CACHE_LOCAL_SIZE', 256)),
+            local_ttl=float(os.getenv('CACHE_LOCAL_TTL', 5)),
+            generation_ttl=float(os.getenv('CACHE_GENERATION_TTL', 1))
+        )
+
+    async def generation(self):
+        """
+        Current data generation, or None when Redis is unavailable
+        """
+        now = time.monotonic()
+        if now - self._generation_checked < self.generation_ttl:
+            return self._generation
+        try:
+            value = await self.redis.get(GENERATION_KEY)
+            self._generation = value.decode() if value else '0'
+        except Exception as e:
+            logger.warning(f"Cache generation lookup failed: {e}")
+            self._generation = None
+        self._generation_checked = now
+        return self._generation
+
+    @staticmethod
+    def key(namespace, params, generation):
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f"cache:{namespace}:{generation}:{digest[:20]}"
+
+    async def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self.hits_local += 1
+            return value
+        try:
+            value = await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"Cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits_redis += 1
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key, value):
+        self.local.set(key, value)
+        try:
+            await self.redis.set(key, value, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Cache write failed: {e}")
+
+    async def close(self):
+        await self.redis.aclose()
+
+    def metrics(self):
+        return {
+            'generation': self._generation,
+            'hits_local': self.hits_local,
+            'hits_redis': self.hits_redis,
+            'misses': self.misses
+        }
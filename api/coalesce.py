@@ -0,0 +1,58 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one
+
+    The first caller for a key runs the call; callers arriving while it is
+    in flight await the same result (or exception) instead of issuing their
+    own. Nothing is cached: once the call completes the next caller starts
+    a new one. A caller that disconnects does not cancel the shared call.
+    With ``enabled`` false every caller runs its own call, which is useful
+    to measure what coalescing saves.
+    """
+
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self._calls = {}
+
+        # Metrics
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Await ``func(*args, **kwargs)``, sharing the call with other
+        callers using the same ``key``
+        """
+        if not self.enabled:
+            self.calls += 1
+            return await func(*args, **kwargs)
+        call = self._calls.get(key)
+        if call is None:
+            self.calls += 1
+            call = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(call)
+
+    def _finished(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the exception retrieved even if every caller went away
+        if not call.cancelled():
+            call.exception()
+
+    def metrics(self):
+        return {
+            'in_flight': len(self._calls),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+        }
@@ -0,0 +1,178 @@
+from collections import deque
+from datetime import datetime
+import threading
+import queue
+import time
+import sys
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCRAPY_REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Logging handler that keeps only the last ``capacity`` formatted records
+    """
+
+    def __init__(self, capacity=200):
+        super().__init__()
+        self.lines = deque(maxlen=capacity)
+
+    def emit(self, record):
+        try:
+            self.lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def tail(self, chars=500):
+        return '\n'.join(self.lines)[-chars:]
+
+
+def serialize_stats(stats):
+    """
+    Make a Scrapy stats dict JSON-serializable for the Celery result backend
+    """
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in stats.items()
+        if isinstance(value, (int, float, str, datetime))
+    }
+
+
+class InProcessCrawlRunner:
+    """
+    Long-lived Scrapy CrawlerRunner shared by all tasks in a worker process
+
+    The Twisted reactor can only be started once per process, so it runs in
+    a daemon thread for the life of the worker and every task schedules its
+    crawl onto it. Scrapy, the project settings and the spider loader are
+    initialised once, so a task only pays for building a Crawler.
+    """
+
+    def __init__(self, project_dir='/scraper'):
+        self.project_dir = project_dir
+        self.runner = None
+        self.reactor = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._startup_error = None
+
+    def start(self, timeout=60):
+        """
+        Import Scrapy and start the reactor thread; safe to call repeatedly
+        """
+        with self._lock:
+            if self._thread is None:
+                if self.project_dir not in sys.path:
+                    sys.path.insert(0, self.project_dir)
+                os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'scraper.settings')
+                self._thread = threading.Thread(target=self._run_reactor, name='scrapy-reactor', daemon=True)
+                self._thread.start()
+
+        if not self._ready.wait(timeout):
+            raise RuntimeError("Scrapy reactor did not start in time")
+        if self._startup_error:
+            raise RuntimeError(f"Scrapy reactor failed to start: {self._startup_error}")
+
+    def _run_reactor(self):
+        try:
+            from scrapy.utils.reactor import install_reactor
+            install_reactor(SCRAPY_REACTOR)
+
+            from twisted.internet import reactor
+            from scrapy.crawler import CrawlerRunner
+            from scrapy.utils.project import get_project_settings
+
+            self.reactor = reactor
+            self.runner = CrawlerRunner(get_project_settings())
+            reactor.callWhenRunning(self._ready.set)
+            logger.info("Scrapy reactor started for in-process crawls")
+            reactor.run(installSignalHandlers=False)
+        except Exception as e:
+            self._startup_error = e
+            self._ready.set()
+            logger.error(f"Scrapy reactor failed: {e}")
+
+    def crawl(self, spider_name, timeout=3600, log_path=None, settings=None, spider_args=None):
+        """
+        Run one crawl on the shared reactor and block until it finishes
+
+        Returns a dict with the crawl stats, the tail of its log and the
+        startup overhead (time from the call until the spider opened).
+        """
+        requested = time.monotonic()
+        self.start()
+
+        from scrapy import signals
+        from scrapy.crawler import Crawler
+
+        opened = {}
+        done = queue.Queue()
+        crawler_ref = {}
+
+        ring = RingBufferHandler()
+        handlers = [ring]
+        if log_path:
+            handlers.append(logging.FileHandler(log_path))
+        formatter = logging.Formatter(self.runner.settings.get('LOG_FORMAT'))
+        root = logging.getLogger()
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            handler.setLevel(self.runner.settings.get('LOG_LEVEL'))
+            root.addHandler(handler)
+
+        def on_opened(spider):
+            opened['at'] = time.monotonic()
+
+        def schedule():
+            try:
+                crawl_settings = self.runner.settings.copy()
+                crawl_settings.update(settings or {}, priority='cmdline')
+                spidercls = self.runner.spider_loader.load(spider_name)
+                crawler = Crawler(spidercls, crawl_settings)
+            except Exception as e:
+                done.put((False, str(e)))
+                return
+            crawler.signals.connect(on_opened, signal=signals.spider_opened)
+            crawler_ref['crawler'] = crawler
+            d = self.runner.crawl(crawler, **(spider_args or {}))
+            d.addCallbacks(
+                lambda _: done.put((True, crawler.stats.get_stats())),
+                lambda failure: done.put((False, failure.getErrorMessage()))
+            )
+
+        try:
+            self.reactor.callFromThread(schedule)
+            try:
+                ok, payload = done.get(timeout=timeout)
+                timed_out = False
+            except queue.Empty:
+                timed_out = True
+                crawler = crawler_ref.get('crawler')
+                if crawler:
+                    self.reactor.callFromThread(crawler.stop)
+                try:
+                    ok, payload = done.get(timeout=60)
+                except queue.Empty:
+                    ok, payload = False, 'Crawl did not stop after timeout'
+        finally:
+            for handler in handlers:
+                root.removeHandler(handler)
+                handler.close()
+
+        return {
+            'ok': ok and not timed_out,
+            'timed_out': timed_out,
+            'stats': serialize_stats(payload) if ok else {},
+            'error': None if ok else payload,
+            'log_tail': ring.tail(),
+            'startup_seconds': round(opened['at'] - requested, 3) if 'at' in opened else None
+        }
+
+
+# One runner per worker process, started by the worker_process_init signal
+crawl_runner = InProcessCrawlRunner(os.getenv('SCRAPY_PROJECT_DIR', '/scraper'))
@@ -0,0 +1,199 @@
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from starlette.concurrency import run_in_threadpool
+from contextlib import contextmanager
+from api.metrics import DB_ACQUIRE_DURATION, DB_QUERY_DURATION
+import psycopg2
+import threading
+import uuid
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no database connection frees up within the acquire timeout"""
+
+
+class DatabasePool:
+    """
+    Bounded psycopg2 connection pool shared by all API requests
+
+    Queries are executed in Starlette's threadpool so handlers never block
+    the event loop. A semaphore caps concurrent checkouts at ``max_size``
+    and makes callers wait up to ``acquire_timeout`` seconds for a free
+    connection before failing with PoolTimeout.
+    """
+
+    def __init__(self, db_config, min_size=1, max_size=10, acquire_timeout=5.0):
+        self.db_config = db_config
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.acquire_timeout = acquire_timeout
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.acquire_time_total = 0.0
+        self.acquire_time_max = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            db_config={
+                'host': os.getenv('POSTGRES_HOST', 'postgres'),
+                'port': int(os.getenv('POSTGRES_PORT', 5432)),
+                'database': os.getenv('POSTGRES_DB', 'scraperdb'),
+                'user': os.getenv('POSTGRES_USER', 'scraperuser'),
+                'password': os.getenv('POSTGRES_PASSWORD', 'scraperpass123')
+            },
+            min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            acquire_timeout=float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', 5))
+        )
+
+    def open(self):
+        """
+        Open the minimum number of connections; failures are retried lazily
+        """
+        try:
+            self._get_pool()
+            logger.info(f"Database pool opened (min={self.min_size}, max={self.max_size})")
+        except psycopg2.Error as e:
+            logger.warning(f"Database pool not ready at startup: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+        logger.info("Database pool closed")
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(self.min_size, self.max_size, **self.db_config)
+            return self._pool
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection, waiting up to the acquire timeout for a free slot
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.acquire_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.timeouts += 1
+
+        if not acquired:
+            raise PoolTimeout(f"No database connection available after {self.acquire_timeout}s")
+
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        elapsed = time.perf_counter() - started
+        DB_ACQUIRE_DURATION.observe(elapsed)
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.acquire_time_total += elapsed
+            self.acquire_time_max = max(self.acquire_time_max, elapsed)
+
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            try:
+                if not broken and not conn.closed:
+                    # End the read transaction so the connection goes back idle
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            pool.putconn(conn, close=broken or bool(conn.closed))
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def _call(self, operation, func, *args, **kwargs):
+        with self.connection() as conn:
+            started = time.perf_counter()
+            try:
+                return func(conn, *args, **kwargs)
+            finally:
+                DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run ``func(conn, *args, **kwargs)`` on a pooled connection in the threadpool
+        """
+        return await run_in_threadpool(self._call, 'run', func, *args, **kwargs)
+
+    async def fetch_all(self, query, params=None):
+        def execute(conn):
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+        return await run_in_threadpool(self._call, 'fetch_all', execute)
+
+    async def fetch_one(self, query, params=None):
+        def execute(conn):
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchone()
+        return await run_in_threadpool(self._call, 'fetch_one', execute)
+
+    def stream(self, query, params=None, batch_size=2000):
+        """
+        Yield lists of row tuples from a server-side cursor
+
+        Only ``batch_size`` rows are held in memory at a time. This is a
+        blocking generator meant to be iterated from the threadpool (e.g. by
+        StreamingResponse); the connection is held until it is exhausted or
+        closed.
+        """
+        with self.connection() as conn:
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                while True:
+                    # Only time the fetches: the consumer decides how long we wait between them
+                    started = time.perf_counter()
+                    rows = cursor.fetchmany(batch_size)
+                    DB_QUERY_DURATION.labels('stream').observe(time.perf_counter() - started)
+                    if not rows:
+                        break
+                    yield rows
+
+    def metrics(self):
+        """
+        Snapshot of pool usage and acquire latency
+        """
+        with self._lock:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'acquire_ms_avg': round(1000 * self.acquire_time_total / self.acquired, 3) if self.acquired else 0.0,
+                'acquire_ms_max': round(1000 * self.acquire_time_max, 3)
+            }
@@ -0,0 +1,54 @@
+from datetime import date, datetime
+import csv
+import io
+import json
+import zlib
+
+# Column order of exported quote rows
+EXPORT_COLUMNS = ('id', 'title', 'link', 'scraped_at')
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def ndjson_chunks(batches, columns=EXPORT_COLUMNS):
+    """
+    Encode batches of row tuples as newline-delimited JSON, one chunk per batch
+    """
+    dumps = json.JSONEncoder(default=_json_default, ensure_ascii=False).encode
+    for rows in batches:
+        yield ''.join(dumps(dict(zip(columns, row))) + '\n' for row in rows).encode()
+
+
+def csv_chunks(batches, columns=EXPORT_COLUMNS):
+    """
+    Encode batches of row tuples as CSV with a header row, one chunk per batch
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(
+            tuple(value.isoformat() if isinstance(value, datetime) else value for value in row)
+            for row in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compress a stream of byte chunks into a single gzip member
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,251 @@
+from prometheus_client import CollectorRegistry, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+import redis
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Shared with the Celery worker and the scraper, which write to these hashes
+TASK_METRICS_KEY = os.getenv('METRICS_TASK_KEY', 'metrics:celery:run_spider')
+PIPELINE_METRICS_KEY = os.getenv('METRICS_PIPELINE_KEY', 'metrics:pipeline')
+
+# Queues run_spider jobs can be routed to; 'celery' also carries everything else
+SPIDER_QUEUES = [name for name in os.getenv('CELERY_SPIDER_QUEUES', 'celery').split(',') if name]
+
+# Broker queues whose depth is exported
+CELERY_QUEUES = [
+    name for name in os.getenv('METRICS_CELERY_QUEUES', ','.join(dict.fromkeys(['celery'] + SPIDER_QUEUES))).split(',')
+    if name
+]
+
+# kombu's Redis transport keeps one list per priority step, named
+# "<queue><sep><priority>" (priority 0 is the bare queue name)
+BROKER_PRIORITY_STEPS = list(range(10))
+BROKER_PRIORITY_SEP = '\x06\x16'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TASK_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+# Metrics owned by the API process. Labels are limited to route templates,
+# methods, status classes and query kinds so the series count stays fixed
+registry = CollectorRegistry()
+
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'HTTP request latency by route',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS, registry=registry
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'api_requests_in_progress', 'HTTP requests being handled', registry=registry
+)
+DB_QUERY_DURATION = Histogram(
+    'api_db_query_duration_seconds', 'Database time per call, connection checkout excluded',
+    ['operation'], buckets=LATENCY_BUCKETS, registry=registry
+)
+DB_ACQUIRE_DURATION = Histogram(
+    'api_db_pool_acquire_seconds', 'Time spent waiting for a pooled database connection',
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+
+
+def status_class(status):
+    return f'{status // 100}xx'
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request
+
+    Requests are labelled with the path template of the route that served
+    them ("/api/task/{task_id}", not the raw path); anything no route
+    matched is counted as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = None
+
+    def route_path(self, scope):
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        if self.routes is None:
+            router = scope.get('router')
+            self.routes = {
+                route.endpoint: route.path
+                for route in getattr(router, 'routes', ()) if hasattr(route, 'endpoint')
+            }
+        return self.routes.get(endpoint, 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            REQUEST_DURATION.labels(
+                scope['method'], self.route_path(scope), status_class(status)
+            ).observe(time.perf_counter() - started)
+
+
+def record_task(redis_client, status, seconds, key=TASK_METRICS_KEY):
+    """
+    Add one run_spider duration to the task histogram kept in Redis
+
+    Called by the Celery worker; each field of the hash is a per-bucket
+    count (``<status>:le:<bound>``), a ``<status>:count`` or a
+    ``<status>:sum``, so workers only ever increment.
+    """
+    bound = next((b for b in TASK_BUCKETS if seconds <= b), '+Inf')
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hincrby(key, f'{status}:le:{bound}', 1)
+    pipe.hincrby(key, f'{status}:count', 1)
+    pipe.hincrbyfloat(key, f'{status}:sum', seconds)
+    pipe.execute()
+
+
+class RedisMetricsCollector:
+    """
+    Metrics kept in Redis by other processes, read at scrape time
+
+    Exports the Celery broker queue depth, run_spider durations written by
+    record_task and the scraper pipeline's row counters. A Redis outage is
+    reported through ``scraper_metrics_redis_up`` instead of failing the
+    scrape.
+    """
+
+    PIPELINE_COUNTERS = {
+        'rows_sent': 'Rows sent to the database by the scraper pipeline',
+        'rows_inserted': 'Rows inserted into quotes',
+        'rows_duplicate': 'Rows skipped by the database as already stored',
+        'rows_failed': 'Rows lost to failed flushes or rejected by the database',
+        'seen_filter_dropped': 'Items dropped as already seen before reaching the database',
+        'flushes': 'Batches written by the scraper pipeline',
+        'flush_errors': 'Batches that failed to write',
+        'flush_seconds': 'Total time spent writing batches',
+    }
+
+    def __init__(self, redis_url, broker_url=None, queues=None):
+        self.redis = self.connect(redis_url)
+        self.broker = self.redis if broker_url in (None, redis_url) else self.connect(broker_url)
+        self.queues = CELERY_QUEUES if queues is None else queues
+
+    @staticmethod
+    def connect(url):
+        return redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def collect(self):
+        up = GaugeMetricFamily('scraper_metrics_redis_up', 'Whether Redis-backed metrics could be read')
+        try:
+            pipe = self.broker.pipeline(transaction=False)
+            for queue in self.queues:
+                for key in priority_lists(queue):
+                    pipe.llen(key)
+            lengths = iter(pipe.execute())
+            depths = [sum(next(lengths) for _ in BROKER_PRIORITY_STEPS) for _ in self.queues]
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hgetall(TASK_METRICS_KEY)
+            pipe.hgetall(PIPELINE_METRICS_KEY)
+            task_fields, pipeline_fields = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not read metrics from Redis: {e}")
+            up.add_metric([], 0)
+            yield up
+            return
+        up.add_metric([], 1)
+        yield up
+
+        depth = GaugeMetricFamily('celery_queue_length', 'Tasks waiting in the broker queue', labels=['queue'])
+        for queue, length in zip(self.queues, depths):
+            depth.add_metric([queue], length)
+        yield depth
+
+        yield self.task_histogram(decode_hash(task_fields))
+
+        pipeline = decode_hash(pipeline_fields)
+        for name, documentation in self.PIPELINE_COUNTERS.items():
+            counter = CounterMetricFamily(f'scraper_pipeline_{name}', documentation)
+            counter.add_metric([], float(pipeline.get(name, 0)))
+            yield counter
+
+    @staticmethod
+    def task_histogram(fields):
+        family = HistogramMetricFamily(
+            'celery_task_duration_seconds', 'run_spider task duration', labels=['task', 'status']
+        )
+        statuses = sorted({field.split(':', 1)[0] for field in fields})
+        for status in statuses:
+            buckets = []
+            cumulative = 0
+            for bound in TASK_BUCKETS + ('+Inf',):
+                cumulative += int(fields.get(f'{status}:le:{bound}', 0))
+                buckets.append((str(bound), cumulative))
+            family.add_metric(['run_spider', status], buckets, float(fields.get(f'{status}:sum', 0)))
+        return family
+
+
+def priority_lists(queue):
+    return [f'{queue}{BROKER_PRIORITY_SEP}{step}' if step else queue for step in BROKER_PRIORITY_STEPS]
+
+
+def decode_hash(fields):
+    return {key.decode(): value.decode() for key, value in fields.items()}
+
+
+class ApiStateCollector:
+    """
+    Connection pool, response cache and request coalescing state, sampled
+    at scrape time
+    """
+
+    def __init__(self, db_pool, response_cache, flights=()):
+        self.db_pool = db_pool
+        self.response_cache = response_cache
+        self.flights = flights
+
+    def collect(self):
+        pool = self.db_pool.metrics()
+        for name in ('in_use', 'waiting', 'max_size'):
+            gauge = GaugeMetricFamily(f'api_db_pool_{name}', f'Database pool {name.replace("_", " ")}')
+            gauge.add_metric([], pool[name])
+            yield gauge
+        timeouts = CounterMetricFamily('api_db_pool_timeouts', 'Connection checkouts that timed out')
+        timeouts.add_metric([], pool['timeouts'])
+        yield timeouts
+
+        cache = self.response_cache.metrics()
+        lookups = CounterMetricFamily('api_cache_lookups', 'Response cache lookups by result', labels=['result'])
+        for result in ('hits_local', 'hits_redis', 'misses'):
+            lookups.add_metric([result], cache[result])
+        yield lookups
+
+        calls = CounterMetricFamily(
+            'api_coalesced_calls', 'Backend calls made (leader) or shared (coalesced) by identical requests',
+            labels=['endpoint', 'role']
+        )
+        for flight in self.flights:
+            flight_metrics = flight.metrics()
+            calls.add_metric([flight.name, 'leader'], flight_metrics['calls'])
+            calls.add_metric([flight.name, 'coalesced'], flight_metrics['coalesced'])
+        yield calls
+
+
+def render():
+    """
+    All metrics in the Prometheus text format
+    """
+    return generate_latest(registry)
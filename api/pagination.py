@@ -0,0 +1,97 @@
+from datetime import datetime
+import base64
+import json
+import threading
+import time
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(scraped_at, row_id):
+    """
+    Encode the (scraped_at, id) keyset position of a row as an opaque token
+    """
+    payload = json.dumps([scraped_at.isoformat(), row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a token produced by encode_cursor back into (scraped_at, id)
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        scraped_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(scraped_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def encode_search_cursor(rank, row_id):
+    """
+    Encode the (rank, id) position of a search result; rank is None when
+    results are ordered by id alone
+    """
+    payload = json.dumps([rank, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    """
+    Decode a token produced by encode_search_cursor back into (rank, id)
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (None if rank is None else float(rank)), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+class CachedCount:
+    """
+    Row count of a table, cached in-process for ``ttl`` seconds
+
+    ``estimate`` reads the planner statistics in pg_class, which costs the
+    same at any table size; ``exact`` runs COUNT(*). A partitioned table
+    has no statistics of its own, so its estimate sums its partitions'.
+    Tables that were never analyzed have no statistics, so their estimate
+    falls back to COUNT(*).
+    """
+
+    def __init__(self, table, ttl=30.0):
+        self.table = table
+        self.ttl = ttl
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, mode='estimate'):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(mode)
+        if cached and now - cached[1] < self.ttl:
+            return cached[0]
+
+        with conn.cursor() as cursor:
+            value = None
+            if mode == 'estimate':
+                cursor.execute("""
+                    SELECT CASE WHEN p.relkind = 'p' THEN (
+                        SELECT SUM(c.reltuples)::bigint
+                        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                        WHERE i.inhparent = p.oid AND c.reltuples >= 0
+                    ) ELSE p.reltuples::bigint END
+                    FROM pg_class p WHERE p.oid = %s::regclass
+                """, (self.table,))
+                row = cursor.fetchone()
+                if row and row[0] is not None and row[0] >= 0:
+                    value = row[0]
+            if value is None:
+                cursor.execute(f"SELECT COUNT(*) FROM {self.table}")
+                value = cursor.fetchone()[0]
+
+        with self._lock:
+            self._values[mode] = (value, now)
+        return value
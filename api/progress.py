@@ -0,0 +1,61 @@
+import redis.asyncio as aioredis
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def progress_key(task_id):
+    """Redis key and channel the scraper's CrawlProgressPublisher writes to"""
+    return f'crawl:progress:{task_id}'
+
+
+class ProgressFeed:
+    """
+    Read live crawl progress snapshots published by the scraper
+    """
+
+    def __init__(self, redis_url, keepalive=15.0):
+        self.redis = aioredis.Redis.from_url(redis_url)
+        self.keepalive = keepalive
+
+    async def latest(self, task_id):
+        """
+        Most recent snapshot for a task, or None if nothing was published
+        """
+        try:
+            value = await self.redis.get(progress_key(task_id))
+        except Exception as e:
+            logger.warning(f"Progress lookup failed: {e}")
+            return None
+        return json.loads(value) if value else None
+
+    async def events(self, task_id, request):
+        """
+        Yield Server-Sent Events with each new snapshot until the crawl finishes
+        """
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(progress_key(task_id))
+        try:
+            # Send the current state first so clients do not wait a full interval
+            latest = await self.latest(task_id)
+            if latest:
+                yield f"data: {json.dumps(latest)}\n\n"
+                if latest.get('finished'):
+                    return
+
+            while not await request.is_disconnected():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=self.keepalive)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                data = message['data'].decode()
+                yield f"data: {data}\n\n"
+                if json.loads(data).get('finished'):
+                    return
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    async def close(self):
+        await self.redis.aclose()
@@ -0,0 +1,140 @@
+from psycopg2.extras import RealDictCursor
+import json
+import os
+
+# Ranking means scoring and sorting every match; above this many estimated
+# matches results are returned newest first instead
+SEARCH_MAX_RANKED_ROWS = int(os.getenv('SEARCH_MAX_RANKED_ROWS', 20000))
+SEARCH_STATEMENT_TIMEOUT_MS = int(os.getenv('SEARCH_STATEMENT_TIMEOUT_MS', 3000))
+
+# Trigram indexes cannot serve patterns shorter than one trigram
+MIN_TRIGRAM_QUERY = 3
+
+# Full-text queries are matched against the english-stemmed quote text and
+# the unstemmed words of the author link (see search_vector in scraper.migrations)
+TEXT_QUERY = "(websearch_to_tsquery('english', %(q)s) || websearch_to_tsquery('simple', %(q)s))"
+
+MATCHES = {
+    'text': (
+        f"search_vector @@ {TEXT_QUERY}",
+        f"ts_rank_cd(search_vector, {TEXT_QUERY})::float8"
+    ),
+    'fuzzy': (
+        "(title %%> %(q)s OR link %%> %(q)s)",
+        "GREATEST(word_similarity(%(q)s, title), word_similarity(%(q)s, link))::float8"
+    ),
+    'substring': (
+        "(title ILIKE %(pattern)s OR link ILIKE %(pattern)s)",
+        None
+    ),
+}
+
+
+class SearchQueryError(ValueError):
+    """Raised for search terms the chosen mode cannot use"""
+
+
+def like_pattern(q):
+    escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def normalize_query(q, mode):
+    """
+    Stripped search terms, or SearchQueryError if ``mode`` cannot use them
+    """
+    if mode not in MATCHES:
+        raise SearchQueryError(f"Unknown search mode {mode!r}")
+    q = q.strip()
+    if not q:
+        raise SearchQueryError("Empty search query")
+    if mode != 'text' and len(q) < MIN_TRIGRAM_QUERY:
+        raise SearchQueryError(f"{mode} search needs at least {MIN_TRIGRAM_QUERY} characters")
+    return q
+
+
+def estimate_matches(cursor, where, params):
+    """
+    Planner estimate of the number of matching rows, without running the query
+    """
+    cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT id FROM quotes WHERE {where}", params)
+    plan = cursor.fetchone()
+    plan = plan['QUERY PLAN'] if isinstance(plan, dict) else plan[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def search_quotes(conn, q, mode='text', limit=20, position=None, max_ranked_rows=SEARCH_MAX_RANKED_ROWS):
+    """
+    One page of quotes matching ``q``
+
+    ``text`` is full-text search over the trigger-maintained ``search_vector``
+    column (GIN), ``fuzzy`` is trigram word similarity and ``substring`` a
+    case-insensitive substring match, both served by the pg_trgm GIN
+    indexes on title and link. Ranked modes order by (rank, id) unless the
+    planner expects more than ``max_ranked_rows`` matches, in which case
+    ranking is skipped and the newest matches come first, so a broad
+    query stops after ``limit`` index hits instead of sorting millions of
+    rows. The choice is carried in the cursor so every page of a search
+    uses the same order.
+
+    Args:
+        position: (rank, id) decoded from the previous page's cursor
+
+    Returns:
+        dict: quotes, whether they are ranked, the estimated number of
+        matches (first page only) and the next (rank, id) position or None
+    """
+    q = normalize_query(q, mode)
+    where, rank = MATCHES[mode]
+    params = {'q': q, 'pattern': like_pattern(q), 'limit': limit}
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        # Bound the worst case; the pool rolls back, which resets it
+        cursor.execute("SET LOCAL statement_timeout = %s", (SEARCH_STATEMENT_TIMEOUT_MS,))
+
+        estimated = None
+        if position is None:
+            estimated = estimate_matches(cursor, where, params)
+            ranked = rank is not None and estimated <= max_ranked_rows
+        else:
+            ranked = rank is not None and position[0] is not None
+
+        if ranked:
+            query = f"""
+                SELECT id, title, link, scraped_at, rank
+                FROM (
+                    SELECT id, title, link, scraped_at, {rank} AS rank
+                    FROM quotes
+                    WHERE {where}
+                ) matches
+                {'WHERE (rank, id) < (%(after_rank)s, %(after_id)s)' if position else ''}
+                ORDER BY rank DESC, id DESC
+                LIMIT %(limit)s
+            """
+        else:
+            query = f"""
+                SELECT id, title, link, scraped_at
+                FROM quotes
+                WHERE {where}
+                {'AND id < %(after_id)s' if position else ''}
+                ORDER BY id DESC
+                LIMIT %(limit)s
+            """
+        if position:
+            params['after_rank'], params['after_id'] = position
+        cursor.execute(query, params)
+        quotes = cursor.fetchall()
+
+    next_position = None
+    if len(quotes) == limit:
+        last = quotes[-1]
+        next_position = (last['rank'] if ranked else None, last['id'])
+
+    return {
+        'ranked': ranked,
+        'estimated_matches': estimated,
+        'quotes': quotes,
+        'next_position': next_position
+    }
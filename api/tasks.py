@@ -1,10 +1,37 @@
-from celery import Celery
+from celery import Celery, chord, group
+from celery.schedules import crontab
+from celery.signals import task_postrun, task_prerun, worker_process_init
+from kombu import Queue
+from api.batches import record_job_finished, record_job_started
+from api.cache import redis_url_from_env
+from api.metrics import BROKER_PRIORITY_STEPS, SPIDER_QUEUES, record_task
+import psycopg2
+import redis
 import subprocess
+import time
+import json
+import re
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 'subprocess' starts a fresh `scrapy crawl` per task; 'inprocess' reuses a
+# warm Scrapy runner that lives as long as the worker process
+SPIDER_EXECUTION_MODE = os.getenv('SPIDER_EXECUTION_MODE', 'subprocess')
+SCRAPY_PROJECT_DIR = os.getenv('SCRAPY_PROJECT_DIR', '/scraper')
+SPIDER_LOG_DIR = os.getenv('SPIDER_LOG_DIR', '/tmp/spider-logs')
+SPIDER_TIMEOUT = 3600  # 1 hour
+
+# Client for the metrics and batch hashes, created on first use in each worker process
+metrics_redis = None
+
+# Priority of tasks queued without one; with the Redis broker 0 runs first
+DEFAULT_PRIORITY = 5
+
+# Logged by ScraperSpiderMiddleware when the spider opens
+STARTUP_MARKER = re.compile(r'Startup overhead: ([\d.]+)s')
+
 # Initialize Celery
 celery_app = Celery(
     'scraper_tasks',
@@ -19,58 +46,198 @@ celery_app.conf.update(
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
-    task_time_limit=3600,  # 1 hour
+    task_time_limit=SPIDER_TIMEOUT,
     worker_prefetch_multiplier=1,
+    # Recycle pool processes now and then so a long-lived reactor cannot leak forever
+    worker_max_tasks_per_child=int(os.getenv('CELERY_MAX_TASKS_PER_CHILD', 50)),
+    # Workers consume every spider queue unless started with -Q
+    task_queues=[Queue(name) for name in dict.fromkeys(['celery'] + SPIDER_QUEUES)],
+    task_default_priority=DEFAULT_PRIORITY,
+    broker_transport_options={
+        'priority_steps': BROKER_PRIORITY_STEPS,
+        'queue_order_strategy': 'priority',
+    },
+    # Run by `celery beat`; a no-op unless quotes is partitioned
+    beat_schedule={
+        'maintain-quote-partitions': {
+            'task': 'api.tasks.maintain_quote_partitions',
+            'schedule': crontab(minute=15, hour=3),
+        },
+    },
 )
 
 
+@worker_process_init.connect
+def warm_up_crawler(**kwargs):
+    """Import Scrapy and start the reactor as soon as a pool process forks"""
+    if SPIDER_EXECUTION_MODE == 'inprocess':
+        from api.crawl_runner import crawl_runner
+        crawl_runner.start()
+
+
+def read_tail(path, chars=500):
+    """Return the last ``chars`` characters of a log file without reading all of it"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - chars * 4))
+        return f.read().decode('utf-8', errors='replace')[-chars:]
+
+
+def read_startup_overhead(path):
+    """Find the startup overhead reported by the spider near the top of its log"""
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            match = STARTUP_MARKER.search(line)
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def worker_redis():
+    global metrics_redis
+    if metrics_redis is None:
+        metrics_redis = redis.Redis.from_url(redis_url_from_env(), socket_timeout=1, socket_connect_timeout=1)
+    return metrics_redis
+
+
+def publish_task_metrics(status, seconds):
+    """Add this run to the task duration histogram the API exports on /metrics"""
+    try:
+        record_task(worker_redis(), status, seconds)
+    except redis.RedisError as e:
+        logger.warning(f"Could not record task metrics: {e}")
+
+
+def read_stats(path):
+    """Load the stats a subprocess crawl wrote to its STATS_FILE, {} if there are none"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read crawl stats from {path}: {e}")
+        return {}
+
+
+def crawl_in_subprocess(spider_name, log_path, settings, spider_args=None):
+    """
+    Run a spider with `scrapy crawl`, streaming its output to ``log_path``
+
+    The crawl writes its final stats next to the log (StatsFileWriter), so
+    the result carries them like an in-process crawl's.
+    """
+    stats_path = f'{os.path.splitext(log_path)[0]}.stats.json'
+    if os.path.exists(stats_path):
+        os.remove(stats_path)
+    command = ['scrapy', 'crawl', spider_name]
+    for name, value in (spider_args or {}).items():
+        command += ['-a', f'{name}={value}']
+    for name, value in {**settings, 'STATS_FILE': stats_path}.items():
+        command += ['-s', f'{name}={value}']
+
+    with open(log_path, 'w') as log_file:
+        result = subprocess.run(
+            command,
+            cwd=SCRAPY_PROJECT_DIR,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            timeout=SPIDER_TIMEOUT,
+            env={
+                **os.environ,
+                'PYTHONPATH': SCRAPY_PROJECT_DIR,
+                'SCRAPER_TASK_STARTED_AT': str(time.time())
+            }
+        )
+    return {
+        'ok': result.returncode == 0,
+        'return_code': result.returncode,
+        'stats': read_stats(stats_path),
+        'log_tail': read_tail(log_path),
+        'startup_seconds': read_startup_overhead(log_path)
+    }
+
+
+def crawl_in_process(spider_name, log_path, settings, spider_args=None):
+    """
+    Run a spider on this worker's warm CrawlerRunner
+    """
+    from api.crawl_runner import crawl_runner
+    result = crawl_runner.crawl(
+        spider_name, timeout=SPIDER_TIMEOUT, log_path=log_path, settings=settings, spider_args=spider_args
+    )
+    if result['timed_out']:
+        raise subprocess.TimeoutExpired(spider_name, SPIDER_TIMEOUT)
+    return result
+
+
 @celery_app.task(bind=True, name='api.tasks.run_spider')
-def run_spider(self, spider_name):
+def run_spider(self, spider_name, incremental=None, cache_mode=None, spider_args=None, batch_id=None):
     """
-    Celery task to run a Scrapy spider using subprocess
-    
+    Celery task to run a Scrapy spider
+
     Args:
         spider_name: Name of the spider to run
-        
+        incremental: Override INCREMENTAL_CRAWL for this run
+        cache_mode: HTTP cache mode for this run: 'off', 'record' or 'replay'
+        spider_args: Spider arguments (``-a name=value``), e.g. start_urls
+        batch_id: Batch this run belongs to, see submit_batch
+
     Returns:
         dict: Task result with status and stats
     """
+    started = time.monotonic()
     try:
-        logger.info(f"Starting spider: {spider_name}")
-        
+        logger.info(f"Starting spider: {spider_name} ({SPIDER_EXECUTION_MODE})")
+
         # Update task state
         self.update_state(state='PROGRESS', meta={'status': 'Starting spider...'})
-        
-        # Run scrapy spider using subprocess
-        result = subprocess.run(
-            ['scrapy', 'crawl', spider_name],
-            cwd='/scraper',
-            capture_output=True,
-            text=True,
-            timeout=3600,
-            env={**os.environ, 'PYTHONPATH': '/scraper'}
-        )
-        
-        if result.returncode == 0:
+
+        os.makedirs(SPIDER_LOG_DIR, exist_ok=True)
+        log_path = os.path.join(SPIDER_LOG_DIR, f'{self.request.id or spider_name}.log')
+
+        # Lets the spider publish live progress under this task's id
+        settings = {'CRAWL_TASK_ID': self.request.id} if self.request.id else {}
+        if incremental is not None:
+            settings['INCREMENTAL_CRAWL'] = incremental
+        if cache_mode:
+            settings['HTTPCACHE_MODE'] = cache_mode
+
+        if SPIDER_EXECUTION_MODE == 'inprocess':
+            result = crawl_in_process(spider_name, log_path, settings, spider_args)
+        else:
+            result = crawl_in_subprocess(spider_name, log_path, settings, spider_args)
+        duration = round(time.monotonic() - started, 3)
+        publish_task_metrics('completed' if result['ok'] else 'failed', duration)
+
+        if result['ok']:
             logger.info(f"Spider {spider_name} completed successfully")
             return {
                 'status': 'completed',
                 'spider': spider_name,
                 'message': f'Spider {spider_name} finished scraping',
-                'stdout': result.stdout[-500:] if result.stdout else ''  # Last 500 chars
+                'mode': SPIDER_EXECUTION_MODE,
+                'duration_seconds': duration,
+                'startup_seconds': result['startup_seconds'],
+                'run_id': result.get('stats', {}).get('crawl_run_id'),
+                'stats': result.get('stats', {}),
+                'log_file': log_path,
+                'stdout': result['log_tail']
             }
         else:
-            logger.error(f"Spider {spider_name} failed with return code {result.returncode}")
-            logger.error(f"Error output: {result.stderr}")
+            logger.error(f"Spider {spider_name} failed: {result.get('error') or result.get('return_code')}")
             return {
                 'status': 'failed',
                 'spider': spider_name,
-                'error': result.stderr[-500:] if result.stderr else 'Unknown error',
-                'return_code': result.returncode
+                'mode': SPIDER_EXECUTION_MODE,
+                'duration_seconds': duration,
+                'startup_seconds': result['startup_seconds'],
+                'error': result.get('error') or result['log_tail'] or 'Unknown error',
+                'return_code': result.get('return_code'),
+                'log_file': log_path
             }
-        
+
     except subprocess.TimeoutExpired:
         logger.error(f"Spider {spider_name} timed out")
+        publish_task_metrics('timeout', time.monotonic() - started)
         return {
             'status': 'failed',
             'spider': spider_name,
@@ -78,8 +245,114 @@ def run_spider(self, spider_name):
         }
     except Exception as e:
         logger.error(f"Error running spider {spider_name}: {str(e)}")
+        publish_task_metrics('error', time.monotonic() - started)
         return {
             'status': 'failed',
             'spider': spider_name,
             'error': str(e)
-        }
\ No newline at end of file
+        }
+
+
+
+@task_prerun.connect
+def batch_job_started(sender=None, kwargs=None, **extra):
+    batch_id = (kwargs or {}).get('batch_id')
+    if batch_id and sender.name == run_spider.name:
+        try:
+            record_job_started(worker_redis(), batch_id)
+        except redis.RedisError as e:
+            logger.warning(f"Could not update batch {batch_id}: {e}")
+
+
+@task_postrun.connect
+def batch_job_finished(sender=None, kwargs=None, retval=None, **extra):
+    batch_id = (kwargs or {}).get('batch_id')
+    if batch_id and sender.name == run_spider.name:
+        try:
+            record_job_finished(worker_redis(), batch_id, retval if isinstance(retval, dict) else {})
+        except redis.RedisError as e:
+            logger.warning(f"Could not update batch {batch_id}: {e}")
+
+
+@celery_app.task(name='api.tasks.finish_batch')
+def finish_batch(results, batch_id):
+    """
+    Chord callback run once every job of a batch has returned
+
+    Args:
+        results: run_spider results, in submission order
+        batch_id: Batch id, also this task's id
+
+    Returns:
+        dict: Per-job outcome and totals of the batch
+    """
+    jobs = [
+        {
+            'status': result.get('status'),
+            'spider': result.get('spider'),
+            'run_id': result.get('run_id'),
+            'items': (result.get('stats') or {}).get('item_scraped_count'),
+            'error': result.get('error')
+        }
+        for result in results
+    ]
+    completed = sum(1 for job in jobs if job['status'] == 'completed')
+    logger.info(f"Batch {batch_id} finished: {completed}/{len(jobs)} jobs completed")
+    return {
+        'status': 'completed' if completed == len(jobs) else 'failed',
+        'batch_id': batch_id,
+        'completed': completed,
+        'failed': len(jobs) - completed,
+        'jobs': jobs
+    }
+
+
+def submit_batch(batch_id, jobs):
+    """
+    Queue a batch as one chord: a group of run_spider tasks, each on its
+    own queue and priority, followed by finish_batch
+
+    Each job is a dict with spider_name, spider_args, incremental,
+    cache_mode, queue, priority and a pre-generated task_id.
+    """
+    header = group(
+        run_spider.signature(
+            (job['spider_name'],),
+            {
+                'incremental': job['incremental'],
+                'cache_mode': job['cache_mode'],
+                'spider_args': job['spider_args'],
+                'batch_id': batch_id
+            },
+            task_id=job['task_id'],
+            queue=job['queue'],
+            priority=job['priority']
+        )
+        for job in jobs
+    )
+    return chord(header)(finish_batch.s(batch_id).set(task_id=batch_id))
+
+
+@celery_app.task(name='api.tasks.maintain_quote_partitions')
+def maintain_quote_partitions():
+    """
+    Create the coming months' quote partitions and apply the retention policy
+
+    Returns:
+        dict: Partitions created and detached/dropped, or a skipped status
+        when quotes is not partitioned
+    """
+    from scraper import migrations, partitions
+
+    conn = psycopg2.connect(**migrations.db_config_from_env())
+    try:
+        with conn.cursor() as cursor:
+            result = partitions.maintain(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+    if result is None:
+        return {'status': 'skipped', 'reason': 'quotes is not partitioned'}
+    logger.info(f"Quote partitions created: {result['created']}, removed: {result['removed']}")
+    return {'status': 'completed', **result}
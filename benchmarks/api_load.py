@@ -0,0 +1,181 @@
+"""
+Requests/sec and latency of API endpoints under concurrent identical polling
+
+Opens --concurrency keep-alive connections to a running API and has each
+one request the given paths in a loop for --duration seconds, the way many
+dashboard clients poll the same page. Backend calls actually made are read
+from the API's coalescing counters (/api/cache) before and after the run.
+
+To compare without and with request coalescing, run the same load twice
+against a local stack started with API_REQUEST_COALESCING=false, then true:
+
+    python -m benchmarks.api_load --path '/api/quotes?limit=50&offset=0' \\
+        --label before --output before.json
+    python -m benchmarks.api_load --path '/api/quotes?limit=50&offset=0' \\
+        --label after --output after.json --baseline before.json
+
+Only the standard library is used, so the load generator is not the
+bottleneck of a small stack.
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+async def read_response(reader):
+    """
+    Read one HTTP/1.1 response; returns (status, body)
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = b''
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            body += await reader.readexactly(size)
+            await reader.readline()
+    else:
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, body
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\nAccept: application/json\r\n\r\n'.encode())
+        await self.writer.drain()
+        try:
+            return await read_response(self.reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = self.reader = None
+
+
+async def fetch_json(host, port, path):
+    conn = Connection(host, port)
+    try:
+        status, body = await conn.get(path)
+        return json.loads(body) if status == 200 else None
+    except (OSError, ValueError):
+        return None
+    finally:
+        conn.close()
+
+
+async def worker(host, port, paths, deadline, latencies, statuses, offset):
+    conn = Connection(host, port)
+    index = offset
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            status, _ = await conn.get(path)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            status = 'error'
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+    conn.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def backend_calls(cache_metrics):
+    coalescing = (cache_metrics or {}).get('coalescing', {})
+    return {name: flight.get('calls', 0) for name, flight in coalescing.items()}
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+
+    before = backend_calls(await fetch_json(host, port, '/api/cache'))
+    latencies = []
+    statuses = {}
+    deadline = time.monotonic() + args.duration
+    started = time.monotonic()
+    await asyncio.gather(*(
+        worker(host, port, args.path, deadline, latencies, statuses, i) for i in range(args.concurrency)
+    ))
+    elapsed = time.monotonic() - started
+    after = backend_calls(await fetch_json(host, port, '/api/cache'))
+
+    requests = len(latencies)
+    return {
+        'label': args.label,
+        'requests': requests,
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(requests / elapsed, 1),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            'p95': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            'p99': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        },
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'backend_calls': {name: after[name] - before.get(name, 0) for name in after},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='API base URL')
+    parser.add_argument('--path', action='append', help='path to request, repeatable (default: /api/quotes)')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--label', default='run')
+    parser.add_argument('--baseline', help='JSON output of an earlier run to compare against')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    args.path = args.path or ['/api/quotes?limit=50&offset=0']
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['result']
+        ratio = result['requests_per_sec'] / (baseline['requests_per_sec'] or 1)
+        print(f"{'':>10} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for r in (baseline, result):
+            print(f"{r['label']:>10} {r['requests_per_sec']:>9} {r['latency_ms']['p50']:>8} {r['latency_ms']['p99']:>8}")
+        print(f"{result['label']} / {baseline['label']}: {ratio:.2f}x requests/sec")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'api_load', 'config': vars(args), 'result': result}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
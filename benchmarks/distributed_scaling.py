@@ -0,0 +1,120 @@
+"""
+Pages/sec scaling of one distributed crawl across N worker processes
+
+Starts the local mock site, then for each worker count runs that many
+`scrapy crawl example_spider` processes against it with the Redis
+scheduler enabled, all seeded with the same start URLs. Pages/sec is
+measured from the mock site's own counters, over the window from the
+first to the last page served, so it reflects pages actually served
+rather than what each process believes it fetched, and leaves out process
+start-up and the scheduler's idle grace at the end.
+
+    python -m benchmarks.distributed_scaling --workers 1 2 4 --pages 400 --latency 0.05
+
+Requires a reachable Redis (REDIS_URL, default redis://localhost:6379/0).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import redis
+
+from benchmarks.mock_site import SCRAPY_PROJECT_DIR, site_counters, start_mock_site
+
+
+def crawl_command(start_urls, concurrency, idle_grace):
+    return [
+        sys.executable, '-m', 'scrapy', 'crawl', 'example_spider',
+        '-a', f"start_urls={','.join(start_urls)}",
+        '-s', 'ITEM_PIPELINES={}',
+        '-s', 'EXTENSIONS={}',
+        '-s', 'ROBOTSTXT_OBEY=False',
+        '-s', 'AUTOTHROTTLE_ENABLED=False',
+        '-s', 'DOWNLOAD_DELAY=0',
+        '-s', 'SCHEDULER_DOMAIN_DELAY=0',
+        '-s', f'SCHEDULER_IDLE_GRACE={idle_grace}',
+        '-s', f'CONCURRENT_REQUESTS={concurrency}',
+        '-s', f'CONCURRENT_REQUESTS_PER_DOMAIN={concurrency}',
+        '-s', 'LOG_LEVEL=WARNING',
+    ]
+
+
+def run_workers(count, start_urls, concurrency, idle_grace, redis_url):
+    env = {
+        **os.environ,
+        'PYTHONPATH': SCRAPY_PROJECT_DIR,
+        'DISTRIBUTED_CRAWL': 'true',
+        'REDIS_URL': redis_url,
+    }
+    started = time.monotonic()
+    workers = [
+        subprocess.Popen(crawl_command(start_urls, concurrency, idle_grace), cwd=SCRAPY_PROJECT_DIR, env=env)
+        for _ in range(count)
+    ]
+    codes = [worker.wait() for worker in workers]
+    return time.monotonic() - started, codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--pages', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--concurrency', type=int, default=4, help='CONCURRENT_REQUESTS per worker')
+    parser.add_argument('--idle-grace', type=float, default=2.0, help='SCHEDULER_IDLE_GRACE per worker')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--redis-url', default=os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    server = redis.Redis.from_url(args.redis_url)
+    site = start_mock_site(args.port, args.pages, args.latency)
+    base_url = f'http://127.0.0.1:{args.port}'
+    # Seed every page so the frontier is wide enough to parallelise
+    start_urls = [f'{base_url}/page/{page}/' for page in range(1, args.pages + 1)]
+
+    results = []
+    try:
+        for count in args.workers:
+            for key in server.scan_iter('crawl:example_spider:*'):
+                server.delete(key)
+            site_counters(base_url, reset=True)
+
+            seconds, codes = run_workers(count, start_urls, args.concurrency, args.idle_grace, args.redis_url)
+            counters = site_counters(base_url)
+            pages = counters['pages']
+            serving = counters.get('last_page_at', 0) - counters.get('first_page_at', 0)
+            result = {
+                'workers': count,
+                'pages': pages,
+                'seconds': round(seconds, 3),
+                'serving_seconds': round(serving, 3),
+                'pages_per_sec': round(pages / serving, 2) if serving else 0.0,
+                'exit_codes': codes,
+            }
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    finally:
+        site.terminate()
+        site.wait()
+
+    baseline = results[0]['pages_per_sec'] / results[0]['workers'] if results else 0
+    for result in results:
+        result['speedup'] = round(result['pages_per_sec'] / (baseline or 1), 2)
+        result['efficiency'] = round(result['speedup'] / result['workers'], 2)
+
+    print(f"{'workers':>8} {'pages':>7} {'seconds':>8} {'serving':>8} {'pages/s':>8} {'speedup':>8} {'eff':>5}")
+    for r in results:
+        print(f"{r['workers']:>8} {r['pages']:>7} {r['seconds']:>8} {r['serving_seconds']:>8} {r['pages_per_sec']:>8} "
+              f"{r['speedup']:>8} {r['efficiency']:>5}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'distributed_scaling', 'config': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
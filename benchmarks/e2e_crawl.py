@@ -0,0 +1,321 @@
+"""
+End-to-end crawl throughput: mock site -> Scrapy -> Postgres
+
+Starts the local mock site (--pages, --latency, --error-rate), applies the
+schema migrations, then runs `scrapy crawl example_spider` over every page
+with the project's own middlewares and pipelines writing into Postgres.
+Reports pages/sec, items/sec and DB rows/sec, the crawl's timing
+percentiles per stage (dns, queue_scheduler, download, parse, parse_wall,
+pipeline, ...) and CPU time and peak RSS of each process involved: the
+site, the crawl, and the Postgres server when it runs on this machine.
+The crawl's stats are read back from its crawl_runs row, which is
+completed once the engine has stopped so the timing summary is in it.
+
+Every run serves a fresh set of quotes (--variant) so all its items are
+new rows, and deletes them again afterwards (unless --keep-rows), so runs
+start from the same table size and can be compared across commits:
+
+    python -m benchmarks.e2e_crawl --pages 500 --latency 0.02 --error-rate 0.02 \\
+        --output e2e.json --baseline previous.json
+
+Postgres is configured by the POSTGRES_* variables, like init_db.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import psycopg2
+
+from benchmarks.mock_site import ROOT, SCRAPY_PROJECT_DIR, site_counters, start_mock_site
+
+sys.path.insert(0, SCRAPY_PROJECT_DIR)
+
+from scraper import migrations  # noqa: E402
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1', '')
+
+
+def crawl_command(start_urls, concurrency):
+    return [
+        sys.executable, '-m', 'scrapy', 'crawl', 'example_spider',
+        '-a', f"start_urls={','.join(start_urls)}",
+        '-s', 'ROBOTSTXT_OBEY=False',
+        '-s', 'AUTOTHROTTLE_ENABLED=False',
+        '-s', 'DOWNLOAD_DELAY=0',
+        '-s', 'SCHEDULER_DOMAIN_DELAY=0',
+        '-s', f'CONCURRENT_REQUESTS={concurrency}',
+        '-s', f'CONCURRENT_REQUESTS_PER_DOMAIN={concurrency}',
+        '-s', 'CRAWL_RUNS_ENABLED=True',
+        '-s', 'TIMING_ENABLED=True',
+        '-s', 'INCREMENTAL_CRAWL=False',
+        '-s', 'HTTPCACHE_MODE=off',
+        # No Redis: pipeline metrics and cache invalidation are skipped
+        '-s', 'REDIS_URL=',
+    ]
+
+
+def wait_with_usage(process):
+    """
+    Reap a child process and return its CPU time and peak RSS
+    """
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        'cpu_user_seconds': round(usage.ru_utime, 3),
+        'cpu_system_seconds': round(usage.ru_stime, 3),
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+    }
+
+
+def postgres_pids():
+    pids = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/comm') as f:
+                    if f.read().strip() in ('postgres', 'postmaster'):
+                        pids.append(int(entry))
+            except OSError:
+                pass
+    return pids
+
+
+def process_usage(pid):
+    """
+    (CPU seconds, RSS bytes) of a running process from /proc
+    """
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return cpu, int(fields[21]) * PAGE_SIZE
+
+
+class PostgresSampler:
+    """
+    CPU time and peak total RSS of a local Postgres server's processes
+
+    Backends come and go during a crawl, so CPU is summed per pid over the
+    samples taken; time spent by backends that exit between two samples
+    is missed, which the pipeline's long-lived connections make small.
+    """
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.cpu = {}
+        self.first_cpu = {}
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        cpu = sum(self.cpu[pid] - self.first_cpu[pid] for pid in self.cpu)
+        return {'cpu_seconds': round(cpu, 3), 'peak_rss_mb': round(self.peak_rss / 2 ** 20, 1)}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        rss = 0
+        for pid in postgres_pids():
+            try:
+                cpu, pid_rss = process_usage(pid)
+            except (OSError, IndexError, ValueError):
+                continue
+            self.first_cpu.setdefault(pid, cpu)
+            self.cpu[pid] = cpu
+            rss += pid_rss
+        self.peak_rss = max(self.peak_rss, rss)
+
+
+def database_counters(cursor):
+    cursor.execute("""
+        SELECT xact_commit, tup_inserted, tup_deleted, blks_read, blks_hit
+        FROM pg_stat_database WHERE datname = current_database()
+    """)
+    names = ('commits', 'tuples_inserted', 'tuples_deleted', 'blocks_read', 'blocks_hit')
+    return dict(zip(names, cursor.fetchone()))
+
+
+def timing_summary(stats):
+    """
+    timing/<metric>/<labels...>/<field> stats as {metric: {labels: {field: value}}}
+    """
+    timings = {}
+    for key, value in stats.items():
+        parts = key.split('/')
+        if parts[0] == 'timing' and len(parts) >= 3:
+            labels = '/'.join(parts[2:-1]) or 'all'
+            timings.setdefault(parts[1], {}).setdefault(labels, {})[parts[-1]] = value
+    return timings
+
+
+def delete_run_rows(cursor, run_id):
+    cursor.execute("SELECT to_regclass('quote_keys') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            "DELETE FROM quote_keys WHERE key IN (SELECT quote_key(title, link) FROM quotes WHERE run_id = %s)",
+            (run_id,)
+        )
+    cursor.execute("DELETE FROM quotes WHERE run_id = %s", (run_id,))
+    return cursor.rowcount
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    db_config = migrations.db_config_from_env()
+    if not migrations.wait_for_db(db_config, max_retries=3, delay=1):
+        raise SystemExit('Postgres is not reachable; set POSTGRES_HOST and friends')
+    migrations.migrate(db_config)
+
+    conn = psycopg2.connect(**db_config)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM crawl_runs")
+    last_run_id = cursor.fetchone()[0]
+
+    variant = f' {uuid.uuid4().hex[:8]}'
+    site = start_mock_site(args.port, args.pages, args.latency, args.quotes_per_page,
+                           error_rate=args.error_rate, variant=variant)
+    base_url = f'http://127.0.0.1:{args.port}'
+    start_urls = [f'{base_url}/page/{page}/' for page in range(1, args.pages + 1)]
+    log_path = args.log or os.devnull
+
+    sampler = PostgresSampler() if db_config['host'] in LOCAL_HOSTS and os.path.isdir('/proc') else None
+    before = database_counters(cursor)
+    try:
+        site_counters(base_url, reset=True)
+        if sampler:
+            sampler.start()
+        started = time.monotonic()
+        with open(log_path, 'w') as log_file:
+            crawl = subprocess.Popen(
+                crawl_command(start_urls, args.concurrency),
+                cwd=SCRAPY_PROJECT_DIR,
+                env={**os.environ, 'PYTHONPATH': SCRAPY_PROJECT_DIR, 'DISTRIBUTED_CRAWL': 'false'},
+                stdout=log_file,
+                stderr=subprocess.STDOUT
+            )
+            crawl_usage = wait_with_usage(crawl)
+        seconds = time.monotonic() - started
+        database_usage = sampler.stop() if sampler else None
+        served = site_counters(base_url)
+    finally:
+        site.terminate()
+        site_usage = wait_with_usage(site)
+    after = database_counters(cursor)
+
+    cursor.execute(
+        "SELECT id, stats FROM crawl_runs WHERE id > %s AND spider = 'example_spider' ORDER BY id DESC LIMIT 1",
+        (last_run_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise SystemExit(f'The crawl did not record a run (exit code {crawl.returncode}); see --log')
+    run_id, stats = row
+    stats = stats if isinstance(stats, dict) else json.loads(stats or '{}')
+
+    cursor.execute("SELECT COUNT(*) FROM quotes WHERE run_id = %s", (run_id,))
+    rows_stored = cursor.fetchone()[0]
+    if not args.keep_rows:
+        delete_run_rows(cursor, run_id)
+    conn.close()
+
+    pages = stats.get('response_received_count', 0)
+    items = stats.get('item_scraped_count', 0)
+    timings = timing_summary(stats)
+    if pages and not timings:
+        print(f'Crawl run {run_id} recorded no timing/* stats', file=sys.stderr)
+    rows = stats.get('postgres/rows_inserted', 0)
+    flush_seconds = stats.get('postgres/flush_time_ms', 0) / 1000
+    return {
+        'run_id': run_id,
+        'exit_code': crawl.returncode,
+        'seconds': round(seconds, 3),
+        'pages': pages,
+        'items': items,
+        'rows_inserted': rows,
+        'rows_stored': rows_stored,
+        'pages_per_sec': round(pages / seconds, 2),
+        'items_per_sec': round(items / seconds, 2),
+        'db_rows_per_sec': round(rows / seconds, 2),
+        'errors': {
+            'site_500s': served.get('errors', 0),
+            'retries': stats.get('retry/count', 0),
+            'retries_exhausted': stats.get('retry/max_reached', 0),
+            'log_errors': stats.get('log_count/ERROR', 0),
+        },
+        'stages': {
+            'site': {**site_usage, 'requests': served.get('requests', 0)},
+            'crawl': {
+                **crawl_usage,
+                'startup_seconds': stats.get('startup_overhead_seconds'),
+                'timings_ms': timings,
+            },
+            'database': {
+                **(database_usage or {'cpu_seconds': None, 'peak_rss_mb': None}),
+                'flushes': stats.get('postgres/flushes', 0),
+                'flush_seconds': round(flush_seconds, 3),
+                'rows_per_flush_second': round(rows / flush_seconds, 1) if flush_seconds else None,
+                **{name: after[name] - before[name] for name in after},
+            },
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--quotes-per-page', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the site adds to every page')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of page requests failing with 500')
+    parser.add_argument('--concurrency', type=int, default=16, help='CONCURRENT_REQUESTS for the crawl')
+    parser.add_argument('--port', type=int, default=8997)
+    parser.add_argument('--keep-rows', action='store_true', help='keep the inserted quotes')
+    parser.add_argument('--log', help='write the crawl log to this file')
+    parser.add_argument('--baseline', help='JSON output of an earlier run to compare against')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"{'':>10} {'pages/s':>9} {'items/s':>9} {'rows/s':>9} {'crawl cpu':>10} {'crawl rss':>10}")
+        for label, r in ((baseline.get('commit') or 'baseline', baseline['result']), (git_commit() or 'this', result)):
+            crawl = r['stages']['crawl']
+            cpu = crawl['cpu_user_seconds'] + crawl['cpu_system_seconds']
+            print(f"{label:>10} {r['pages_per_sec']:>9} {r['items_per_sec']:>9} {r['db_rows_per_sec']:>9} "
+                  f"{cpu:>10.2f} {crawl['peak_rss_mb']:>10}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'e2e_crawl', 'commit': git_commit(), 'config': vars(args), 'result': result},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Peak memory and items/sec of QuoteItem vs CompactQuoteItem in a crawl
+
+Each variant runs in its own process: a Scrapy crawl whose single
+callback parses the saved HTML fixtures over and over, yielding --items
+items through the normal spider middleware and item pipeline chain into
+a pipeline that keeps every item (the worst case of a buffering consumer).
+Memory is taken from the MEMUSAGE extension's stats and from the
+process's peak RSS.
+
+    python -m benchmarks.item_memory --items 500000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.mock_site import ROOT, SCRAPY_PROJECT_DIR
+
+VARIANTS = ('legacy', 'compact')
+
+
+def run_variant(variant, count):
+    """
+    Child process: crawl and print one JSON result line
+    """
+    sys.path.insert(0, SCRAPY_PROJECT_DIR)
+
+    import scrapy
+    from itemadapter import is_item
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.http import HtmlResponse
+    from scraper.spiders.example_spider import ExampleSpider
+    from benchmarks.parse_benchmark import legacy_parse, load_fixtures
+
+    pages = load_fixtures(os.path.join(ROOT, 'benchmarks', 'fixtures'))
+    parse = legacy_parse if variant == 'legacy' else ExampleSpider().parse_page
+    kept = []
+
+    class RetainPipeline:
+        def process_item(self, item, spider):
+            kept.append(item)
+            return item
+
+    class ItemMemorySpider(scrapy.Spider):
+        name = 'item_memory'
+        start_urls = ['data:,']
+
+        def parse(self, response):
+            produced = 0
+            while produced < count:
+                for url, body in pages:
+                    for obj in parse(HtmlResponse(url=url, body=body, encoding='utf-8')):
+                        if is_item(obj) and produced < count:
+                            produced += 1
+                            yield obj
+
+    process = CrawlerProcess({
+        'ITEM_PIPELINES': {RetainPipeline: 100},
+        'MEMUSAGE_ENABLED': True,
+        'MEMUSAGE_CHECK_INTERVAL_SECONDS': 0.25,
+        'LOG_LEVEL': 'WARNING',
+        'TELNETCONSOLE_ENABLED': False,
+        'REQUEST_FINGERPRINTER_IMPLEMENTATION': '2.7',
+    })
+    crawler = process.create_crawler(ItemMemorySpider)
+    started = time.perf_counter()
+    process.crawl(crawler)
+    process.start()
+    seconds = time.perf_counter() - started
+
+    stats = crawler.stats.get_stats()
+    startup = stats.get('memusage/startup', 0)
+    peak = max(stats.get('memusage/max', 0), startup)
+    print(json.dumps({
+        'variant': variant,
+        'items': len(kept),
+        'seconds': round(seconds, 3),
+        'items_per_sec': round(len(kept) / seconds, 1),
+        'memusage_startup_mb': round(startup / 2 ** 20, 1),
+        'memusage_max_mb': round(peak / 2 ** 20, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'bytes_per_item': round((peak - startup) / max(len(kept), 1)),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=500000)
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument('--child', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.child:
+        return run_variant(args.child, args.items)
+
+    results = []
+    for variant in args.variants:
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.item_memory', '--child', variant, '--items', str(args.items)],
+            cwd=ROOT,
+            text=True
+        )
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    print(f"{'variant':<8} {'items':>8} {'items/s':>9} {'max MB':>8} {'RSS MB':>8} {'B/item':>7}")
+    for r in results:
+        print(f"{r['variant']:<8} {r['items']:>8} {r['items_per_sec']:>9} {r['memusage_max_mb']:>8} "
+              f"{r['peak_rss_mb']:>8} {r['bytes_per_item']:>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'item_memory', 'config': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+Local quotes.toscrape.com-style site for benchmarks
+
+Serves deterministic, generated quote pages at /page/<n>/ with the same
+markup ExampleSpider parses, so crawls can be measured without touching
+the real site. Per-request latency is configurable and request counters
+are available at /__stats (reset with /__reset). Pages carry an ETag and
+answer a matching If-None-Match with 304, like a well-behaved origin.
+With --capacity, requests beyond that many in flight get a 429 with
+Retry-After, like a rate-limited one. With --error-rate, that fraction of
+page requests fails with a 500 (from a seeded generator, so runs repeat).
+--variant is mixed into every quote to generate a fresh set of items.
+
+    python -m benchmarks.mock_site --port 8999 --pages 200 --latency 0.05
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from html import escape
+from urllib.request import urlopen
+import argparse
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRAPY_PROJECT_DIR = os.path.join(ROOT, 'scraper')
+
+AUTHORS = [
+    'Albert Einstein', 'J.K. Rowling', 'Jane Austen', 'Marilyn Monroe', 'Andre Gide',
+    'Thomas A. Edison', 'Eleanor Roosevelt', 'Steve Martin', 'Bob Marley', 'Dr. Seuss',
+    'Douglas Adams', 'Elie Wiesel', 'Friedrich Nietzsche', 'Mark Twain', 'Allen Saunders',
+    'Pablo Neruda', 'Ralph Waldo Emerson', 'Mother Teresa', 'Garrison Keillor', 'Jim Henson',
+    'Charles M. Schulz', 'William Nicholson', 'Jorge Luis Borges', 'George Eliot', 'C.S. Lewis',
+    'Martin Luther King Jr.', 'James Baldwin', 'Haruki Murakami', 'Alexandre Dumas', 'Stephenie Meyer',
+]
+
+WORDS = (
+    'world life love time mind truth heart people books friend change dream live '
+    'never always nothing everything reason light dark hope fear choose make think'
+).split()
+
+TAGS = ['change', 'deep-thoughts', 'thinking', 'world', 'life', 'love', 'humor', 'books', 'truth']
+
+
+def author_slug(author):
+    return author.replace('.', '').replace(' ', '-')
+
+
+def render_quote(page, index, variant=''):
+    rng = random.Random(page * 1000 + index)
+    author = rng.choice(AUTHORS)
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))).capitalize()
+    tags = rng.sample(TAGS, 3)
+    tag_links = ''.join(
+        f'\n            <a class="tag" href="/tag/{tag}/page/1/">{tag}</a>' for tag in tags
+    )
+    return f'''
+    <div class="quote" itemscope itemtype="http://schema.org/CreativeWork">
+        <span class="text" itemprop="text">“{escape(text)} ({page}.{index}{escape(variant)})”</span>
+        <span>by <small class="author" itemprop="author">{escape(author)}</small>
+        <a href="/author/{author_slug(author)}">(about)</a>
+        </span>
+        <div class="tags">
+            Tags:
+            <meta class="keywords" itemprop="keywords" content="{','.join(tags)}" />{tag_links}
+        </div>
+    </div>'''
+
+
+def render_page(page, pages=10, quotes_per_page=10, variant=''):
+    """
+    HTML of listing page ``page`` (1-based) out of ``pages``
+    """
+    quotes = ''.join(render_quote(page, i, variant) for i in range(quotes_per_page))
+    pager = ''
+    if page > 1:
+        pager += f'\n            <li class="previous"><a href="/page/{page - 1}/"><span aria-hidden="true">&larr;</span> Previous</a></li>'
+    if page < pages:
+        pager += f'\n            <li class="next"><a href="/page/{page + 1}/">Next <span aria-hidden="true">&rarr;</span></a></li>'
+    return f'''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Quotes to Scrape</title>
+</head>
+<body>
+    <div class="container">
+        <div class="row header-box">
+            <div class="col-md-8"><h1><a href="/" style="text-decoration: none">Quotes to Scrape</a></h1></div>
+        </div>
+        <div class="row">
+        <div class="col-md-8">{quotes}
+    <nav>
+        <ul class="pager">{pager}
+        </ul>
+    </nav>
+        </div>
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+
+class MockSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?', 1)[0]
+
+        if path == '/__stats':
+            return self.send_body(200, json.dumps(server.counters()).encode(), 'application/json')
+        if path == '/__reset':
+            server.reset()
+            return self.send_body(200, b'{}', 'application/json')
+
+        server.count('requests')
+        if not server.enter():
+            server.count('throttled')
+            return self.send_body(429, b'Too many requests', 'text/plain', retry_after=server.retry_after)
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+            if server.fail():
+                server.count('errors')
+                return self.send_body(500, b'Internal server error', 'text/plain')
+            self.send_page(path)
+        finally:
+            server.leave()
+
+    def send_page(self, path):
+        server = self.server
+
+        page = None
+        if path == '/':
+            page = 1
+        elif path.startswith('/page/'):
+            try:
+                page = int(path.strip('/').split('/')[1])
+            except (IndexError, ValueError):
+                page = None
+
+        if page is None or not 1 <= page <= server.pages:
+            return self.send_body(404, b'Not found', 'text/plain')
+
+        body = render_page(page, server.pages, server.quotes_per_page, server.variant).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+        if self.headers.get('If-None-Match') == etag:
+            server.count('not_modified')
+            return self.send_body(304, b'', None, etag)
+
+        server.count('pages')
+        self.send_body(200, body, 'text/html; charset=utf-8', etag)
+
+    def send_body(self, status, body, content_type, etag=None, retry_after=None):
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pages=10, quotes_per_page=10, latency=0.0, capacity=0, retry_after=1,
+                 error_rate=0.0, seed=0, variant=''):
+        super().__init__(address, MockSiteHandler)
+        self.pages = pages
+        self.quotes_per_page = quotes_per_page
+        self.latency = latency
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.variant = variant
+        self.rng = random.Random(seed)
+        self.inflight = 0
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enter(self):
+        with self._lock:
+            if self.capacity and self.inflight >= self.capacity:
+                return False
+            self.inflight += 1
+            self._counters['inflight_max'] = max(self._counters['inflight_max'], self.inflight)
+            return True
+
+    def fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self.rng.random() < self.error_rate
+
+    def leave(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+            if name == 'pages':
+                now = time.time()
+                self._counters.setdefault('first_page_at', now)
+                self._counters['last_page_at'] = now
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._counters = {'requests': 0, 'pages': 0, 'not_modified': 0, 'throttled': 0, 'errors': 0,
+                              'inflight_max': 0, 'started': time.time()}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def start_mock_site(port, pages, latency=0.0, quotes_per_page=10, capacity=0, error_rate=0.0, variant=''):
+    """
+    Run the mock site in a subprocess and return once it is listening
+    """
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.mock_site', '--port', str(port), '--pages', str(pages),
+         '--latency', str(latency), '--quotes-per-page', str(quotes_per_page), '--capacity', str(capacity),
+         '--error-rate', str(error_rate), '--variant', variant],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    process.stdout.readline()  # "Serving ..." once the socket is bound
+    return process
+
+
+def site_counters(base_url, reset=False):
+    with urlopen(f"{base_url}/{'__reset' if reset else '__stats'}") as response:
+        return json.load(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--quotes-per-page', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every page request')
+    parser.add_argument('--capacity', type=int, default=0, help='concurrent requests served before answering 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of page requests answered with 500')
+    parser.add_argument('--seed', type=int, default=0, help='seed for --error-rate')
+    parser.add_argument('--variant', default='', help='text mixed into every quote')
+    args = parser.parse_args()
+
+    server = MockSiteServer((args.host, args.port), args.pages, args.quotes_per_page, args.latency,
+                            args.capacity, args.retry_after, args.error_rate, args.seed, args.variant)
+    print(f'Serving {args.pages} pages at {server.base_url}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
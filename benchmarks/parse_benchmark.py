@@ -0,0 +1,139 @@
+"""
+ExampleSpider.parse_page throughput and allocation, old path vs new path
+
+Runs the original per-node `.css()` parse and the current precompiled
+extraction over saved HTML pages in benchmarks/fixtures (or --fixtures),
+checks both produce the same items, and reports pages/sec plus peak and
+retained bytes allocated per item (tracemalloc).
+
+    python -m benchmarks.parse_benchmark --iterations 2000
+"""
+from datetime import datetime
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scraper'))
+
+from itemadapter import ItemAdapter, is_item  # noqa: E402
+from scrapy.http import HtmlResponse  # noqa: E402
+from scraper.items import QuoteItem  # noqa: E402
+from scraper.spiders.example_spider import ExampleSpider  # noqa: E402
+
+
+def legacy_parse(response):
+    """
+    ExampleSpider.parse as it was before the precompiled extraction layer
+    """
+    for quote in response.css('div.quote'):
+        item = QuoteItem()
+        title = quote.css('span.text::text').get()
+        author_link = quote.css('a[href*="/author/"]::attr(href)').get()
+        if title and author_link:
+            item['title'] = title.strip()
+            item['link'] = response.urljoin(author_link)
+            item['scraped_at'] = datetime.utcnow()
+            yield item
+
+    next_page = response.css('li.next a::attr(href)').get()
+    if next_page:
+        yield response.follow(next_page)
+
+
+def load_fixtures(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, 'rb') as f:
+            pages.append((f'http://quotes.example/{os.path.basename(path)}', f.read()))
+    if not pages:
+        raise SystemExit(f'No .html fixtures found in {directory}')
+    return pages
+
+
+def responses(pages, count):
+    # A fresh response per parse: selectors are cached on the response
+    return [HtmlResponse(url=url, body=body, encoding='utf-8') for url, body in pages] * (count // len(pages))
+
+
+def summarize(output):
+    items = [(ItemAdapter(o)['title'], ItemAdapter(o)['link']) for o in output if is_item(o)]
+    follows = [o.url for o in output if not is_item(o)]
+    return items, follows
+
+
+def run(name, parse, pages, iterations):
+    batch = responses(pages, iterations)
+    started = time.perf_counter()
+    items = 0
+    for response in batch:
+        for obj in parse(response):
+            items += is_item(obj)
+    elapsed = time.perf_counter() - started
+
+    # Allocation is measured separately so tracing does not skew the timing
+    sample = responses(pages, min(iterations, 200))
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    kept = [list(parse(response)) for response in sample]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sampled_items = sum(is_item(obj) for output in kept for obj in output)
+
+    return {
+        'path': name,
+        'pages': len(batch),
+        'items': items,
+        'seconds': round(elapsed, 4),
+        'pages_per_sec': round(len(batch) / elapsed, 1),
+        'items_per_sec': round(items / elapsed, 1),
+        'peak_bytes_per_item': round((peak - baseline) / max(sampled_items, 1)),
+        'retained_bytes_per_item': round((current - baseline) / max(sampled_items, 1)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fixtures', default=os.path.join(ROOT, 'benchmarks', 'fixtures'))
+    parser.add_argument('--iterations', type=int, default=2000, help='pages parsed per path')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    # The spider logs every page at INFO
+    logging.getLogger('scraper').setLevel(logging.WARNING)
+
+    pages = load_fixtures(args.fixtures)
+    spider = ExampleSpider()
+
+    for url, body in pages:
+        response = HtmlResponse(url=url, body=body, encoding='utf-8')
+        old = summarize(list(legacy_parse(response)))
+        new = summarize(list(spider.parse_page(response)))
+        if old != new:
+            raise SystemExit(f'Old and new parse paths disagree on {url}')
+
+    results = [
+        run('legacy_css', legacy_parse, pages, args.iterations),
+        run('precompiled', spider.parse_page, pages, args.iterations),
+    ]
+    speedup = results[1]['pages_per_sec'] / results[0]['pages_per_sec']
+
+    print(f"{'path':<12} {'pages/s':>9} {'items/s':>10} {'peak B/item':>12} {'kept B/item':>12}")
+    for r in results:
+        print(f"{r['path']:<12} {r['pages_per_sec']:>9} {r['items_per_sec']:>10} "
+              f"{r['peak_bytes_per_item']:>12} {r['retained_bytes_per_item']:>12}")
+    print(f'speedup: {speedup:.2f}x over {len(pages)} fixtures')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'parse', 'config': vars(args), 'results': results,
+                       'speedup': round(speedup, 2)}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Crawl throughput and core utilisation with parse offloading
+
+Crawls the local mock site once per PARSE_PROCESSES value (0 = parse on
+the reactor thread) and reports pages/sec and how many cores the crawl
+kept busy: CPU seconds of the crawl process and its parse pool divided by
+wall-clock seconds. Pages are made large (--quotes-per-page) so parsing
+dominates, and every page is seeded so the crawl is not serialised on
+pagination (pages reached again through next links are simply parsed
+twice, which only adds parse work).
+
+    python -m benchmarks.parse_offload --processes 0 1 2 4 --pages 400
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.mock_site import SCRAPY_PROJECT_DIR, site_counters, start_mock_site
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def crawl(processes, start_urls, concurrency):
+    command = [
+        sys.executable, '-m', 'scrapy', 'crawl', 'example_spider',
+        '-a', f"start_urls={','.join(start_urls)}",
+        '-s', f'PARSE_PROCESSES={processes}',
+        '-s', 'ITEM_PIPELINES={}',
+        '-s', 'EXTENSIONS={}',
+        '-s', 'ROBOTSTXT_OBEY=False',
+        '-s', 'AUTOTHROTTLE_ENABLED=False',
+        '-s', 'DOWNLOAD_DELAY=0',
+        '-s', f'CONCURRENT_REQUESTS={concurrency}',
+        '-s', f'CONCURRENT_REQUESTS_PER_DOMAIN={concurrency}',
+        '-s', 'LOG_LEVEL=WARNING',
+    ]
+    env = {**os.environ, 'PYTHONPATH': SCRAPY_PROJECT_DIR}
+    cpu_before = children_cpu_seconds()
+    started = time.monotonic()
+    code = subprocess.call(command, cwd=SCRAPY_PROJECT_DIR, env=env)
+    seconds = time.monotonic() - started
+    return seconds, children_cpu_seconds() - cpu_before, code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--pages', type=int, default=400)
+    parser.add_argument('--quotes-per-page', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--port', type=int, default=8998)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    site = start_mock_site(args.port, args.pages, 0, quotes_per_page=args.quotes_per_page)
+    base_url = f'http://127.0.0.1:{args.port}'
+    start_urls = [f'{base_url}/page/{page}/' for page in range(1, args.pages + 1)]
+
+    results = []
+    try:
+        for processes in args.processes:
+            site_counters(base_url, reset=True)
+            seconds, cpu_seconds, code = crawl(processes, start_urls, args.concurrency)
+            pages = site_counters(base_url)['pages']
+            result = {
+                'parse_processes': processes,
+                'pages': pages,
+                'seconds': round(seconds, 3),
+                'pages_per_sec': round(pages / seconds, 2),
+                'cpu_seconds': round(cpu_seconds, 2),
+                'cores_used': round(cpu_seconds / seconds, 2),
+                'exit_code': code,
+            }
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    finally:
+        site.terminate()
+        site.wait()
+
+    print(f"{'procs':>6} {'pages':>6} {'seconds':>8} {'pages/s':>8} {'cores':>6}")
+    for r in results:
+        print(f"{r['parse_processes']:>6} {r['pages']:>6} {r['seconds']:>8} "
+              f"{r['pages_per_sec']:>8} {r['cores_used']:>6}")
+    print(f'cpu count: {os.cpu_count()}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'parse_offload', 'config': vars(args), 'cpu_count': os.cpu_count(),
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
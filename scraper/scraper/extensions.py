@@ -0,0 +1,152 @@
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task, threads
+from datetime import datetime
+import redis
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlProgressPublisher:
+    """
+    Publish compact crawl stats snapshots to Redis while a spider runs
+
+    Every CRAWL_PROGRESS_INTERVAL seconds the stats collector is sampled and
+    the snapshot is stored under ``crawl:progress:<task id>`` and published
+    on the channel of the same name, where the API picks it up. Only runs
+    started by a Celery task (CRAWL_TASK_ID set) are published.
+    """
+
+    def __init__(self, crawler, redis_url, task_id, interval=5.0, ttl=86400):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.redis_url = redis_url
+        self.key = f'crawl:progress:{task_id}'
+        self.task_id = task_id
+        self.interval = interval
+        self.ttl = ttl
+        self.redis = None
+        self.loop = None
+        self.started = None
+        self.last_sample = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        task_id = crawler.settings.get('CRAWL_TASK_ID')
+        redis_url = crawler.settings.get('REDIS_URL')
+        if not task_id or not redis_url:
+            raise NotConfigured
+        ext = cls(
+            crawler,
+            redis_url=redis_url,
+            task_id=task_id,
+            interval=crawler.settings.getfloat('CRAWL_PROGRESS_INTERVAL', 5.0),
+            ttl=crawler.settings.getint('CRAWL_PROGRESS_TTL', 86400)
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.started = time.monotonic()
+        self.last_sample = (self.started, 0, 0)
+        self.loop = task.LoopingCall(self.publish, spider)
+        self.loop.start(self.interval, now=True)
+
+    def spider_closed(self, spider, reason):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        return self.publish(spider, finished=True, reason=reason)
+
+    def snapshot(self, spider, finished=False, reason=None):
+        """
+        Sample the stats collector into a small JSON-friendly dict
+        """
+        now = time.monotonic()
+        stats = self.stats.get_stats()
+        items = stats.get('item_scraped_count', 0)
+        pages = stats.get('response_received_count', 0)
+
+        last_time, last_items, last_pages = self.last_sample
+        window = max(now - last_time, 1e-6)
+        self.last_sample = (now, items, pages)
+
+        snapshot = {
+            'task_id': self.task_id,
+            'spider': spider.name,
+            'elapsed_seconds': round(now - self.started, 1),
+            'items': items,
+            'items_per_sec': round((items - last_items) / window, 2),
+            'pages': pages,
+            'pages_per_sec': round((pages - last_pages) / window, 2),
+            'bytes': stats.get('downloader/response_bytes', 0),
+            'errors': stats.get('log_count/ERROR', 0),
+            'items_inserted': stats.get('postgres/rows_inserted', 0),
+            'items_duplicate': stats.get('postgres/rows_duplicate', 0) + stats.get('seen_filter/items_dropped', 0),
+            'finished': finished,
+            'finish_reason': reason,
+            'timestamp': time.time()
+        }
+
+        engine = self.crawler.engine
+        if not finished and engine and engine.slot:
+            snapshot['queue_depth'] = len(engine.slot.scheduler)
+            snapshot['in_flight'] = len(engine.downloader.active)
+        return snapshot
+
+    def publish(self, spider, finished=False, reason=None):
+        payload = json.dumps(self.snapshot(spider, finished, reason))
+        d = threads.deferToThread(self.write, payload)
+        d.addErrback(lambda failure: logger.warning(f"Failed to publish crawl progress: {failure.value}"))
+        return d
+
+    def write(self, payload):
+        if self.redis is None:
+            self.redis = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self.key, payload, ex=self.ttl)
+        pipe.publish(self.key, payload)
+        pipe.execute()
+
+
+class StatsFileWriter:
+    """
+    Write the final crawl stats as JSON to STATS_FILE
+
+    Lets the process that started `scrapy crawl` (a Celery task in
+    subprocess mode) read back the same stats an in-process crawl returns.
+    Written once the engine has stopped, so the stats collector and every
+    spider_closed handler are done; datetimes become ISO strings and
+    non-scalar values are left out.
+    """
+
+    def __init__(self, crawler, path):
+        self.crawler = crawler
+        self.path = path
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('STATS_FILE')
+        if not path:
+            raise NotConfigured
+        ext = cls(crawler, path)
+        crawler.signals.connect(ext.engine_stopped, signal=signals.engine_stopped)
+        return ext
+
+    def engine_stopped(self):
+        stats = {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in self.crawler.stats.get_stats().items()
+            if isinstance(value, (int, float, str, datetime))
+        }
+        partial = f'{self.path}.partial'
+        try:
+            with open(partial, 'w') as f:
+                json.dump(stats, f)
+            os.replace(partial, self.path)
+        except OSError as e:
+            logger.error(f"Could not write crawl stats to {self.path}: {e}")
@@ -0,0 +1,59 @@
+from parsel.csstranslator import HTMLTranslator
+from scrapy.utils.response import get_base_url
+from urllib.parse import urljoin
+from lxml import etree
+import sys
+
+_translator = HTMLTranslator()
+
+
+def compile_css(query):
+    """
+    Compile a parsel CSS query (``::text`` / ``::attr()`` included) once
+
+    The XPath is the one ``Selector.css()`` would build on every call, so
+    results are the same; ``smart_strings=False`` returns plain strings.
+    """
+    return etree.XPath(_translator.css_to_xpath(query), smart_strings=False)
+
+
+class QuoteExtractor:
+    """
+    Single-pass extraction of quotes and the next-page link from a page
+
+    Runs precompiled XPath directly on the lxml tree the response already
+    parsed, resolves the base URL once per page and joins each distinct
+    author link only once. Links are interned, so quotes by the same author
+    share one string across the whole crawl.
+    """
+
+    quote_nodes = compile_css('div.quote')
+    quote_text = compile_css('span.text::text')
+    author_href = compile_css('a[href*="/author/"]::attr(href)')
+    next_href = compile_css('li.next a::attr(href)')
+
+    def extract(self, response):
+        """
+        Returns:
+            tuple: ([(title, absolute author link), ...], next page href or None)
+        """
+        root = response.selector.root
+        base_url = get_base_url(response)
+        links = {}
+        quotes = []
+        for node in self.quote_nodes(root):
+            texts = self.quote_text(node)
+            hrefs = self.author_href(node)
+            title = texts[0] if texts else None
+            href = hrefs[0] if hrefs else None
+            if title and href:
+                link = links.get(href)
+                if link is None:
+                    link = links[href] = sys.intern(urljoin(base_url, href))
+                quotes.append((title.strip(), link))
+
+        next_page = self.next_href(root)
+        return quotes, next_page[0] if next_page else None
+
+
+quote_extractor = QuoteExtractor()
@@ -0,0 +1,147 @@
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from pathlib import Path
+import sqlite3
+import json
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# What a crawl needs to change for each HTTPCACHE_MODE. These are set with
+# 'cmdline' priority so they also win over the spider's custom_settings.
+CACHE_MODE_SETTINGS = {
+    'record': {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_STORAGE': 'scraper.httpcache.SqliteCacheStorage',
+        'HTTPCACHE_POLICY': 'scrapy.extensions.httpcache.DummyPolicy',
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+    },
+    'replay': {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_STORAGE': 'scraper.httpcache.SqliteCacheStorage',
+        'HTTPCACHE_POLICY': 'scrapy.extensions.httpcache.DummyPolicy',
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+        # Never touch the network, and do not pace requests that never leave the process
+        'HTTPCACHE_IGNORE_MISSING': True,
+        'DOWNLOAD_DELAY': 0,
+        'RANDOMIZE_DOWNLOAD_DELAY': False,
+        'AUTOTHROTTLE_ENABLED': False,
+        'SCHEDULER_DOMAIN_DELAY': 0,
+        # Every cached page would otherwise be skipped as unchanged
+        'INCREMENTAL_CRAWL': False,
+    },
+}
+
+
+class HttpCacheModeAddon:
+    """
+    Add-on applying HTTPCACHE_MODE ('off', 'record' or 'replay') to a crawl
+
+    'record' serves what is already cached and stores everything else;
+    'replay' serves only cached responses, ignores the rest, and lifts all
+    throttling so a crawl measures parsing and pipeline throughput alone.
+    """
+
+    def update_settings(self, settings):
+        mode = (settings.get('HTTPCACHE_MODE') or 'off').lower()
+        if mode == 'off':
+            return
+        if mode not in CACHE_MODE_SETTINGS:
+            raise ValueError(f"Unknown HTTPCACHE_MODE {mode!r}, expected off, record or replay")
+
+        overrides = dict(CACHE_MODE_SETTINGS[mode])
+        if mode == 'replay':
+            concurrency = settings.getint('HTTPCACHE_REPLAY_CONCURRENCY', 64)
+            overrides['CONCURRENT_REQUESTS'] = concurrency
+            overrides['CONCURRENT_REQUESTS_PER_DOMAIN'] = concurrency
+        for name, value in overrides.items():
+            settings.set(name, value, priority='cmdline')
+        logger.info(f"HTTP cache mode: {mode} ({settings.get('HTTPCACHE_DIR')})")
+
+
+class SqliteCacheStorage:
+    """
+    HTTP cache storage keeping all responses of a spider in one SQLite file
+
+    Bodies are zlib-compressed and keyed by request fingerprint, so a large
+    crawl is a single compact file instead of a directory per response.
+    Writes are committed every HTTPCACHE_SQLITE_COMMIT_EVERY responses and
+    when the spider closes.
+    """
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.compress_level = settings.getint('HTTPCACHE_GZIP_LEVEL', 6)
+        self.commit_every = settings.getint('HTTPCACHE_SQLITE_COMMIT_EVERY', 100)
+        self.db = None
+        self.stats = None
+        self.pending = 0
+
+    def open_spider(self, spider):
+        path = Path(self.cachedir, f'{spider.name}.sqlite3')
+        self.db = sqlite3.connect(str(path))
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                fingerprint BLOB PRIMARY KEY,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                body_size INTEGER NOT NULL,
+                stored_at REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self.stats = spider.crawler.stats
+        logger.debug(f"Using SQLite cache storage in {path}")
+
+    def close_spider(self, spider):
+        if self.db:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def retrieve_response(self, spider, request):
+        row = self.db.execute(
+            "SELECT url, status, headers, body, stored_at FROM responses WHERE fingerprint = ?",
+            (self._fingerprinter.fingerprint(request),)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, stored_at = row
+        if 0 < self.expiration_secs < time.time() - stored_at:
+            return None
+
+        headers = Headers({
+            name.encode('latin-1'): [value.encode('latin-1') for value in values]
+            for name, values in json.loads(headers).items()
+        })
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        headers = json.dumps({
+            name.decode('latin-1'): [value.decode('latin-1') for value in values]
+            for name, values in response.headers.items()
+        })
+        body = zlib.compress(response.body, self.compress_level)
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self._fingerprinter.fingerprint(request), response.url, response.status,
+             headers, body, len(response.body), time.time())
+        )
+        self.stats.inc_value('httpcache/stored_bytes', len(response.body))
+        self.stats.inc_value('httpcache/stored_bytes_compressed', len(body))
+
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.db.commit()
+            self.pending = 0
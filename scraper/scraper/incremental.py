@@ -0,0 +1,314 @@
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Request
+from scrapy.utils.httpobj import urlparse_cached
+from itemadapter import ItemAdapter, is_item
+from scraper.dedup import item_hash
+from psycopg2.extras import execute_values
+from twisted.internet import threads
+import psycopg2
+import weakref
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One shared state per crawler, used by both incremental middlewares
+_states = weakref.WeakKeyDictionary()
+
+
+def item_key(item):
+    """
+    Short stable fingerprint of a quote, used to recognise already-known items
+    """
+    adapter = ItemAdapter(item)
+    return format(item_hash(adapter.get('title'), adapter.get('link')), '016x')
+
+
+class PageStateStore:
+    """
+    Per-URL validators and content fingerprints in the ``crawl_pages`` table
+    """
+
+    def __init__(self, db_config):
+        self.db_config = db_config
+
+    def load(self, spider_name):
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT url, etag, last_modified, content_hash, content_length, fetch_ms, item_hashes
+                    FROM crawl_pages WHERE spider = %s
+                """, (spider_name,))
+                rows = cursor.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        return {
+            url: {
+                'etag': etag,
+                'last_modified': last_modified,
+                'content_hash': content_hash,
+                'content_length': content_length or 0,
+                'fetch_ms': fetch_ms or 0.0,
+                'item_hashes': item_hashes or []
+            }
+            for url, etag, last_modified, content_hash, content_length, fetch_ms, item_hashes in rows
+        }
+
+    def save(self, spider_name, pages):
+        if not pages:
+            return
+        rows = [
+            (spider_name, url, page['etag'], page['last_modified'], page['content_hash'],
+             page['content_length'], page['fetch_ms'], page['item_hashes'])
+            for url, page in pages.items()
+        ]
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, """
+                    INSERT INTO crawl_pages
+                        (spider, url, etag, last_modified, content_hash, content_length, fetch_ms, item_hashes)
+                    VALUES %s
+                    ON CONFLICT (spider, url) DO UPDATE SET
+                        etag = EXCLUDED.etag,
+                        last_modified = EXCLUDED.last_modified,
+                        content_hash = EXCLUDED.content_hash,
+                        content_length = EXCLUDED.content_length,
+                        fetch_ms = EXCLUDED.fetch_ms,
+                        item_hashes = EXCLUDED.item_hashes,
+                        last_crawled_at = CURRENT_TIMESTAMP
+                """, rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class IncrementalCrawlState:
+    """
+    What the previous crawls saw, and what this one has seen so far
+
+    Loaded from ``crawl_pages`` when the spider opens and written back when
+    it closes. Savings are reported against a full crawl of every page the
+    previous crawls fetched: a page that is not fully downloaded and parsed
+    this time saves its previous size and download time.
+    """
+
+    def __init__(self, crawler, store):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.store = store
+        self.previous = {}
+        self.known_items = set()
+        self.updated = {}
+        self.parsed = set()
+        self.downloads = {}
+        self.loaded = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('INCREMENTAL_CRAWL'):
+            raise NotConfigured
+        state = _states.get(crawler)
+        if state is None:
+            state = cls(crawler, PageStateStore(crawler.settings.get('DATABASE_CONFIG')))
+            crawler.signals.connect(state.spider_opened, signal=signals.spider_opened)
+            crawler.signals.connect(state.spider_closed, signal=signals.spider_closed)
+            _states[crawler] = state
+        return state
+
+    def spider_opened(self, spider):
+        d = threads.deferToThread(self.store.load, spider.name)
+        d.addCallbacks(self.loaded_state, self.load_failed)
+        return d
+
+    def loaded_state(self, pages):
+        self.previous = pages
+        self.known_items = {key for page in pages.values() for key in page['item_hashes']}
+        self.loaded = True
+        logger.info(f"Incremental crawl: {len(pages)} known pages, {len(self.known_items)} known items")
+
+    def load_failed(self, failure):
+        logger.warning(f"Incremental crawl state unavailable, running a full crawl: {failure.value}")
+
+    def spider_closed(self, spider, reason):
+        self.record_savings()
+        if not self.loaded or not self.updated:
+            return None
+        d = threads.deferToThread(self.store.save, spider.name, self.updated)
+        d.addCallbacks(
+            lambda _: logger.info(f"Incremental crawl: saved state for {len(self.updated)} pages"),
+            lambda failure: logger.error(f"Failed to save incremental crawl state: {failure.value}")
+        )
+        return d
+
+    def page(self, url):
+        """
+        Mutable record for ``url`` that will be written back at close
+        """
+        if url not in self.updated:
+            self.updated[url] = dict(self.previous.get(url) or {
+                'etag': None, 'last_modified': None, 'content_hash': None,
+                'content_length': 0, 'fetch_ms': 0.0, 'item_hashes': []
+            })
+        return self.updated[url]
+
+    def record_download(self, url, size, fetch_ms):
+        self.downloads[url] = (size, fetch_ms)
+
+    def record_skip(self, url, reason):
+        self.stats.inc_value(f'incremental/pages_{reason}')
+        logger.debug(f"Skipping {reason.replace('_', ' ')} page: {url}")
+
+    def record_items(self, url, item_hashes):
+        self.parsed.add(url)
+        self.page(url)['item_hashes'] = item_hashes
+
+    def record_savings(self):
+        skipped = bytes_saved = time_saved = 0
+        for url, page in self.previous.items():
+            if url in self.parsed:
+                continue
+            size, fetch_ms = self.downloads.get(url, (0, 0.0))
+            skipped += 1
+            bytes_saved += max(page['content_length'] - size, 0)
+            time_saved += max(page['fetch_ms'] - fetch_ms, 0.0)
+        self.stats.set_value('incremental/pages_skipped', skipped)
+        self.stats.set_value('incremental/bytes_saved', bytes_saved)
+        self.stats.set_value('incremental/time_saved_ms', round(time_saved, 1))
+        self.stats.set_value('incremental/pages_parsed', len(self.parsed))
+        if skipped:
+            logger.info(
+                f"Incremental crawl skipped {skipped} pages, saving {bytes_saved} bytes "
+                f"and {time_saved / 1000:.1f}s of download time"
+            )
+
+
+class IncrementalDownloaderMiddleware:
+    """
+    Send conditional requests and drop pages that have not changed
+
+    Known pages are requested with If-None-Match / If-Modified-Since. A 304,
+    or a 200 whose body hashes to the stored content hash, is turned into
+    IgnoreRequest so it never reaches the spider. Only requests that came
+    from the spider are tracked (IncrementalSpiderMiddleware marks them), so
+    robots.txt and other middleware-issued requests are never dropped;
+    requests with ``meta['incremental'] = False`` are always fetched and
+    parsed.
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(IncrementalCrawlState.from_crawler(crawler))
+
+    def tracked(self, request):
+        return (request.method == 'GET' and request.meta.get('incremental') is True
+                and not request.meta.get('dont_obey_robotstxt')
+                and urlparse_cached(request).path != '/robots.txt')
+
+    def process_request(self, request, spider):
+        if not self.tracked(request):
+            return None
+        previous = self.state.previous.get(request.url)
+        if previous:
+            if previous['etag']:
+                request.headers.setdefault('If-None-Match', previous['etag'])
+            if previous['last_modified']:
+                request.headers.setdefault('If-Modified-Since', previous['last_modified'])
+        return None
+
+    def process_response(self, request, response, spider):
+        if not self.tracked(request):
+            return response
+
+        url = request.url
+        previous = self.state.previous.get(url)
+        fetch_ms = request.meta.get('download_latency', 0.0) * 1000
+        self.state.record_download(url, len(response.body), fetch_ms)
+
+        if response.status == 304 and previous:
+            self.state.record_skip(url, 'not_modified')
+            raise IgnoreRequest(f"Not modified: {url}")
+        if response.status != 200:
+            return response
+
+        content_hash = hashlib.sha1(response.body).hexdigest()
+        if previous and previous['content_hash'] == content_hash:
+            self.state.record_skip(url, 'unchanged')
+            raise IgnoreRequest(f"Unchanged: {url}")
+
+        page = self.state.page(url)
+        page['etag'] = (response.headers.get('ETag') or b'').decode() or None
+        page['last_modified'] = (response.headers.get('Last-Modified') or b'').decode() or None
+        page['content_hash'] = content_hash
+        page['content_length'] = len(response.body)
+        page['fetch_ms'] = round(fetch_ms, 1)
+        self.state.stats.inc_value('incremental/pages_changed' if previous else 'incremental/pages_new')
+        return response
+
+
+class IncrementalSpiderMiddleware:
+    """
+    Stop following pagination once a page yields only already-known items
+
+    Pagination requests are the ones the spider marks with
+    ``meta['pagination'] = True``. The items each page yields are recorded
+    so the next crawl knows them. Start requests and requests from
+    callbacks are marked ``meta['incremental'] = True`` (unless the spider
+    set it) so the downloader middleware only tracks spider requests.
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(IncrementalCrawlState.from_crawler(crawler))
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            yield self.mark(request)
+
+    def process_spider_output(self, response, result, spider):
+        page = []
+        for obj in result:
+            if self.keep(response, obj, page):
+                yield obj
+        self.finish(response, page)
+
+    async def process_spider_output_async(self, response, result, spider):
+        page = []
+        async for obj in result:
+            if self.keep(response, obj, page):
+                yield obj
+        self.finish(response, page)
+
+    def keep(self, response, obj, item_hashes):
+        """
+        Record items and decide whether ``obj`` is passed on
+        """
+        if isinstance(obj, Request):
+            self.mark(obj)
+        if is_item(obj):
+            item_hashes.append(item_key(obj))
+        elif (isinstance(obj, Request) and obj.meta.get('pagination') and item_hashes
+                and all(key in self.state.known_items for key in item_hashes)):
+            self.state.stats.inc_value('incremental/pagination_stopped')
+            logger.info(f"Stopping pagination at {response.url}: no new items")
+            return False
+        return True
+
+    @staticmethod
+    def mark(request):
+        if isinstance(request, Request):
+            request.meta.setdefault('incremental', True)
+        return request
+
+    def finish(self, response, item_hashes):
+        if response.request is not None and response.request.meta.get('incremental') is True:
+            self.state.record_items(response.request.url, item_hashes)
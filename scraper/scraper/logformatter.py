@@ -0,0 +1,18 @@
+from scrapy import logformatter
+from scraper.dedup import DuplicateItem
+import logging
+
+
+class ScraperLogFormatter(logformatter.LogFormatter):
+    """
+    Log items dropped as known duplicates at DEBUG instead of WARNING
+
+    On a recrawl most items are duplicates, and one warning per item would
+    drown out everything else in the log.
+    """
+
+    def dropped(self, item, exception, response, spider):
+        entry = super().dropped(item, exception, response, spider)
+        if isinstance(exception, DuplicateItem):
+            entry['level'] = logging.DEBUG
+        return entry
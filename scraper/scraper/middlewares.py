@@ -1,5 +1,15 @@
 from scrapy import signals
+from scrapy.extensions.throttle import AutoThrottle
+from itemadapter import is_item
 from scrapy.http import HtmlResponse
+from scrapy.utils.httpobj import urlparse_cached
+from scraper.offload import ParsePool, ProcessParseMixin
+from scraper.timing import ItemTimer, RequestTimer, TimingRegistry
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import weakref
+import time
+import os
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,20 +18,100 @@ logger = logging.getLogger(__name__)
 class ScraperSpiderMiddleware:
     """
     Spider middleware for custom processing
+
+    With PARSE_PROCESSES > 0 it also owns the process pool that
+    ProcessParseMixin spiders offload their parse callbacks to. With
+    TIMING_ENABLED it records parse time per callback and starts the
+    pipeline clock of every item the spider yields. Async callbacks can
+    await other work, so theirs is recorded as ``parse_wall``; spiders
+    using ProcessParseMixin record ``parse`` for the offloaded callback
+    itself, measured in the pool process.
     """
 
+    def __init__(self, stats=None, parse_processes=0, parse_max_pending=None, parse_start_method='spawn',
+                 timing=None, item_timer=None):
+        self.stats = stats
+        self.parse_processes = parse_processes
+        self.parse_max_pending = parse_max_pending
+        self.parse_start_method = parse_start_method
+        self.parse_pool = None
+        self.timing = timing
+        self.item_timer = item_timer
+
     @classmethod
     def from_crawler(cls, crawler):
-        s = cls()
+        timing = item_timer = None
+        if crawler.settings.getbool('TIMING_ENABLED', True):
+            timing = TimingRegistry.from_crawler(crawler)
+            item_timer = ItemTimer(timing)
+            item_timer.connect(crawler)
+        s = cls(
+            crawler.stats,
+            parse_processes=crawler.settings.getint('PARSE_PROCESSES', 0),
+            parse_max_pending=crawler.settings.getint('PARSE_MAX_PENDING') or None,
+            parse_start_method=crawler.settings.get('PARSE_START_METHOD', 'spawn'),
+            timing=timing,
+            item_timer=item_timer
+        )
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
     def process_spider_input(self, response, spider):
         return None
 
     def process_spider_output(self, response, result, spider):
-        for i in result:
-            yield i
+        if self.timing is None:
+            yield from result
+            return
+        # The callback runs lazily: time only the steps that produce output
+        domain = urlparse_cached(response).hostname or ''
+        elapsed = 0.0
+        iterator = iter(result)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    i = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                self.start_item(i, domain)
+                yield i
+        finally:
+            self.timing.observe('parse', elapsed, domain=domain, callback=self.callback_name(response))
+
+    async def process_spider_output_async(self, response, result, spider):
+        if self.timing is None:
+            async for i in result:
+                yield i
+            return
+        domain = urlparse_cached(response).hostname or ''
+        elapsed = 0.0
+        iterator = result.__aiter__()
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    i = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                self.start_item(i, domain)
+                yield i
+        finally:
+            self.timing.observe('parse_wall', elapsed, domain=domain, callback=self.callback_name(response))
+
+    def start_item(self, output, domain):
+        if is_item(output):
+            self.item_timer.start(output, domain)
+
+    @staticmethod
+    def callback_name(response):
+        callback = response.request.callback if response.request else None
+        return getattr(callback, '__name__', None) or 'parse'
 
     def process_spider_exception(self, response, exception, spider):
         logger.error(f"Spider exception: {exception}")
@@ -30,15 +120,255 @@ class ScraperSpiderMiddleware:
     def spider_opened(self, spider):
         logger.info(f'Spider opened: {spider.name}')
 
+        # Set by the Celery task that launched this crawl process
+        task_started_at = os.getenv('SCRAPER_TASK_STARTED_AT')
+        if task_started_at:
+            overhead = time.time() - float(task_started_at)
+            logger.info(f'Startup overhead: {overhead:.3f}s')
+            if self.stats:
+                self.stats.set_value('startup_overhead_seconds', round(overhead, 3))
+
+        if isinstance(spider, ProcessParseMixin):
+            spider.parse_timing = self.timing
+
+        if self.parse_processes > 0 and isinstance(spider, ProcessParseMixin):
+            try:
+                self.parse_pool = ParsePool(
+                    type(spider),
+                    self.parse_processes,
+                    max_pending=self.parse_max_pending,
+                    stats=self.stats,
+                    start_method=self.parse_start_method
+                )
+            except Exception as e:
+                logger.warning(f"Could not start parse pool, parsing in-process: {e}")
+            else:
+                spider.parse_pool = self.parse_pool
+                logger.info(f"Parsing in {self.parse_processes} processes "
+                            f"(up to {self.parse_pool.max_pending} pending)")
+
+    def spider_closed(self, spider):
+        if isinstance(spider, ProcessParseMixin):
+            spider.parse_timing = None
+        if self.parse_pool:
+            spider.parse_pool = None
+            self.parse_pool.close()
+            self.parse_pool = None
+
+
+class SlotState:
+    """
+    What the adaptive controller knows about one download slot
+    """
+
+    def __init__(self, concurrency):
+        self.concurrency = float(concurrency)
+        self.latency = None
+        self.baseline = None
+        self.last_decrease = 0.0
+        self.blocked_until = 0.0
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller for per-slot download concurrency
+
+    Every healthy response on a saturated slot adds ``increase / concurrency``
+    (about +1 per window of responses). A 429/503 or a download error
+    multiplies concurrency by ``decrease``; a latency EWMA above
+    ``latency_tolerance`` times the slot's best latency, a sign of queueing
+    at the target, by the gentler ``latency_decrease``. Decreases happen at
+    most once per round-trip so one burst of errors counts once, and
+    Retry-After pauses the slot for the requested time. Concurrency stays between ``min_concurrency`` and
+    ``max_concurrency``; the downloader's total is capped at ``max_total``.
+    """
+
+    THROTTLE_CODES = (429, 503)
+
+    def __init__(self, crawler, min_concurrency=1, max_concurrency=32, max_total=64, increase=1.0,
+                 decrease=0.5, latency_decrease=0.9, latency_tolerance=3.0, delay=0.0, max_retry_after=300):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(min_concurrency, min(max_concurrency, max_total))
+        self.max_total = max_total
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_decrease = latency_decrease
+        self.latency_tolerance = latency_tolerance
+        self.delay = delay
+        self.max_retry_after = max_retry_after
+        self.slots = {}
+        self.observed = weakref.WeakSet()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            crawler,
+            min_concurrency=settings.getint('ADAPTIVE_CONCURRENCY_MIN', 1),
+            max_concurrency=settings.getint('ADAPTIVE_CONCURRENCY_MAX', 32),
+            max_total=settings.getint('ADAPTIVE_CONCURRENCY_MAX_TOTAL', 64),
+            increase=settings.getfloat('ADAPTIVE_CONCURRENCY_INCREASE', 1.0),
+            decrease=settings.getfloat('ADAPTIVE_CONCURRENCY_DECREASE', 0.5),
+            latency_decrease=settings.getfloat('ADAPTIVE_CONCURRENCY_LATENCY_DECREASE', 0.9),
+            latency_tolerance=settings.getfloat('ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE', 3.0),
+            delay=settings.getfloat('ADAPTIVE_CONCURRENCY_DELAY', 0.0),
+            max_retry_after=settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_RETRY_AFTER', 300)
+        )
+
+    def disable_autothrottle(self):
+        """
+        Disconnect AutoThrottle so it does not fight over ``slot.delay``
+
+        AUTOTHROTTLE_ENABLED defaults to the inverse of the environment's
+        ADAPTIVE_CONCURRENCY_ENABLED, which a per-run setting does not
+        change. Extensions are built before the downloader middlewares, so
+        AutoThrottle's signal handlers can still be removed here.
+        """
+        for extension in self.crawler.extensions.middlewares:
+            if isinstance(extension, AutoThrottle):
+                self.crawler.signals.disconnect(extension._spider_opened, signal=signals.spider_opened)
+                self.crawler.signals.disconnect(extension._response_downloaded, signal=signals.response_downloaded)
+                logger.warning("AutoThrottle disabled: adaptive concurrency controls download delays")
+
+    def spider_opened(self, spider):
+        # The global ceiling replaces CONCURRENT_REQUESTS
+        self.crawler.engine.downloader.total_concurrency = self.max_total
+        logger.info(
+            f"Adaptive concurrency: {self.min_concurrency}-{self.max_concurrency} per slot, "
+            f"{self.max_total} total"
+        )
+
+    def slot_for(self, request):
+        key = request.meta.get('download_slot')
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return key, None, None
+        state = self.slots.get(key)
+        if state is None:
+            state = self.slots[key] = SlotState(
+                min(max(slot.concurrency, self.min_concurrency), self.max_concurrency)
+            )
+        return key, slot, state
+
+    def response_downloaded(self, response, request, spider):
+        """
+        Observe responses before RetryMiddleware turns 429/503 into retries
+        """
+        self.observed.add(request)
+        key, slot, state = self.slot_for(request)
+        if slot is None:
+            return
+        now = time.monotonic()
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+            # Drift the best-seen latency up slowly so an old minimum does not stick forever
+            state.baseline = latency if state.baseline is None else min(latency, state.baseline * 1.01)
+
+        if response.status in self.THROTTLE_CODES:
+            self.stats.inc_value(f'adaptive/throttled/{response.status}')
+            self.pause(key, slot, state, response, now)
+            self.reduce(key, state, now, 'throttled', self.decrease)
+        elif (state.latency is not None and state.baseline
+                and state.latency > state.baseline * self.latency_tolerance):
+            self.reduce(key, state, now, 'latency', self.latency_decrease)
+        elif len(slot.active) >= int(state.concurrency):
+            # Only grow while the slot has more work than it is allowed to run
+            state.concurrency = min(state.concurrency + self.increase / state.concurrency, self.max_concurrency)
+            self.stats.inc_value('adaptive/increases')
+
+        if state.blocked_until and now >= state.blocked_until:
+            state.blocked_until = 0.0
+            slot.delay = self.delay
+        self.apply(key, slot, state)
+
+    def request_left_downloader(self, request, spider):
+        # No response_downloaded for it: the download failed
+        if request in self.observed:
+            return
+        key, slot, state = self.slot_for(request)
+        if slot is not None:
+            self.stats.inc_value('adaptive/download_errors')
+            self.reduce(key, state, time.monotonic(), 'error', self.decrease)
+            self.apply(key, slot, state)
+
+    def reduce(self, key, state, now, reason, factor):
+        # Once per round-trip: responses already in flight reflect the old level
+        interval = max(state.latency or 0.0, 0.1) * 2
+        if state.concurrency <= self.min_concurrency or now - state.last_decrease < interval:
+            return
+        before = state.concurrency
+        state.concurrency = max(state.concurrency * factor, self.min_concurrency)
+        state.last_decrease = now
+        self.stats.inc_value('adaptive/decreases')
+        self.stats.inc_value(f'adaptive/decreases/{reason}')
+        logger.info(f"Adaptive concurrency for {key}: {before:.1f} -> {state.concurrency:.1f} ({reason})")
+
+    def pause(self, key, slot, state, response, now):
+        retry_after = self.parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after:
+            retry_after = min(retry_after, self.max_retry_after)
+            state.blocked_until = now + retry_after
+            slot.delay = retry_after
+            self.stats.inc_value('adaptive/retry_after_pauses')
+            logger.info(f"Pausing {key} for {retry_after:.0f}s (Retry-After)")
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        Seconds to wait from a Retry-After header (delta-seconds or HTTP date)
+        """
+        if not value:
+            return None
+        value = value.decode('latin-1').strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+    def apply(self, key, slot, state):
+        slot.concurrency = int(state.concurrency)
+        if not state.blocked_until:
+            slot.delay = self.delay
+        self.stats.set_value(f'adaptive/concurrency/{key}', slot.concurrency)
+        self.stats.max_value(f'adaptive/concurrency_max/{key}', slot.concurrency)
+
 
 class ScraperDownloaderMiddleware:
     """
     Downloader middleware for request/response processing
+
+    With ADAPTIVE_CONCURRENCY_ENABLED it drives an AdaptiveConcurrency
+    controller. Responses and failures are observed through the
+    downloader's signals rather than process_response/process_exception,
+    which only see what RetryMiddleware lets through.
+
+    With TIMING_ENABLED it records queueing delay and download timings of
+    every request per domain (see scraper.timing.RequestTimer).
     """
 
+    def __init__(self, controller=None, timer=None):
+        self.controller = controller
+        self.timer = timer
+
     @classmethod
     def from_crawler(cls, crawler):
-        s = cls()
+        controller = timer = None
+        if crawler.settings.getbool('TIMING_ENABLED', True):
+            timer = RequestTimer(TimingRegistry.from_crawler(crawler))
+            timer.connect(crawler)
+        if crawler.settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            controller = AdaptiveConcurrency.from_crawler(crawler)
+            controller.disable_autothrottle()
+            crawler.signals.connect(controller.spider_opened, signal=signals.spider_opened)
+            crawler.signals.connect(controller.response_downloaded, signal=signals.response_downloaded)
+            crawler.signals.connect(controller.request_left_downloader, signal=signals.request_left_downloader)
+        s = cls(controller, timer)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
         return s
 
@@ -53,4 +383,4 @@ class ScraperDownloaderMiddleware:
         pass
 
     def spider_opened(self, spider):
-        logger.info(f'Spider opened: {spider.name}')
\ No newline at end of file
+        logger.info(f'Spider opened: {spider.name}')
@@ -0,0 +1,384 @@
+"""
+Versioned schema for the scraper database
+
+Every table the scraper and the API use is created here, once, by
+``scripts/init_db.py`` at deploy time. Applied versions are recorded in
+``schema_migrations``; pipelines and the API only compare the recorded
+version with SCHEMA_VERSION.
+
+A migration is a list of idempotent statements run in one short
+transaction (with a lock timeout, so a DDL statement never queues
+writers behind it for long), then batched backfills each committed on
+their own, then indexes built with CREATE INDEX CONCURRENTLY, so running
+crawls keep writing throughout. Its version is recorded once all of
+them succeeded, so an interrupted migration is simply run again.
+Conditional migrations (e.g. converting quotes to monthly partitions)
+stay pending until their condition holds. New schema changes are
+appended to MIGRATIONS; applied ones are never edited.
+"""
+from scraper import partitions
+import psycopg2
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Session-level advisory lock serialising concurrent migrate() calls
+MIGRATION_LOCK_ID = 72_311_045
+# How long a migration's DDL waits for a table lock before failing
+MIGRATION_LOCK_TIMEOUT = os.getenv('MIGRATION_LOCK_TIMEOUT', '10s')
+# Rows updated per transaction by backfills
+BACKFILL_BATCH_SIZE = int(os.getenv('MIGRATION_BACKFILL_BATCH_SIZE', 5000))
+
+
+class SchemaVersionError(RuntimeError):
+    """Raised when the database schema is older than this code expects"""
+
+
+class Migration:
+    """
+    One schema version
+
+    Args:
+        statements: SQL strings or callables taking a cursor, run in one
+            transaction; they must be safe to run again
+        backfills: callables taking an autocommit cursor, run after the
+            statements; each should update rows in small transactions
+        indexes: (name, table, definition) built concurrently afterwards,
+            e.g. ('idx_quotes_run_id', 'quotes', '(run_id)')
+        drop_indexes: index names dropped concurrently once the new
+            indexes are built
+        condition: callable deciding whether the migration applies now;
+            while it returns False the migration is skipped and stays
+            pending. Conditional migrations do not count towards
+            SCHEMA_VERSION.
+    """
+
+    def __init__(self, version, description, statements=(), indexes=(), drop_indexes=(), backfills=(),
+                 condition=None):
+        self.version = version
+        self.description = description
+        self.statements = list(statements)
+        self.indexes = list(indexes)
+        self.drop_indexes = list(drop_indexes)
+        self.backfills = list(backfills)
+        self.condition = condition
+
+
+def create_quotes(cursor):
+    # New databases start with the layout QUOTES_PARTITIONING asks for;
+    # existing plain tables are converted by init_db
+    if partitions.QUOTES_PARTITIONING == 'monthly':
+        cursor.execute("SELECT to_regclass('quotes') IS NULL")
+        if partitions.first_value(cursor.fetchone()):
+            partitions.create_partitioned_schema(cursor, partitions.QUOTES_PARTITIONS_AHEAD)
+            return
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS quotes (
+            id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            link TEXT NOT NULL,
+            scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(title, link)
+        )
+    """)
+
+
+def create_search_trigger(cursor):
+    """
+    Keep quotes.search_vector current on insert and on title/link updates
+
+    Quote text (english, weight A) and the words of the author link
+    (unstemmed, weight B).
+    """
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION quotes_search_vector(title TEXT, link TEXT) RETURNS tsvector
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$
+            SELECT setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                   setweight(to_tsvector('simple', regexp_replace(coalesce(link, ''), '[/_.:-]+', ' ', 'g')), 'B')
+        $$
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION quotes_search_vector_trigger() RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            NEW.search_vector := quotes_search_vector(NEW.title, NEW.link);
+            RETURN NEW;
+        END
+        $$
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS quotes_search_vector_update ON quotes")
+    cursor.execute("""
+        CREATE TRIGGER quotes_search_vector_update
+        BEFORE INSERT OR UPDATE OF title, link ON quotes
+        FOR EACH ROW EXECUTE FUNCTION quotes_search_vector_trigger()
+    """)
+
+
+def backfill_search_vector(cursor, batch_size=None):
+    """
+    Fill search_vector for rows stored before the trigger existed, one id
+    range per transaction so writers are never blocked for long
+    """
+    batch_size = batch_size or BACKFILL_BATCH_SIZE
+    cursor.execute("SELECT MIN(id), MAX(id) FROM quotes")
+    low, high = cursor.fetchone()
+    if low is None:
+        return
+    updated = 0
+    for start in range(low, high + 1, batch_size):
+        cursor.execute("""
+            UPDATE quotes SET search_vector = quotes_search_vector(title, link)
+            WHERE id >= %s AND id < %s AND search_vector IS NULL
+        """, (start, start + batch_size))
+        updated += cursor.rowcount
+    logger.info(f"Backfilled search_vector for {updated} quotes")
+
+
+def partition_quotes(cursor):
+    partitions.create_partitioned_schema(cursor, partitions.QUOTES_PARTITIONS_AHEAD)
+    # The trigger stays with the renamed plain table; the partitioned
+    # one needs its own
+    create_search_trigger(cursor)
+
+
+MIGRATIONS = [
+    Migration(1, "quotes table", [create_quotes]),
+    Migration(
+        2, "keyset pagination index on quotes",
+        # (scraped_at, id) also serves plain scraped_at ordering, so the
+        # old index is dropped once the new one is built
+        indexes=[('idx_quotes_scraped_at_id', 'quotes', '(scraped_at DESC, id DESC)')],
+        drop_indexes=['idx_quotes_scraped_at']
+    ),
+    Migration(3, "per-page state for incremental crawls", ["""
+        CREATE TABLE IF NOT EXISTS crawl_pages (
+            spider TEXT NOT NULL,
+            url TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            content_length INTEGER,
+            fetch_ms REAL,
+            item_hashes TEXT[],
+            last_crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (spider, url)
+        )
+    """]),
+    Migration(
+        4, "crawl run history",
+        ["""
+            CREATE TABLE IF NOT EXISTS crawl_runs (
+                id BIGSERIAL PRIMARY KEY,
+                spider TEXT NOT NULL,
+                task_id TEXT,
+                status TEXT NOT NULL DEFAULT 'running',
+                finish_reason TEXT,
+                started_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC'),
+                finished_at TIMESTAMP,
+                duration_seconds REAL,
+                items_scraped INTEGER,
+                items_inserted INTEGER,
+                items_duplicate INTEGER,
+                items_dropped INTEGER,
+                pages INTEGER,
+                bytes BIGINT,
+                errors INTEGER,
+                download_errors INTEGER,
+                stats JSONB
+            )
+        """],
+        indexes=[
+            ('idx_crawl_runs_spider_started', 'crawl_runs', '(spider, started_at DESC)'),
+            ('idx_crawl_runs_started', 'crawl_runs', '(started_at DESC)'),
+        ]
+    ),
+    Migration(
+        5, "run that first stored each quote",
+        ["ALTER TABLE quotes ADD COLUMN IF NOT EXISTS run_id BIGINT"],
+        indexes=[('idx_quotes_run_id', 'quotes', '(run_id)')]
+    ),
+    Migration(
+        6, "full-text and trigram search over quotes",
+        [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            # A nullable column without a default is added without
+            # rewriting the table (unlike a STORED generated column); the
+            # trigger fills new rows and the backfill existing ones
+            "ALTER TABLE quotes ADD COLUMN IF NOT EXISTS search_vector tsvector",
+            create_search_trigger,
+        ],
+        backfills=[backfill_search_vector],
+        indexes=[
+            ('idx_quotes_search_vector', 'quotes', 'USING GIN (search_vector)'),
+            ('idx_quotes_title_trgm', 'quotes', 'USING GIN (title gin_trgm_ops)'),
+            ('idx_quotes_link_trgm', 'quotes', 'USING GIN (link gin_trgm_ops)'),
+        ]
+    ),
+    Migration(
+        7, "monthly partitioning of quotes",
+        # Converting an existing table copies it under an exclusive lock
+        # (see scraper.partitions); new databases start partitioned
+        [partition_quotes],
+        condition=lambda: partitions.QUOTES_PARTITIONING == 'monthly'
+    ),
+]
+
+# Unconditional versions: what the code needs, whatever the layout
+REQUIRED_VERSIONS = [migration.version for migration in MIGRATIONS if migration.condition is None]
+SCHEMA_VERSION = REQUIRED_VERSIONS[-1]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def db_config_from_env():
+    return {
+        'host': os.getenv('POSTGRES_HOST', 'postgres'),
+        'port': int(os.getenv('POSTGRES_PORT', 5432)),
+        'database': os.getenv('POSTGRES_DB', 'scraperdb'),
+        'user': os.getenv('POSTGRES_USER', 'scraperuser'),
+        'password': os.getenv('POSTGRES_PASSWORD', 'scraperpass123')
+    }
+
+
+def wait_for_db(db_config, max_retries=30, delay=2):
+    """
+    Wait for the database to accept connections; returns whether it did
+    """
+    for attempt in range(max_retries):
+        try:
+            logger.info(f"Attempting to connect to database (attempt {attempt + 1}/{max_retries})")
+            conn = psycopg2.connect(**db_config)
+            conn.close()
+            logger.info("Database is ready!")
+            return True
+        except psycopg2.OperationalError as e:
+            logger.warning(f"Database not ready: {e}")
+            if attempt < max_retries - 1:
+                time.sleep(delay)
+    logger.error("Max retries reached. Database is not available.")
+    return False
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not partitions.first_value(cursor.fetchone()):
+        return set()
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {partitions.first_value(row) for row in cursor.fetchall()}
+
+
+def current_version(cursor):
+    """
+    Highest applied unconditional schema version, 0 for a database never
+    migrated
+    """
+    applied = applied_versions(cursor)
+    return max((version for version in REQUIRED_VERSIONS if version in applied), default=0)
+
+
+def schema_version(conn):
+    with conn.cursor() as cursor:
+        return current_version(cursor)
+
+
+def check_version(cursor, required=SCHEMA_VERSION):
+    """
+    Raise SchemaVersionError unless the schema is at least ``required``
+    """
+    version = current_version(cursor)
+    if version < required:
+        raise SchemaVersionError(
+            f"Database schema is at version {version}, {required} is required; "
+            f"run `python -m scripts.init_db` to migrate"
+        )
+    return version
+
+
+def migrate(db_config, target=LATEST_VERSION):
+    """
+    Apply every pending migration up to ``target`` whose condition holds;
+    returns the new version
+    """
+    conn = psycopg2.connect(**db_config)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')
+                    )
+                """)
+                applied = applied_versions(cursor)
+                for migration in MIGRATIONS:
+                    if migration.version in applied or migration.version > target:
+                        continue
+                    if migration.condition is not None and not migration.condition():
+                        logger.info(f"Schema migration {migration.version} ({migration.description}) "
+                                    f"does not apply yet")
+                        continue
+                    apply_migration(conn, cursor, migration)
+                version = current_version(cursor)
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    finally:
+        conn.close()
+    return version
+
+
+def apply_migration(conn, cursor, migration):
+    started = time.monotonic()
+    logger.info(f"Applying schema migration {migration.version}: {migration.description}")
+
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("SET LOCAL lock_timeout = %s", (MIGRATION_LOCK_TIMEOUT,))
+        for statement in migration.statements:
+            if callable(statement):
+                statement(cursor)
+            else:
+                cursor.execute(statement)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    for backfill in migration.backfills:
+        backfill(cursor)
+    for name, table, definition in migration.indexes:
+        create_index(cursor, name, table, definition)
+    for name in migration.drop_indexes:
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    cursor.execute(
+        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s) ON CONFLICT (version) DO NOTHING",
+        (migration.version, migration.description)
+    )
+    logger.info(f"Schema migration {migration.version} applied in {time.monotonic() - started:.1f}s")
+
+
+def create_index(cursor, name, table, definition):
+    """
+    Build an index without blocking writes (outside a transaction)
+
+    A concurrent build that failed leaves an invalid index behind, which
+    IF NOT EXISTS would keep; it is dropped and rebuilt. Partitioned tables
+    do not support CONCURRENTLY, their (per-partition) indexes are built
+    with a plain CREATE INDEX.
+    """
+    cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+    row = cursor.fetchone()
+    if row is not None and not row[0]:
+        logger.warning(f"Rebuilding invalid index {name}")
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    concurrently = '' if row and row[0] == 'p' else 'CONCURRENTLY '
+    cursor.execute(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} {definition}")
@@ -0,0 +1,149 @@
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from scrapy.http import Request
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.request import request_from_dict
+from twisted.internet import defer
+from twisted.python.failure import Failure
+import multiprocessing
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Spider instance used by callbacks inside a pool process
+_worker_spider = None
+
+
+def init_worker(spidercls):
+    global _worker_spider
+    _worker_spider = spidercls()
+
+
+def run_callback(callback_name, response_cls, url, status, headers, body, encoding, meta):
+    """
+    Rebuild the response in a pool process and run a spider callback on it
+
+    Requests are returned as dicts (callbacks by name) so they can be
+    pickled back and rebuilt against the real spider. Also returns the
+    callback's CPU and wall time in this process.
+    """
+    started = time.process_time()
+    wall_started = time.perf_counter()
+    request = Request(url, meta=meta)
+    response = response_cls(url, status=status, headers=headers, body=body, encoding=encoding, request=request)
+    results = []
+    for obj in getattr(_worker_spider, callback_name)(response) or ():
+        if isinstance(obj, Request):
+            results.append(('request', obj.to_dict(spider=_worker_spider)))
+        else:
+            results.append(('item', obj))
+    return results, time.process_time() - started, time.perf_counter() - wall_started
+
+
+class ParsePool:
+    """
+    Process pool running spider callbacks off the reactor thread
+
+    At most ``max_pending`` responses are queued or being parsed at once;
+    further callbacks wait on a semaphore, which in turn holds responses
+    in the scraper slot and slows the downloader down.
+    """
+
+    def __init__(self, spidercls, processes, max_pending=None, stats=None, start_method='spawn'):
+        self.processes = processes
+        self.max_pending = max_pending or processes * 2
+        self.stats = stats
+        self.executor = ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=init_worker,
+            initargs=(spidercls,)
+        )
+        self.semaphore = defer.DeferredSemaphore(self.max_pending)
+
+    def submit(self, callback_name, response):
+        """
+        Run ``callback_name`` on ``response`` in the pool
+
+        Returns a Deferred firing with a list of ('item' | 'request', value)
+        and the seconds the callback took in the pool process.
+        """
+        meta = {
+            key: value for key, value in response.meta.items()
+            if isinstance(value, (str, int, float, bool, type(None)))
+        }
+        args = (callback_name, type(response), response.url, response.status, dict(response.headers),
+                response.body, getattr(response, 'encoding', None), meta)
+        queued = time.monotonic()
+        return self.semaphore.run(self.dispatch, args, queued)
+
+    def dispatch(self, args, queued):
+        from twisted.internet import reactor
+
+        self.inc_stat('parse_pool/wait_ms', int((time.monotonic() - queued) * 1000))
+        if self.stats:
+            self.stats.max_value('parse_pool/max_pending', self.max_pending - self.semaphore.tokens)
+
+        d = defer.Deferred()
+        future = self.executor.submit(run_callback, *args)
+        future.add_done_callback(lambda f: reactor.callFromThread(self.resolve, d, f))
+        return d
+
+    def resolve(self, d, future):
+        if future.cancelled():
+            # close() cancels what the pool had not started yet
+            d.errback(Failure(CancelledError(f"Parse task cancelled: {future}")))
+            return
+        error = future.exception()
+        if error is not None:
+            self.inc_stat('parse_pool/errors')
+            d.errback(Failure(error))
+            return
+        results, cpu_seconds, wall_seconds = future.result()
+        self.inc_stat('parse_pool/tasks')
+        self.inc_stat('parse_pool/cpu_ms', int(cpu_seconds * 1000))
+        d.callback((results, wall_seconds))
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def inc_stat(self, key, count=1):
+        if self.stats:
+            self.stats.inc_value(key, count)
+
+
+class ProcessParseMixin:
+    """
+    Spider mixin for callbacks that can run in a ParsePool
+
+    ``await self.offload('parse_page', response)`` runs the named callback
+    in a pool process when ScraperSpiderMiddleware has attached one
+    (PARSE_PROCESSES > 0) and in-line otherwise. Offloaded callbacks must
+    only depend on the response, must yield picklable items, and the
+    spider must be constructible without arguments.
+
+    With timing enabled the callback's own run time, without waiting for
+    the pool, is recorded as ``parse`` (see ScraperSpiderMiddleware).
+    """
+
+    parse_pool = None
+    parse_timing = None
+
+    async def offload(self, callback_name, response):
+        if self.parse_pool is None:
+            started = time.perf_counter()
+            results = list(getattr(self, callback_name)(response) or ())
+            self.record_parse(callback_name, response, time.perf_counter() - started)
+            return results
+        results, elapsed = await maybe_deferred_to_future(self.parse_pool.submit(callback_name, response))
+        self.record_parse(callback_name, response, elapsed)
+        return [
+            request_from_dict(value, spider=self) if kind == 'request' else value
+            for kind, value in results
+        ]
+
+    def record_parse(self, callback_name, response, seconds):
+        if self.parse_timing is not None:
+            domain = urlparse_cached(response).hostname or ''
+            self.parse_timing.observe('parse', seconds, domain=domain, callback=callback_name)
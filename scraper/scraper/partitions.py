@@ -0,0 +1,309 @@
+"""
+Monthly range partitioning of the quotes table
+
+With QUOTES_PARTITIONING=monthly, ``quotes`` is partitioned by
+``scraped_at`` into one table per month (``quotes_p2026_01``, ...) plus
+``quotes_default`` for anything outside the created range, so inserts and
+vacuums only touch the current month's indexes and old months can be
+detached or dropped in one statement.
+
+A unique constraint on a partitioned table has to include the partition
+key, so UNIQUE(title, link) cannot span months. Deduplication moves to
+``quote_keys``: one row per distinct (title, link), keyed by
+``quote_key(title, link)`` (an md5 as uuid), which writers insert into
+first; only rows whose key was new reach ``quotes``.
+"""
+from datetime import date
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 'monthly' makes init_db create (or migrate to) the partitioned layout;
+# writers detect the layout from the catalog, not from this setting
+QUOTES_PARTITIONING = os.getenv('QUOTES_PARTITIONING', 'none').lower()
+QUOTES_PARTITIONS_AHEAD = int(os.getenv('QUOTES_PARTITIONS_AHEAD', 2))
+# Full months kept attached besides the current one; 0 keeps everything
+QUOTES_RETENTION_MONTHS = int(os.getenv('QUOTES_RETENTION_MONTHS', 0))
+QUOTES_RETENTION_ACTION = os.getenv('QUOTES_RETENTION_ACTION', 'detach').lower()
+
+PARTITION_PATTERN = re.compile(r'^quotes_p(\d{4})_(\d{2})$')
+
+CREATE_KEY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION quote_key(title TEXT, link TEXT) RETURNS UUID
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT md5(title || chr(31) || link)::uuid $$
+"""
+
+CREATE_KEYS_TABLE = """
+    CREATE TABLE IF NOT EXISTS quote_keys (
+        key UUID PRIMARY KEY,
+        scraped_at TIMESTAMP NOT NULL
+    )
+"""
+
+CREATE_PARTITIONED_TABLE = """
+    CREATE TABLE quotes (
+        id BIGINT NOT NULL DEFAULT nextval('quotes_id_seq'),
+        title TEXT NOT NULL,
+        link TEXT NOT NULL,
+        scraped_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        run_id BIGINT,
+        search_vector tsvector,
+        PRIMARY KEY (id, scraped_at)
+    ) PARTITION BY RANGE (scraped_at)
+"""
+
+# Created on the parent, so every partition gets them
+PARTITIONED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_quotes_scraped_at_id ON quotes(scraped_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_quotes_run_id ON quotes(run_id)",
+    "CREATE INDEX IF NOT EXISTS idx_quotes_search_vector ON quotes USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS idx_quotes_title_trgm ON quotes USING GIN (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_quotes_link_trgm ON quotes USING GIN (link gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_quote_keys_scraped_at ON quote_keys(scraped_at)",
+]
+
+# Batch insert for the partitioned layout: keys first, then only the rows
+# whose key was new; rows repeated within a batch are collapsed up front
+INSERT_PARTITIONED = """
+    WITH batch AS (
+        SELECT DISTINCT ON (key) key, title, link, scraped_at
+        FROM (
+            SELECT quote_key(title, link) AS key, title, link,
+                   COALESCE(to_timestamp(scraped_epoch) AT TIME ZONE 'UTC', CURRENT_TIMESTAMP) AS scraped_at
+            FROM quotes_staging
+        ) rows
+        ORDER BY key, scraped_at
+    ), new_keys AS (
+        INSERT INTO quote_keys (key, scraped_at)
+        SELECT key, scraped_at FROM batch
+        ON CONFLICT (key) DO NOTHING
+        RETURNING key
+    )
+    INSERT INTO quotes (title, link, scraped_at, run_id)
+    SELECT batch.title, batch.link, batch.scraped_at, %s
+    FROM batch JOIN new_keys USING (key)
+"""
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'quotes_p{month.year:04d}_{month.month:02d}'
+
+
+def first_value(row):
+    # Callers pass both tuple and RealDictCursor cursors
+    if row is None:
+        return None
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def is_partitioned(cursor):
+    """
+    Whether ``quotes`` exists as a partitioned table
+    """
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('quotes')")
+    return first_value(cursor.fetchone()) == 'p'
+
+
+def list_partitions(cursor):
+    """
+    {month: partition name} of the monthly partitions attached to ``quotes``
+    """
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'quotes'::regclass
+    """)
+    partitions = {}
+    for row in cursor.fetchall():
+        name = first_value(row)
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def ensure_partitions(cursor, months_ahead=2, since=None, today=None):
+    """
+    Create any missing monthly partition from ``since`` (default: this
+    month) through ``months_ahead`` months from now
+
+    Rows for a month that already sit in ``quotes_default`` (written
+    before its partition existed) are moved into the new partition, which
+    a plain CREATE ... PARTITION OF would refuse. Returns the names of
+    the partitions created.
+    """
+    first = month_start(today or date.today())
+    month = month_start(since) if since else first
+    last = add_months(first, months_ahead)
+    existing = list_partitions(cursor)
+    created = []
+    while month <= last:
+        if month not in existing:
+            name = partition_name(month)
+            cursor.execute("SAVEPOINT create_partition")
+            try:
+                create_partition(cursor, name, month)
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT create_partition")
+                logger.error(f"Could not create partition {name}: {e}")
+            else:
+                cursor.execute("RELEASE SAVEPOINT create_partition")
+                created.append(name)
+        month = add_months(month, 1)
+    if created:
+        logger.info(f"Created quotes partitions: {', '.join(created)}")
+    return created
+
+
+def create_partition(cursor, name, month):
+    bounds = (month, add_months(month, 1))
+    cursor.execute("SELECT to_regclass('quotes_default') IS NOT NULL")
+    if first_value(cursor.fetchone()):
+        # Keep writers from adding rows for the month between the move
+        # and the attach; other partitions stay writable
+        cursor.execute("LOCK TABLE quotes_default IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM quotes_default WHERE scraped_at >= %s AND scraped_at < %s)", bounds
+        )
+        if first_value(cursor.fetchone()):
+            cursor.execute(f"CREATE TABLE {name} (LIKE quotes INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(f"""
+                WITH moved AS (
+                    DELETE FROM quotes_default WHERE scraped_at >= %s AND scraped_at < %s
+                    RETURNING id, title, link, scraped_at, run_id, search_vector
+                )
+                INSERT INTO {name} (id, title, link, scraped_at, run_id, search_vector)
+                SELECT * FROM moved
+            """, bounds)
+            moved = cursor.rowcount
+            cursor.execute(f"ALTER TABLE quotes ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+            logger.warning(f"Moved {moved} quotes from quotes_default into {name}")
+            return
+    cursor.execute(f"CREATE TABLE {name} PARTITION OF quotes FOR VALUES FROM (%s) TO (%s)", bounds)
+
+
+def apply_retention(cursor, keep_months, action='detach', today=None):
+    """
+    Remove monthly partitions older than ``keep_months`` full months
+
+    'detach' turns them into standalone tables (kept for archival; their
+    keys stay in quote_keys so those quotes are not stored again), 'drop'
+    deletes them along with their keys. Returns the partitions removed.
+    """
+    if keep_months <= 0:
+        return []
+    if action not in ('detach', 'drop'):
+        raise ValueError(f"Unknown retention action {action!r}, expected detach or drop")
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    removed = []
+    for month, name in sorted(list_partitions(cursor).items()):
+        if month >= cutoff:
+            continue
+        if action == 'drop':
+            cursor.execute(f"DROP TABLE {name}")
+            cursor.execute(
+                "DELETE FROM quote_keys WHERE scraped_at >= %s AND scraped_at < %s",
+                (month, add_months(month, 1))
+            )
+        else:
+            cursor.execute(f"ALTER TABLE quotes DETACH PARTITION {name}")
+        removed.append(name)
+    if removed:
+        logger.info(f"Retention ({action}, keep {keep_months} months): {', '.join(removed)}")
+    return removed
+
+
+def create_partitioned_schema(cursor, months_ahead=2):
+    """
+    Create the partitioned ``quotes`` layout, migrating a plain table
+
+    An existing unpartitioned ``quotes`` is renamed to
+    ``quotes_unpartitioned`` (indexes included) and copied over; it is
+    left in place to be dropped once the copy has been checked. Run as
+    schema migration 7, which also adds the search_vector trigger.
+    """
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cursor.execute(CREATE_KEY_FUNCTION)
+    cursor.execute(CREATE_KEYS_TABLE)
+    cursor.execute("CREATE SEQUENCE IF NOT EXISTS quotes_id_seq AS BIGINT")
+    # The plain table's SERIAL sequence already exists as an integer one
+    cursor.execute("ALTER SEQUENCE quotes_id_seq AS BIGINT")
+
+    if is_partitioned(cursor):
+        migrate_from = None
+    else:
+        cursor.execute("SELECT to_regclass('quotes') IS NOT NULL")
+        migrate_from = 'quotes_unpartitioned' if first_value(cursor.fetchone()) else None
+        if migrate_from:
+            rename_plain_table(cursor, migrate_from)
+        cursor.execute(CREATE_PARTITIONED_TABLE)
+        cursor.execute("ALTER SEQUENCE quotes_id_seq OWNED BY quotes.id")
+        cursor.execute("CREATE TABLE IF NOT EXISTS quotes_default PARTITION OF quotes DEFAULT")
+
+    for statement in PARTITIONED_INDEXES:
+        cursor.execute(statement)
+
+    since = None
+    if migrate_from:
+        cursor.execute(f"SELECT MIN(scraped_at) FROM {migrate_from}")
+        since = first_value(cursor.fetchone())
+    ensure_partitions(cursor, months_ahead, since=since)
+
+    if migrate_from:
+        copy_plain_table(cursor, migrate_from)
+
+
+def rename_plain_table(cursor, new_name):
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'quotes'")
+    indexes = [first_value(row) for row in cursor.fetchall()]
+    cursor.execute(f"ALTER TABLE quotes RENAME TO {new_name}")
+    # Free the index names for the partitioned table; the SERIAL sequence
+    # (quotes_id_seq) is taken over by the new id column
+    for index in indexes:
+        cursor.execute(f"ALTER INDEX {index} RENAME TO {index}_unpartitioned")
+    logger.info(f"Renamed unpartitioned quotes table to {new_name}")
+
+
+def copy_plain_table(cursor, source):
+    cursor.execute(f"""
+        INSERT INTO quotes (id, title, link, scraped_at, run_id, search_vector)
+        SELECT id, title, link, COALESCE(scraped_at, CURRENT_TIMESTAMP), run_id,
+               COALESCE(search_vector, quotes_search_vector(title, link))
+        FROM {source}
+    """)
+    copied = cursor.rowcount
+    cursor.execute(f"""
+        INSERT INTO quote_keys (key, scraped_at)
+        SELECT quote_key(title, link), COALESCE(scraped_at, CURRENT_TIMESTAMP)
+        FROM {source}
+        ON CONFLICT (key) DO NOTHING
+    """)
+    cursor.execute("SELECT setval('quotes_id_seq', GREATEST((SELECT MAX(id) FROM quotes), 1))")
+    logger.info(f"Copied {copied} quotes from {source} into the partitioned table")
+
+
+def maintain(cursor, months_ahead=QUOTES_PARTITIONS_AHEAD, keep_months=QUOTES_RETENTION_MONTHS,
+             action=QUOTES_RETENTION_ACTION):
+    """
+    Periodic upkeep: create upcoming partitions and apply retention
+
+    Returns None when ``quotes`` is not partitioned.
+    """
+    if not is_partitioned(cursor):
+        return None
+    return {
+        'created': ensure_partitions(cursor, months_ahead),
+        'removed': apply_retention(cursor, keep_months, action),
+    }
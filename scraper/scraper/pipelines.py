@@ -1,6 +1,14 @@
 import psycopg2
+import redis
 from psycopg2.extras import RealDictCursor
-from datetime import datetime
+from itemadapter import ItemAdapter
+from scraper.items import CompactQuoteItem, to_epoch
+from scraper import migrations, partitions
+from twisted.enterprise import adbapi
+from twisted.internet import defer, task, threads
+import csv
+import io
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,49 +17,89 @@ logger = logging.getLogger(__name__)
 class PostgresPipeline:
     """
     Pipeline to store scraped items in PostgreSQL
+
+    Items are buffered in memory and written in batches: each flush COPYs
+    the buffer into a temporary staging table and moves it into ``quotes``
+    with a single ``INSERT ... SELECT ... ON CONFLICT DO NOTHING``. When
+    ``quotes`` is partitioned by month (see scraper.partitions) the
+    upcoming partitions are created on open and duplicates are resolved
+    against ``quote_keys`` instead. A row the database rejects (bad data,
+    a NULL title) only loses itself: the batch is split in halves until
+    the offending rows are isolated.
+
+    The schema itself is owned by scraper.migrations: opening the spider
+    only checks the recorded schema version, and fails if the database
+    was not migrated unless SCHEMA_AUTO_MIGRATE is set.
     """
 
-    def __init__(self, db_config):
+    def __init__(self, db_config, batch_size=500, flush_interval=5.0, stats=None,
+                 redis_url=None, generation_key='quotes:generation', metrics_key='metrics:pipeline',
+                 partitions_ahead=2, auto_migrate=False):
         self.db_config = db_config
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self.redis_url = redis_url
+        self.generation_key = generation_key
+        self.metrics_key = metrics_key
+        self.partitions_ahead = partitions_ahead
+        self.auto_migrate = auto_migrate
+        self.partitioned = False
+        self.seen_dropped = 0
+        self.spider = None
+        self.redis = None
         self.connection = None
         self.cursor = None
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.flush_task = None
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            db_config=crawler.settings.get('DATABASE_CONFIG')
+            db_config=crawler.settings.get('DATABASE_CONFIG'),
+            batch_size=crawler.settings.getint('POSTGRES_BATCH_SIZE', 500),
+            flush_interval=crawler.settings.getfloat('POSTGRES_FLUSH_INTERVAL', 5.0),
+            stats=crawler.stats,
+            redis_url=crawler.settings.get('REDIS_URL'),
+            generation_key=crawler.settings.get('CACHE_GENERATION_KEY', 'quotes:generation'),
+            metrics_key=crawler.settings.get('METRICS_PIPELINE_KEY', 'metrics:pipeline'),
+            partitions_ahead=crawler.settings.getint('QUOTES_PARTITIONS_AHEAD', 2),
+            auto_migrate=crawler.settings.getbool('SCHEMA_AUTO_MIGRATE', False)
         )
 
     def open_spider(self, spider):
         """
         Initialize database connection when spider opens
         """
+        self.spider = spider
         try:
             self.connection = psycopg2.connect(**self.db_config)
             self.cursor = self.connection.cursor(cursor_factory=RealDictCursor)
             logger.info("Database connection established")
-            
-            # Create table if not exists
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS quotes (
-                    id SERIAL PRIMARY KEY,
-                    title TEXT NOT NULL,
-                    link TEXT NOT NULL,
-                    scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(title, link)
-                )
-            """)
+
+            self.prepare_schema(self.cursor)
+            self.prepare_connection(self.connection)
             self.connection.commit()
             logger.info("Quotes table ready")
-            
+
         except Exception as e:
             logger.error(f"Failed to connect to database: {e}")
             raise
 
+        # Flush partially filled buffers when items arrive slowly
+        if self.flush_interval > 0:
+            self.flush_task = task.LoopingCall(self.flush_if_due)
+            self.flush_task.start(self.flush_interval, now=False)
+
     def close_spider(self, spider):
         """
-        Close database connection when spider closes
+        Flush pending items and close database connection when spider closes
         """
+        if self.flush_task and self.flush_task.running:
+            self.flush_task.stop()
+        if self.connection:
+            self.flush()
         if self.cursor:
             self.cursor.close()
         if self.connection:
@@ -60,23 +108,339 @@ class PostgresPipeline:
 
     def process_item(self, item, spider):
         """
-        Process and store each scraped item
+        Buffer each scraped item and flush when the batch is full
+        """
+        self.buffer.append(self.quote_row(item))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+        return item
+
+    @staticmethod
+    def quote_row(item):
+        """
+        (title, link, epoch seconds) for any supported item type
+        """
+        if type(item) is CompactQuoteItem:
+            return (item.title, item.link, item.scraped_at)
+        adapter = ItemAdapter(item)
+        scraped_at = to_epoch(adapter.get('scraped_at'))
+        return (adapter.get('title'), adapter.get('link'), int(time.time()) if scraped_at is None else scraped_at)
+
+    def prepare_schema(self, cursor):
+        """
+        Check the schema version and, if quotes is partitioned, make sure
+        the partitions for the coming months exist
+        """
+        try:
+            migrations.check_version(cursor)
+        except migrations.SchemaVersionError:
+            if not self.auto_migrate:
+                raise
+            # Only the required migrations: converting to partitions is
+            # left to init_db
+            migrations.migrate(self.db_config, migrations.SCHEMA_VERSION)
+        self.partitioned = partitions.is_partitioned(cursor)
+        if self.partitioned:
+            partitions.ensure_partitions(cursor, self.partitions_ahead)
+
+    @staticmethod
+    def prepare_connection(connection):
+        """
+        Create the per-session staging table used by batched writes
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS quotes_staging (
+                    title TEXT,
+                    link TEXT,
+                    scraped_epoch BIGINT
+                ) ON COMMIT DELETE ROWS
+            """)
+        connection.commit()
+
+    @property
+    def run_id(self):
+        # Set by CrawlRunRecorder once the run is registered
+        return getattr(self.spider, 'run_id', None)
+
+    @staticmethod
+    def write_batch(cursor, rows, run_id=None, partitioned=False):
+        """
+        COPY rows into the staging table and insert the new ones into quotes
+
+        New rows are tagged with ``run_id``; rows that already exist keep
+        the run that first stored them. Returns the number of rows actually
+        inserted.
+        """
+        data = io.StringIO()
+        writer = csv.writer(data)
+        writer.writerows(rows)
+        data.seek(0)
+
+        cursor.copy_expert(
+            "COPY quotes_staging (title, link, scraped_epoch) FROM STDIN WITH (FORMAT csv)",
+            data
+        )
+        if partitioned:
+            cursor.execute(partitions.INSERT_PARTITIONED, (run_id,))
+            return cursor.rowcount
+        cursor.execute("""
+            INSERT INTO quotes (title, link, scraped_at, run_id)
+            SELECT title, link,
+                   COALESCE(to_timestamp(scraped_epoch) AT TIME ZONE 'UTC', CURRENT_TIMESTAMP),
+                   %s
+            FROM quotes_staging
+            ON CONFLICT (title, link) DO NOTHING
+        """, (run_id,))
+        return cursor.rowcount
+
+    @classmethod
+    def write_rows(cls, cursor, rows, run_id=None, partitioned=False):
+        """
+        write_batch inside a savepoint, bisecting batches the database
+        rejects down to the offending rows
+
+        Returns (rows inserted, [(row, error)] for every rejected row).
+        Errors that are not about the data, such as a lost connection,
+        are raised and fail the whole batch.
+        """
+        cursor.execute("SAVEPOINT quotes_batch")
+        try:
+            inserted = cls.write_batch(cursor, rows, run_id, partitioned)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT quotes_batch")
+            if len(rows) == 1:
+                return 0, [(rows[0], e)]
+            middle = len(rows) // 2
+            first_inserted, first_rejected = cls.write_rows(cursor, rows[:middle], run_id, partitioned)
+            # Rows of a written half stay staged until commit
+            cursor.execute("DELETE FROM quotes_staging")
+            second_inserted, second_rejected = cls.write_rows(cursor, rows[middle:], run_id, partitioned)
+            cursor.execute("DELETE FROM quotes_staging")
+            return first_inserted + second_inserted, first_rejected + second_rejected
+        cursor.execute("RELEASE SAVEPOINT quotes_batch")
+        return inserted, []
+
+    def flush_if_due(self):
+        """
+        Flush the buffer if it has been waiting longer than the flush interval
+        """
+        if self.buffer and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered items to the database in one transaction
         """
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+
+        rows, self.buffer = self.buffer, []
+        started = time.perf_counter()
         try:
-            self.cursor.execute("""
-                INSERT INTO quotes (title, link, scraped_at)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (title, link) DO NOTHING
-            """, (
-                item.get('title'),
-                item.get('link'),
-                item.get('scraped_at', datetime.utcnow())
-            ))
+            inserted, rejected = self.write_rows(self.cursor, rows, self.run_id, self.partitioned)
             self.connection.commit()
-            logger.info(f"Stored item: {item.get('title')}")
-            
         except Exception as e:
-            logger.error(f"Error storing item: {e}")
             self.connection.rollback()
-            
-        return item
\ No newline at end of file
+            self.record_failure(len(rows), e)
+            return
+
+        self.record_written(len(rows), (inserted, rejected), time.perf_counter() - started)
+
+    def record_written(self, sent, result, elapsed):
+        """
+        Record a committed flush and the rows the database rejected in it
+        """
+        inserted, rejected = result
+        if rejected:
+            self.record_rejected(rejected)
+        self.record_flush(sent - len(rejected), inserted, elapsed)
+
+    def record_flush(self, sent, inserted, elapsed):
+        """
+        Push per-flush counters into the Scrapy stats collector
+        """
+        elapsed_ms = int(elapsed * 1000)
+        self.inc_stat('postgres/flushes')
+        self.inc_stat('postgres/rows_sent', sent)
+        self.inc_stat('postgres/rows_inserted', inserted)
+        self.inc_stat('postgres/rows_duplicate', sent - inserted)
+        self.inc_stat('postgres/flush_time_ms', elapsed_ms)
+        if self.stats:
+            self.stats.max_value('postgres/flush_time_ms_max', elapsed_ms)
+        logger.info(
+            f"Flushed {sent} items ({inserted} new, {sent - inserted} duplicates) "
+            f"in {elapsed_ms} ms"
+        )
+        self.publish({
+            'flushes': 1,
+            'rows_sent': sent,
+            'rows_inserted': inserted,
+            'rows_duplicate': sent - inserted,
+            'seen_filter_dropped': self.seen_filter_delta(),
+            'flush_seconds': round(elapsed, 6)
+        }, bump_generation=bool(inserted))
+
+    def seen_filter_delta(self):
+        """
+        Items SeenItemFilterPipeline dropped since the previous flush
+        """
+        if not self.stats:
+            return 0
+        total = self.stats.get_value('seen_filter/items_dropped', 0)
+        delta, self.seen_dropped = total - self.seen_dropped, total
+        return delta
+
+    def publish(self, counters, bump_generation=False):
+        """
+        Add flush counters to the metrics hash the API exports on /metrics
+        and, when rows were inserted, bump the data generation so the API
+        stops serving cached responses; both in one round-trip
+        """
+        if not self.redis_url:
+            return
+        try:
+            if self.redis is None:
+                self.redis = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+            pipe = self.redis.pipeline(transaction=False)
+            for field, value in counters.items():
+                if value:
+                    pipe.hincrbyfloat(self.metrics_key, field, value)
+            if bump_generation:
+                pipe.incr(self.generation_key)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to publish pipeline metrics: {e}")
+
+    def record_rejected(self, rejected):
+        for (title, link, _), error in rejected:
+            logger.error(f"Rejected item {str(title)[:80]!r} ({link}): {str(error).strip()}")
+        self.inc_stat('postgres/rows_rejected', len(rejected))
+        self.inc_stat('postgres/rows_failed', len(rejected))
+        self.publish({'rows_failed': len(rejected)})
+
+    def record_failure(self, sent, error):
+        logger.error(f"Error storing batch of {sent} items: {error}")
+        self.inc_stat('postgres/flush_errors')
+        self.inc_stat('postgres/rows_failed', sent)
+        self.publish({'flush_errors': 1, 'rows_failed': sent})
+
+    def inc_stat(self, key, count=1):
+        if self.stats:
+            self.stats.inc_value(key, count)
+
+
+class AsyncPostgresPipeline(PostgresPipeline):
+    """
+    Non-blocking variant of PostgresPipeline
+
+    Flushes run on a bounded twisted adbapi connection pool instead of the
+    reactor thread. Once POSTGRES_MAX_PENDING_FLUSHES flushes are in flight,
+    process_item returns a Deferred that only fires when one of them
+    completes, so Scrapy stops feeding items until the database catches up.
+    """
+
+    def __init__(self, *args, pool_size=2, max_pending=4, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_size = max(1, pool_size)
+        self.max_pending = max(1, max_pending)
+        self.dbpool = None
+        self.pending = []
+        self.waiters = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = super().from_crawler(crawler)
+        pipeline.pool_size = max(1, crawler.settings.getint('POSTGRES_POOL_SIZE', 2))
+        pipeline.max_pending = max(1, crawler.settings.getint('POSTGRES_MAX_PENDING_FLUSHES', 4))
+        return pipeline
+
+    def open_spider(self, spider):
+        """
+        Start the connection pool and create the table off the reactor thread
+        """
+        self.spider = spider
+        self.dbpool = adbapi.ConnectionPool(
+            'psycopg2',
+            cp_min=1,
+            cp_max=self.pool_size,
+            cp_openfun=self.prepare_connection,
+            cp_noisy=False,
+            cp_reconnect=True,
+            **self.db_config
+        )
+        logger.info(f"Database connection pool started (max {self.pool_size} connections)")
+
+        if self.flush_interval > 0:
+            self.flush_task = task.LoopingCall(self.flush_if_due)
+            self.flush_task.start(self.flush_interval, now=False)
+
+        d = self.dbpool.runInteraction(self.prepare_schema)
+        d.addCallback(lambda _: logger.info("Quotes table ready"))
+        return d
+
+    @defer.inlineCallbacks
+    def close_spider(self, spider):
+        """
+        Flush pending items, wait for in-flight writes and close the pool
+        """
+        if self.flush_task and self.flush_task.running:
+            self.flush_task.stop()
+        if self.dbpool:
+            self.flush()
+            yield defer.DeferredList(list(self.pending))
+            self.dbpool.close()
+        logger.info("Database connection pool closed")
+
+    def process_item(self, item, spider):
+        """
+        Buffer each item and apply backpressure while too many flushes are pending
+        """
+        super().process_item(item, spider)
+
+        if len(self.pending) < self.max_pending:
+            return item
+
+        self.inc_stat('postgres/backpressure_waits')
+        waiter = defer.Deferred()
+        waiter.addCallback(lambda _: item)
+        self.waiters.append(waiter)
+        return waiter
+
+    def flush(self):
+        """
+        Hand all buffered items to the connection pool as one transaction
+        """
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return defer.succeed(None)
+
+        rows, self.buffer = self.buffer, []
+        started = time.perf_counter()
+        d = self.dbpool.runInteraction(self.write_rows, rows, self.run_id, self.partitioned)
+        self.pending.append(d)
+        if self.stats:
+            self.stats.max_value('postgres/pending_flushes_max', len(self.pending))
+
+        d.addCallbacks(
+            lambda result: self.record_written(len(rows), result, time.perf_counter() - started),
+            lambda failure: self.record_failure(len(rows), failure.value)
+        )
+        d.addBoth(self.flush_done, d)
+        return d
+
+    def publish(self, counters, bump_generation=False):
+        """
+        Publish from a thread so Redis never blocks the reactor
+        """
+        threads.deferToThread(super().publish, counters, bump_generation)
+
+    def flush_done(self, result, d):
+        """
+        Forget a completed flush and release items waiting on backpressure
+        """
+        self.pending.remove(d)
+        while self.waiters and len(self.pending) < self.max_pending:
+            self.waiters.pop(0).callback(None)
@@ -0,0 +1,141 @@
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import threads
+import psycopg2
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def run_summary(stats):
+    """
+    crawl_runs columns taken from a Scrapy stats dump
+    """
+    return {
+        'items_scraped': stats.get('item_scraped_count', 0),
+        'items_inserted': stats.get('postgres/rows_inserted', 0),
+        'items_duplicate': stats.get('postgres/rows_duplicate', 0) + stats.get('seen_filter/items_dropped', 0),
+        'items_dropped': stats.get('item_dropped_count', 0),
+        'pages': stats.get('response_received_count', 0),
+        'bytes': stats.get('downloader/response_bytes', 0),
+        'errors': stats.get('log_count/ERROR', 0),
+        'download_errors': stats.get('downloader/exception_count', 0),
+    }
+
+
+class CrawlRunStore:
+    """
+    One row per crawl in ``crawl_runs`` (created by scraper.migrations)
+    """
+
+    def __init__(self, db_config):
+        self.db_config = db_config
+
+    def start(self, spider_name, task_id=None):
+        """
+        Insert a running crawl and return its id
+        """
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO crawl_runs (spider, task_id) VALUES (%s, %s) RETURNING id",
+                    (spider_name, task_id)
+                )
+                run_id = cursor.fetchone()[0]
+            conn.commit()
+        finally:
+            conn.close()
+        return run_id
+
+    def finish(self, run_id, reason, stats):
+        summary = run_summary(stats)
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE crawl_runs SET
+                        status = %(status)s,
+                        finish_reason = %(reason)s,
+                        finished_at = NOW() AT TIME ZONE 'UTC',
+                        duration_seconds = EXTRACT(EPOCH FROM (NOW() AT TIME ZONE 'UTC') - started_at),
+                        items_scraped = %(items_scraped)s,
+                        items_inserted = %(items_inserted)s,
+                        items_duplicate = %(items_duplicate)s,
+                        items_dropped = %(items_dropped)s,
+                        pages = %(pages)s,
+                        bytes = %(bytes)s,
+                        errors = %(errors)s,
+                        download_errors = %(download_errors)s,
+                        stats = %(stats)s
+                    WHERE id = %(run_id)s
+                """, {
+                    **summary,
+                    'status': 'finished' if reason == 'finished' else 'failed',
+                    'reason': reason,
+                    'stats': json.dumps(stats, default=str),
+                    'run_id': run_id
+                })
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class CrawlRunRecorder:
+    """
+    Record every crawl in ``crawl_runs``
+
+    The row is inserted when the spider opens, before any item is
+    scraped, and its id is set as ``spider.run_id`` so PostgresPipeline can
+    tag the quotes it inserts. The row is completed from the stats dump
+    once the engine has stopped: spider_closed handlers of middlewares
+    (connected after extensions, e.g. the timing summary) and the stats
+    collector itself are done by then. A crawl that dies without closing
+    stays 'running'.
+    """
+
+    def __init__(self, crawler, store, task_id=None):
+        self.crawler = crawler
+        self.store = store
+        self.task_id = task_id
+        self.run_id = None
+        self.reason = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('CRAWL_RUNS_ENABLED', True):
+            raise NotConfigured
+        db_config = crawler.settings.get('DATABASE_CONFIG')
+        if not db_config:
+            raise NotConfigured
+        ext = cls(crawler, CrawlRunStore(db_config), task_id=crawler.settings.get('CRAWL_TASK_ID'))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.engine_stopped, signal=signals.engine_stopped)
+        return ext
+
+    def spider_opened(self, spider):
+        d = threads.deferToThread(self.store.start, spider.name, self.task_id)
+        d.addCallbacks(self.started, self.start_failed, callbackArgs=(spider,))
+        return d
+
+    def started(self, run_id, spider):
+        self.run_id = spider.run_id = run_id
+        self.crawler.stats.set_value('crawl_run_id', run_id)
+        logger.info(f"Crawl run {run_id} started")
+
+    def start_failed(self, failure):
+        logger.warning(f"Could not record crawl run: {failure.value}")
+
+    def spider_closed(self, spider, reason):
+        self.reason = reason
+
+    def engine_stopped(self):
+        if self.run_id is None or self.reason is None:
+            return
+        run_id, self.run_id = self.run_id, None
+        stats = dict(self.crawler.stats.get_stats())
+        d = threads.deferToThread(self.store.finish, run_id, self.reason, stats)
+        d.addErrback(lambda failure: logger.warning(f"Could not complete crawl run {run_id}: {failure.value}"))
+        return d
@@ -0,0 +1,354 @@
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.request import request_from_dict
+import redis
+import pickle
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pops the highest-priority request of the first domain whose politeness
+# delay has expired, and leases it to the caller in one round-trip.
+#   KEYS: slots zset, processing zset, leases hash
+#   ARGV: now, domain delay, lease deadline, lease id, queue key prefix
+POP_SCRIPT = """
+local slots = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 16)
+for _, slot in ipairs(slots) do
+    local queue = ARGV[5] .. slot
+    local popped = redis.call('ZPOPMIN', queue)
+    if #popped > 0 then
+        redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + tonumber(ARGV[2]), slot)
+        redis.call('ZADD', KEYS[2], ARGV[3], ARGV[4])
+        redis.call('HSET', KEYS[3], ARGV[4], popped[1])
+        return popped[1]
+    end
+    -- Empty and its delay has passed, so forgetting the slot is safe
+    redis.call('ZREM', KEYS[1], slot)
+end
+return false
+"""
+
+# Registers a worker, first clearing the crawl's keys when asked to and no
+# other worker is live, so a reset can never pull the frontier out from
+# under a running crawl.
+#   KEYS: workers zset, slots zset, then the fixed keys to clear
+#   ARGV: now, worker id, worker deadline, reset flag, queue key prefix
+REGISTER_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local reset = 0
+if ARGV[4] == '1' and redis.call('ZCARD', KEYS[1]) == 0 then
+    for _, slot in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+        redis.call('DEL', ARGV[5] .. slot)
+    end
+    redis.call('DEL', unpack(KEYS, 2))
+    reset = 1
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+return reset
+"""
+
+# Seconds a worker stays registered without a heartbeat
+WORKER_TIMEOUT = 60
+
+
+class RedisDupeFilter(BaseDupeFilter):
+    """
+    Request fingerprint filter shared by every process crawling a spider
+    """
+
+    def __init__(self, server, key, fingerprinter, debug=False):
+        self.server = server
+        self.key = key
+        self.fingerprinter = fingerprinter
+        self.debug = debug
+
+    def request_seen(self, request):
+        fingerprint = self.fingerprinter.fingerprint(request).hex()
+        return self.server.sadd(self.key, fingerprint) == 0
+
+    def clear(self):
+        self.server.delete(self.key)
+
+    def log(self, request, spider):
+        if self.debug:
+            logger.debug(f"Filtered duplicate request: {request}")
+        spider.crawler.stats.inc_value('dupefilter/filtered', spider=spider)
+
+
+class RedisScheduler(BaseScheduler):
+    """
+    Crawl frontier stored in Redis so several processes can share one crawl
+
+    Requests are kept in one priority queue per domain (download slot).
+    A domain is only popped again SCHEDULER_DOMAIN_DELAY seconds after its
+    last pop, across all processes. Popped requests are leased rather than
+    removed. A lease is released once the engine is done with the request,
+    i.e. after the callback's requests have been enqueued, so a worker
+    parsing a page keeps the others from finishing and a worker that dies
+    mid-parse loses nothing. Live workers keep extending their leases;
+    leases older than SCHEDULER_LEASE_TIMEOUT belong to a dead process and
+    are put back in the queue.
+
+    Start requests are filtered through the shared dupefilter even though
+    Scrapy marks them ``dont_filter``, so every process can be started with
+    the same spider arguments without seeding the crawl twice.
+
+    A worker finds nothing to do only once the queues are empty and no
+    lease is held, and then still waits SCHEDULER_IDLE_GRACE seconds for
+    new requests before closing. Keys are never deleted when a crawl
+    closes: a crawl that crashed or was shut down resumes where it left
+    off, and a new crawl of the same spider starts with SCHEDULER_RESET,
+    which clears them only if no other worker is registered.
+    """
+
+    def __init__(self, crawler, server, key_prefix='crawl', domain_delay=0.0,
+                 lease_timeout=300, idle_grace=10.0, reset=False, dedup_seeds=True):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.server = server
+        self.key_prefix = key_prefix
+        self.domain_delay = domain_delay
+        self.lease_timeout = lease_timeout
+        self.idle_grace = idle_grace
+        self.reset = reset
+        self.dedup_seeds = dedup_seeds
+        self.pop_script = server.register_script(POP_SCRIPT)
+        self.register_script = server.register_script(REGISTER_SCRIPT)
+        self.worker_id = uuid.uuid4().hex
+        self.spider = None
+        self.df = None
+        self.wakeup = None
+        self.next_heartbeat = 0.0
+        self.last_busy = 0.0
+        # lease id -> request, for requests this process has popped
+        self.leased = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        scheduler = cls(
+            crawler,
+            server=redis.Redis.from_url(settings.get('REDIS_URL')),
+            key_prefix=settings.get('SCHEDULER_KEY_PREFIX', 'crawl'),
+            domain_delay=settings.getfloat('SCHEDULER_DOMAIN_DELAY', settings.getfloat('DOWNLOAD_DELAY')),
+            lease_timeout=settings.getint('SCHEDULER_LEASE_TIMEOUT', 300),
+            idle_grace=settings.getfloat('SCHEDULER_IDLE_GRACE', 10.0),
+            reset=settings.getbool('SCHEDULER_RESET'),
+            dedup_seeds=settings.getbool('SCHEDULER_DEDUP_SEEDS', True)
+        )
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    def key(self, name):
+        return f'{self.key_prefix}:{self.spider.name}:{name}'
+
+    def open(self, spider):
+        self.spider = spider
+        self.df = RedisDupeFilter(
+            self.server,
+            self.key('dupefilter'),
+            self.crawler.request_fingerprinter,
+            debug=self.crawler.settings.getbool('DUPEFILTER_DEBUG')
+        )
+        now = time.time()
+        reset = self.register_script(
+            keys=[self.key('workers'), self.key('slots'), self.key('processing'),
+                  self.key('leases'), self.key('dupefilter')],
+            args=[now, self.worker_id, now + WORKER_TIMEOUT, int(self.reset), self.key('queue:')]
+        )
+        if reset:
+            logger.info("Cleared the previous crawl's queue and dupefilter")
+        elif self.reset:
+            logger.warning("Not resetting the crawl: other workers are still registered")
+        self.last_busy = now
+        recovered = self.heartbeat(now)
+        pending = len(self)
+        if pending or recovered:
+            logger.info(f"Joining crawl with {pending} queued requests ({recovered} recovered)")
+
+    def close(self, reason):
+        if self.wakeup and self.wakeup.active():
+            self.wakeup.cancel()
+        self.release_finished()
+        # The engine drains in-progress requests before closing the
+        # scheduler; anything still leased was never processed
+        for lease_id, request in list(self.leased.items()):
+            self.push(request)
+            self.release(lease_id)
+        self.server.zrem(self.key('workers'), self.worker_id)
+
+    def clear(self):
+        """
+        Delete the crawl's queue, leases and dupefilter, whoever is using them
+        """
+        slots = self.server.zrange(self.key('slots'), 0, -1)
+        keys = [self.key(f'queue:{slot.decode()}') for slot in slots]
+        keys += [self.key('slots'), self.key('processing'), self.key('leases'), self.key('dupefilter')]
+        self.server.delete(*keys)
+
+    def slot_for(self, request):
+        return request.meta.get('download_slot') or urlparse_cached(request).hostname or ''
+
+    def is_seed(self, request):
+        meta = request.meta
+        return not meta.get('retry_times') and not meta.get('redirect_times')
+
+    def enqueue_request(self, request):
+        check = not request.dont_filter or (self.dedup_seeds and self.is_seed(request))
+        if check and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            return False
+
+        self.push(request)
+        self.stats.inc_value('scheduler/enqueued/redis', spider=self.spider)
+        self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+        return True
+
+    def push(self, request):
+        slot = self.slot_for(request)
+        data = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        pipe = self.server.pipeline()
+        pipe.zadd(self.key(f'queue:{slot}'), {data: -request.priority})
+        pipe.zadd(self.key('slots'), {slot: time.time()}, nx=True)
+        pipe.execute()
+
+    def next_request(self):
+        now = time.time()
+        self.release_finished()
+        if now >= self.next_heartbeat:
+            self.heartbeat(now)
+
+        lease_id = uuid.uuid4().hex
+        data = self.pop_script(
+            keys=[self.key('slots'), self.key('processing'), self.key('leases')],
+            args=[now, self.domain_delay, now + self.lease_timeout, lease_id, self.key('queue:')]
+        )
+        if data is None:
+            self.schedule_wakeup(now)
+            return None
+
+        request = request_from_dict(pickle.loads(data), spider=self.spider)
+        request.meta['scheduler_lease'] = lease_id
+        self.leased[lease_id] = request
+        self.last_busy = now
+        self.stats.inc_value('scheduler/dequeued/redis', spider=self.spider)
+        self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        return request
+
+    def schedule_wakeup(self, now):
+        """
+        Poke the engine when the next domain comes off its politeness delay
+
+        The engine otherwise only retries on its 5 second heartbeat.
+        """
+        if self.wakeup and self.wakeup.active():
+            return
+        earliest = self.server.zrange(self.key('slots'), 0, 0, withscores=True)
+        if not earliest:
+            return
+        from twisted.internet import reactor
+        delay = min(max(earliest[0][1] - now, 0.05), 5.0)
+        self.wakeup = reactor.callLater(delay, self.wake_engine)
+
+    def wake_engine(self):
+        engine = self.crawler.engine
+        if engine and engine.slot:
+            engine.slot.nextcall.schedule()
+
+    def release_finished(self):
+        """
+        Release the leases of requests the engine is done with
+
+        The engine keeps a request in its slot until the download and the
+        callback, including enqueuing the requests it returned, have
+        finished, successfully or not.
+        """
+        engine = self.crawler.engine
+        if not self.leased or engine is None or engine.slot is None:
+            return
+        in_progress = engine.slot.inprogress
+        finished = [lease_id for lease_id, request in self.leased.items() if request not in in_progress]
+        if finished:
+            self.release(*finished)
+
+    def release(self, *lease_ids):
+        pipe = self.server.pipeline()
+        pipe.zrem(self.key('processing'), *lease_ids)
+        pipe.hdel(self.key('leases'), *lease_ids)
+        pipe.execute()
+        for lease_id in lease_ids:
+            self.leased.pop(lease_id, None)
+
+    def heartbeat(self, now):
+        """
+        Keep this worker registered and its leases from expiring, and
+        re-queue the leases of workers that stopped
+        """
+        self.next_heartbeat = now + min(max(self.lease_timeout / 4, 1), WORKER_TIMEOUT / 4)
+        pipe = self.server.pipeline()
+        pipe.zadd(self.key('workers'), {self.worker_id: now + WORKER_TIMEOUT})
+        if self.leased:
+            pipe.zadd(self.key('processing'), {lease_id: now + self.lease_timeout for lease_id in self.leased},
+                      xx=True)
+        pipe.execute()
+        return self.recover_expired_leases(now)
+
+    def recover_expired_leases(self, now):
+        """
+        Put requests leased by processes that stopped responding back in the queue
+        """
+        expired = self.server.zrangebyscore(self.key('processing'), '-inf', now)
+        recovered = 0
+        for lease_id in expired:
+            # Only the process whose ZREM succeeds re-queues the request
+            if not self.server.zrem(self.key('processing'), lease_id):
+                continue
+            data = self.server.hget(self.key('leases'), lease_id)
+            self.server.hdel(self.key('leases'), lease_id)
+            if data:
+                self.push(request_from_dict(pickle.loads(data), spider=self.spider))
+                recovered += 1
+        if recovered:
+            logger.warning(f"Re-queued {recovered} requests with expired leases")
+            self.stats.inc_value('scheduler/recovered/redis', recovered, spider=self.spider)
+        return recovered
+
+    def has_pending_requests(self):
+        # Leases held by other processes count: they may still add requests
+        self.release_finished()
+        now = time.time()
+        if now >= self.next_heartbeat:
+            self.heartbeat(now)
+        pipe = self.server.pipeline()
+        pipe.zcard(self.key('slots'))
+        pipe.zcard(self.key('processing'))
+        pending = any(pipe.execute())
+        if pending:
+            self.last_busy = now
+        return pending
+
+    def spider_idle(self, spider):
+        """
+        Wait SCHEDULER_IDLE_GRACE seconds after the frontier emptied before
+        letting the spider close
+        """
+        remaining = self.last_busy + self.idle_grace - time.time()
+        if remaining > 0:
+            from twisted.internet import reactor
+            if not (self.wakeup and self.wakeup.active()):
+                self.wakeup = reactor.callLater(min(remaining, 5.0), self.wake_engine)
+            raise DontCloseSpider
+
+    def __len__(self):
+        slots = self.server.zrange(self.key('slots'), 0, -1)
+        if not slots:
+            return 0
+        pipe = self.server.pipeline()
+        for slot in slots:
+            pipe.zcard(self.key(f'queue:{slot.decode()}'))
+        return sum(pipe.execute())
@@ -12,7 +12,9 @@ BOT_NAME = "scraper"
 SPIDER_MODULES = ["scraper.spiders"]
 NEWSPIDER_MODULE = "scraper.spiders"
 
-ADDONS = {}
+ADDONS = {
+   "scraper.httpcache.HttpCacheModeAddon": 0,
+}
 
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
@@ -52,24 +54,45 @@ DEFAULT_REQUEST_HEADERS = {
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 SPIDER_MIDDLEWARES = {
    "scraper.middlewares.ScraperSpiderMiddleware": 543,
+   "scraper.incremental.IncrementalSpiderMiddleware": 550,
 }
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
    "scraper.middlewares.ScraperDownloaderMiddleware": 543,
+   "scraper.incremental.IncrementalDownloaderMiddleware": 950,
 }
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+   "scraper.extensions.CrawlProgressPublisher": 500,
+   "scraper.runs.CrawlRunRecorder": 510,
+   "scraper.extensions.StatsFileWriter": 520,
+}
+
+# Every crawl is recorded in crawl_runs with a summary of its stats, and the
+# quotes it inserts are tagged with the run's id
+CRAWL_RUNS_ENABLED = os.getenv('CRAWL_RUNS_ENABLED', 'true').lower() == 'true'
+
+# Live progress snapshots, published to Redis for runs started by a Celery
+# task; the task passes its id as CRAWL_TASK_ID
+CRAWL_TASK_ID = None
+CRAWL_PROGRESS_INTERVAL = 5
+CRAWL_PROGRESS_TTL = 86400
+
+# Final stats are written here as JSON when set; subprocess crawls started
+# by a Celery task read them back from it
+STATS_FILE = None
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+# AsyncPostgresPipeline writes from a connection pool off the reactor thread;
+# swap in PostgresPipeline for the synchronous variant
 ITEM_PIPELINES = {
-   "scraper.pipelines.PostgresPipeline": 300,
+   "scraper.dedup.SeenItemFilterPipeline": 250,
+   "scraper.pipelines.AsyncPostgresPipeline": 300,
 }
 
 # Database settings from environment
@@ -81,9 +104,86 @@ DATABASE_CONFIG = {
     'password': os.getenv('POSTGRES_PASSWORD', 'postgres'),
 }
 
+# Batched writes: items are flushed when the buffer holds POSTGRES_BATCH_SIZE
+# items, when POSTGRES_FLUSH_INTERVAL seconds have passed, and on spider close
+POSTGRES_BATCH_SIZE = int(os.getenv('POSTGRES_BATCH_SIZE', 500))
+POSTGRES_FLUSH_INTERVAL = float(os.getenv('POSTGRES_FLUSH_INTERVAL', 5))
+# AsyncPostgresPipeline: connection pool size and the number of in-flight
+# flushes allowed before process_item starts applying backpressure
+POSTGRES_POOL_SIZE = int(os.getenv('POSTGRES_POOL_SIZE', 2))
+POSTGRES_MAX_PENDING_FLUSHES = int(os.getenv('POSTGRES_MAX_PENDING_FLUSHES', 4))
+# Pipelines only check the schema version on open (see scraper.migrations);
+# set SCHEMA_AUTO_MIGRATE=true to migrate from the pipeline instead of init_db
+SCHEMA_AUTO_MIGRATE = os.getenv('SCHEMA_AUTO_MIGRATE', 'false').lower() == 'true'
+# When quotes is partitioned by month, pipelines make sure this many months
+# beyond the current one have a partition before writing
+QUOTES_PARTITIONS_AHEAD = int(os.getenv('QUOTES_PARTITIONS_AHEAD', 2))
+
+# Redis, shared with the API: each flush that inserts rows bumps the
+# CACHE_GENERATION_KEY counter, which invalidates the API response cache
+REDIS_URL = os.getenv(
+    'REDIS_URL',
+    f"redis://{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', 6379)}/0"
+)
+CACHE_GENERATION_KEY = os.getenv('CACHE_GENERATION_KEY', 'quotes:generation')
+# Flush counters (rows inserted vs. duplicate) are added to this hash and
+# exported by the API on /metrics
+METRICS_PIPELINE_KEY = os.getenv('METRICS_PIPELINE_KEY', 'metrics:pipeline')
+
+# Distributed crawling: with DISTRIBUTED_CRAWL=true the request queue and the
+# dupefilter live in Redis, so every worker running the same spider pulls
+# from one shared frontier and a crashed crawl resumes where it stopped
+if os.getenv('DISTRIBUTED_CRAWL', 'false').lower() == 'true':
+    SCHEDULER = "scraper.scheduler.RedisScheduler"
+# Minimum seconds between two requests to one domain, across all workers
+SCHEDULER_DOMAIN_DELAY = float(os.getenv('SCHEDULER_DOMAIN_DELAY', 1))
+# Seconds before a request held by an unresponsive worker is re-queued
+SCHEDULER_LEASE_TIMEOUT = 300
+# Seconds a worker waits for new requests once the shared frontier is empty
+# and no request is leased, before it closes
+SCHEDULER_IDLE_GRACE = float(os.getenv('SCHEDULER_IDLE_GRACE', 10))
+# Start a new crawl: clear the previous crawl's queue and dupefilter, which
+# are kept after a crawl closes. Ignored while other workers are registered
+SCHEDULER_RESET = os.getenv('SCHEDULER_RESET', 'false').lower() == 'true'
+
+# Parse offloading: with PARSE_PROCESSES > 0, spiders using ProcessParseMixin
+# run their parse callbacks in a pool of that many processes, with at most
+# PARSE_MAX_PENDING responses queued (default: twice the pool size)
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES', 0))
+PARSE_MAX_PENDING = None
+PARSE_START_METHOD = "spawn"
+
+# Incremental crawling: remember each page's ETag/Last-Modified and content
+# hash in crawl_pages, send conditional requests, skip unchanged pages and
+# stop paginating once a page holds no new items
+INCREMENTAL_CRAWL = os.getenv('INCREMENTAL_CRAWL', 'false').lower() == 'true'
+
+# Adaptive concurrency: ScraperDownloaderMiddleware grows each slot's
+# concurrency while responses stay fast and healthy and halves it on
+# 429/503, errors or rising latency (AIMD), honouring Retry-After. It
+# replaces AutoThrottle and the download delay when enabled
+ADAPTIVE_CONCURRENCY_ENABLED = os.getenv('ADAPTIVE_CONCURRENCY_ENABLED', 'false').lower() == 'true'
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_MAX = int(os.getenv('ADAPTIVE_CONCURRENCY_MAX', 16))
+# Global ceiling on requests in flight across all slots
+ADAPTIVE_CONCURRENCY_MAX_TOTAL = int(os.getenv('ADAPTIVE_CONCURRENCY_MAX_TOTAL', 32))
+ADAPTIVE_CONCURRENCY_LATENCY_TOLERANCE = 3.0
+ADAPTIVE_CONCURRENCY_DELAY = 0
+
+# Timing instrumentation: the scraper middlewares record queueing, download,
+# parse and pipeline times per domain into histograms that are summarized
+# into the crawl stats (timing/*) when the spider closes. With
+# TIMING_PROMETHEUS_FILE set they are also written there in Prometheus text
+# format; TimedResolver adds DNS lookup times
+TIMING_ENABLED = os.getenv('TIMING_ENABLED', 'true').lower() == 'true'
+TIMING_PROMETHEUS_FILE = os.getenv('TIMING_PROMETHEUS_FILE')
+DNS_RESOLVER = "scraper.timing.TimedResolver"
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-AUTOTHROTTLE_ENABLED = True
+# Runs with adaptive concurrency switch it off themselves, whichever way
+# ADAPTIVE_CONCURRENCY_ENABLED was set
+AUTOTHROTTLE_ENABLED = not ADAPTIVE_CONCURRENCY_ENABLED
 # The initial download delay
 AUTOTHROTTLE_START_DELAY = 1
 # The maximum download delay to be set in case of high latencies
@@ -98,13 +198,30 @@ AUTOTHROTTLE_DEBUG = False
 MEMUSAGE_ENABLED = True
 MEMUSAGE_LIMIT_MB = 512
 MEMUSAGE_WARNING_MB = 256
-# Enable and configure HTTP caching (disabled by default)
+
+# Seen-item filter: known (title, link) keys are preloaded and repeated
+# items are dropped before the database. 'auto' uses an exact hash table
+# when it fits in SEEN_FILTER_MEMORY_MB (default: a quarter of
+# MEMUSAGE_LIMIT_MB) and a Bloom filter otherwise, switching to one if
+# the table outgrows the budget during the crawl
+SEEN_FILTER_MODE = os.getenv('SEEN_FILTER_MODE', 'auto')
+SEEN_FILTER_ERROR_RATE = float(os.getenv('SEEN_FILTER_ERROR_RATE', 0.001))
+SEEN_FILTER_MEMORY_MB = None
+# Only the most recently scraped keys are preloaded (0: all of them);
+# loading costs a few seconds per million keys each time a spider opens
+SEEN_FILTER_LOAD_LIMIT = int(os.getenv('SEEN_FILTER_LOAD_LIMIT', 1_000_000))
+LOG_FORMATTER = "scraper.logformatter.ScraperLogFormatter"
+# HTTP cache / replay mode (see scraper.httpcache.HttpCacheModeAddon):
+# 'record' stores responses in one compressed SQLite file per spider,
+# 'replay' crawls from that file only, with all throttling disabled
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
+HTTPCACHE_MODE = os.getenv('HTTPCACHE_MODE', 'off')
+HTTPCACHE_DIR = os.getenv('HTTPCACHE_DIR', 'httpcache')
+HTTPCACHE_REPLAY_CONCURRENCY = 64
 #HTTPCACHE_ENABLED = True
 #HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = "httpcache"
 #HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+#HTTPCACHE_STORAGE = "scraper.httpcache.SqliteCacheStorage"
 
 # Request fingerprinter implementation
 REQUEST_FINGERPRINTER_IMPLEMENTATION = '2.7'
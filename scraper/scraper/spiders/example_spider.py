@@ -1,12 +1,15 @@
 import scrapy
-from scraper.items import QuoteItem
-from datetime import datetime
+from scraper.items import CompactQuoteItem
+from scraper.extraction import quote_extractor
+from scraper.offload import ProcessParseMixin
+from urllib.parse import urlparse
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class ExampleSpider(scrapy.Spider):
+class ExampleSpider(ProcessParseMixin, scrapy.Spider):
     """
     Spider to scrape quotes from quotes.toscrape.com
     """
@@ -19,35 +22,42 @@ class ExampleSpider(scrapy.Spider):
         'CONCURRENT_REQUESTS': 4,
     }
 
-    def parse(self, response):
+    def __init__(self, start_urls=None, *args, **kwargs):
         """
-        Parse the main page and extract quotes
+        Args:
+            start_urls: Optional comma-separated URLs to crawl instead of
+                quotes.toscrape.com, e.g. a local mirror or benchmark site
+        """
+        super().__init__(*args, **kwargs)
+        if start_urls:
+            if isinstance(start_urls, str):
+                start_urls = [url.strip() for url in start_urls.split(',') if url.strip()]
+            self.start_urls = list(start_urls)
+            self.allowed_domains = sorted({urlparse(url).hostname for url in self.start_urls})
+
+    async def parse(self, response):
+        """
+        Parse the main page, in the parse pool when PARSE_PROCESSES is set
         """
         logger.info(f"Parsing: {response.url}")
-        
-        # Extract all quote containers
-        quotes = response.css('div.quote')
-        
-        for quote in quotes:
-            item = QuoteItem()
-            
-            # Extract title (quote text)
-            title = quote.css('span.text::text').get()
-            
-            # Extract author link
-            author_link = quote.css('a[href*="/author/"]::attr(href)').get()
-            
-            if title and author_link:
-                item['title'] = title.strip()
-                item['link'] = response.urljoin(author_link)
-                item['scraped_at'] = datetime.utcnow()
-                
-                yield item
-        
+        for result in await self.offload('parse_page', response):
+            yield result
+
+    def parse_page(self, response):
+        """
+        Parse the main page and extract quotes
+        """
+        # All quotes in one pass over the page, stamped with one timestamp
+        quotes, next_page = quote_extractor.extract(response)
+        scraped_at = int(time.time())
+
+        for title, link in quotes:
+            yield CompactQuoteItem(title, link, scraped_at)
+
         # Follow pagination
-        next_page = response.css('li.next a::attr(href)').get()
         if next_page:
             logger.info(f"Following next page: {next_page}")
-            yield response.follow(next_page, callback=self.parse)
+            # Marked so an incremental crawl can stop once pages hold no new quotes
+            yield response.follow(next_page, callback=self.parse, meta={'pagination': True})
         else:
-            logger.info("No more pages to scrape")
\ No newline at end of file
+            logger.info("No more pages to scrape")
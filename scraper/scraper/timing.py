@@ -0,0 +1,327 @@
+from scrapy import signals
+from scrapy.resolver import CachingThreadedResolver, dnscache
+from scrapy.utils.httpobj import urlparse_cached
+from weakref import WeakKeyDictionary, WeakSet
+import math
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# What each timing measures; also the HELP text of the Prometheus export
+METRICS = {
+    'dns': 'DNS lookup time (resolver cache misses only)',
+    'ttfb': 'Time from sending a request to its response headers, connection setup included',
+    'transfer': 'Time from response headers to the last byte of the body',
+    'download': 'Total download time, from handing the request to the download handler to the last byte',
+    'queue_scheduler': 'Time a request waited in the scheduler',
+    'queue_downloader': 'Time a request waited in its download slot (concurrency and delay)',
+    'parse': 'Time spent producing the output of a spider callback (in the parse pool when offloaded)',
+    'parse_wall': 'Wall time of an async spider callback, including time spent awaiting (e.g. the parse pool)',
+    'pipeline': 'Time an item spent in the item pipelines',
+}
+
+# Bucket bounds of the Prometheus export, in seconds
+PROMETHEUS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registries = WeakKeyDictionary()
+
+# DNS lookups go through one resolver per process, not per crawler; each
+# lookup is recorded into the registries of the crawls open at the time
+_open_registries = WeakSet()
+
+
+class LatencyHistogram:
+    """
+    Log-linear (HDR-style) histogram of durations in seconds
+
+    Every power of two from MIN_VALUE up is split into SUB_BUCKETS linear
+    buckets, so any recorded value is known to within 1/SUB_BUCKETS (about
+    6%) whatever its magnitude. Buckets are a sparse dict of counts:
+    recording is a frexp and a dict increment.
+    """
+
+    MIN_VALUE = 1e-6
+    SUB_BUCKETS = 16
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    @classmethod
+    def bucket_index(cls, value):
+        if value <= cls.MIN_VALUE:
+            return 0
+        mantissa, exponent = math.frexp(value / cls.MIN_VALUE)
+        return exponent * cls.SUB_BUCKETS + int((mantissa - 0.5) * 2 * cls.SUB_BUCKETS)
+
+    @classmethod
+    def bucket_upper(cls, index):
+        if index == 0:
+            return cls.MIN_VALUE
+        exponent, sub = divmod(index, cls.SUB_BUCKETS)
+        return cls.MIN_VALUE * 2 ** (exponent - 1) * (1 + (sub + 1) / cls.SUB_BUCKETS)
+
+    def record(self, value):
+        value = max(value, 0.0)
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket holding the q-th percentile (0-100)
+        """
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(self.count * q / 100), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_upper(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """
+        Count of values at or below each bound, for Prometheus buckets
+        """
+        ordered = sorted(self.counts.items())
+        result = []
+        position = seen = 0
+        for bound in bounds:
+            while position < len(ordered) and self.bucket_upper(ordered[position][0]) <= bound:
+                seen += ordered[position][1]
+                position += 1
+            result.append(seen)
+        return result
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class TimingRegistry:
+    """
+    Latency histograms of one crawl, keyed by metric and labels
+
+    Shared by the middlewares that record into it (one per crawler, see
+    from_crawler). At spider_closed every histogram is summarized into the
+    stats as ``timing/<metric>/<labels>/{count,p50_ms,p90_ms,p99_ms,max_ms}``
+    and, with TIMING_PROMETHEUS_FILE set, written in Prometheus text format
+    (e.g. for node_exporter's textfile collector).
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, stats=None, prometheus_file=None):
+        self.stats = stats
+        self.prometheus_file = prometheus_file
+        self.histograms = {}
+        self.spider_name = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        registry = _registries.get(crawler)
+        if registry is None:
+            registry = _registries[crawler] = cls(
+                crawler.stats,
+                prometheus_file=crawler.settings.get('TIMING_PROMETHEUS_FILE')
+            )
+            crawler.signals.connect(registry.spider_opened, signal=signals.spider_opened)
+            crawler.signals.connect(registry.spider_closed, signal=signals.spider_closed)
+        return registry
+
+    def observe(self, metric, seconds, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def snapshot(self):
+        """
+        All histograms of this crawl
+        """
+        return dict(self.histograms)
+
+    def spider_opened(self, spider):
+        self.spider_name = spider.name
+        _open_registries.add(self)
+
+    def spider_closed(self, spider, reason):
+        _open_registries.discard(self)
+        histograms = self.snapshot()
+        if self.stats:
+            for (metric, labels), histogram in histograms.items():
+                prefix = '/'.join(['timing', metric] + [str(value) for _, value in labels])
+                self.stats.set_value(f'{prefix}/count', histogram.count)
+                for q in self.PERCENTILES:
+                    self.stats.set_value(f'{prefix}/p{q}_ms', round(histogram.percentile(q) * 1000, 1))
+                self.stats.set_value(f'{prefix}/max_ms', round(histogram.max * 1000, 1))
+
+        if self.prometheus_file:
+            try:
+                self.write_prometheus(self.prometheus_file, histograms)
+            except OSError as e:
+                logger.warning(f"Could not write timing metrics to {self.prometheus_file}: {e}")
+            else:
+                logger.info(f"Timing metrics written to {self.prometheus_file}")
+
+    def prometheus_text(self, histograms=None):
+        """
+        Histograms in the Prometheus text exposition format
+        """
+        histograms = self.snapshot() if histograms is None else histograms
+        by_metric = {}
+        for (metric, labels), histogram in sorted(histograms.items()):
+            by_metric.setdefault(metric, []).append((labels, histogram))
+
+        lines = []
+        for metric, series in by_metric.items():
+            name = f'scraper_{metric}_seconds'
+            lines.append(f'# HELP {name} {METRICS.get(metric, metric)}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, histogram in series:
+                labels = (('spider', self.spider_name or ''),) + labels
+                base = ','.join(f'{key}="{_label_value(value)}"' for key, value in labels)
+                for bound, count in zip(PROMETHEUS_BUCKETS, histogram.cumulative(PROMETHEUS_BUCKETS)):
+                    lines.append(f'{name}_bucket{{{base},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{base},le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{{base}}} {histogram.total:.6f}')
+                lines.append(f'{name}_count{{{base}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, histograms=None):
+        # Write then rename so a collector never reads half a file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text(histograms))
+        os.replace(tmp_path, path)
+
+
+class RequestTimer:
+    """
+    Download-side timings of each request, from the engine's signals
+
+    Timestamps are kept in ``request.meta['timing']`` (wall clock, so they
+    stay meaningful when a request is scheduled by one worker and fetched by
+    another). Scrapy's ``download_latency`` covers connection setup plus
+    time to the response headers; it is recorded as ``ttfb`` since the
+    download handler does not expose connect time on its own.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def connect(self, crawler):
+        crawler.signals.connect(self.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+
+    @staticmethod
+    def stamps(request):
+        stamps = request.meta.get('timing')
+        if stamps is None:
+            stamps = request.meta['timing'] = {}
+        return stamps
+
+    def request_scheduled(self, request, spider):
+        self.stamps(request)['scheduled'] = time.time()
+
+    def request_reached_downloader(self, request, spider):
+        self.stamps(request)['downloader'] = time.time()
+
+    def headers_received(self, headers, body_length, request, spider):
+        self.stamps(request)['headers'] = time.time()
+
+    def response_downloaded(self, response, request, spider):
+        now = time.time()
+        stamps = self.stamps(request)
+        domain = urlparse_cached(request).hostname or ''
+        latency = request.meta.get('download_latency')
+        headers_at = stamps.get('headers')
+        if latency is not None:
+            started = (headers_at or now) - latency
+            self.registry.observe('ttfb', latency, domain=domain)
+            self.registry.observe('download', now - started, domain=domain)
+            if 'downloader' in stamps:
+                self.registry.observe('queue_downloader', max(started - stamps['downloader'], 0.0), domain=domain)
+        if headers_at is not None:
+            self.registry.observe('transfer', max(now - headers_at, 0.0), domain=domain)
+        if 'scheduled' in stamps and 'downloader' in stamps:
+            self.registry.observe('queue_scheduler', max(stamps['downloader'] - stamps['scheduled'], 0.0),
+                                  domain=domain)
+
+
+class TimedResolver(CachingThreadedResolver):
+    """
+    Scrapy's caching resolver, timing every lookup that misses the cache
+
+    Set as DNS_RESOLVER. The resolver is installed once per process, so
+    a lookup is recorded into every crawl open at the time: with crawls
+    running one after another (as in a Celery worker) each one reports its
+    own lookups only.
+    """
+
+    def getHostByName(self, name, timeout=None):
+        if name in dnscache:
+            return super().getHostByName(name, timeout)
+        started = time.monotonic()
+        d = super().getHostByName(name, timeout)
+        d.addBoth(self._record, name, started)
+        return d
+
+    @staticmethod
+    def _record(result, name, started):
+        elapsed = time.monotonic() - started
+        for registry in list(_open_registries):
+            registry.observe('dns', elapsed, domain=name)
+        return result
+
+
+class ItemTimer:
+    """
+    Pipeline time of each item, from leaving the spider middleware to the
+    item_scraped/item_dropped/item_error signal the pipelines end with
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.pending = {}
+
+    def connect(self, crawler):
+        crawler.signals.connect(self.item_done, signal=signals.item_scraped)
+        crawler.signals.connect(self.item_done, signal=signals.item_dropped)
+        crawler.signals.connect(self.item_done, signal=signals.item_error)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    def start(self, item, domain):
+        self.pending[id(item)] = (time.perf_counter(), domain)
+
+    def item_done(self, item, spider, **kwargs):
+        started = self.pending.pop(id(item), None)
+        if started is not None:
+            self.registry.observe('pipeline', time.perf_counter() - started[0], domain=started[1])
+
+    def spider_closed(self, spider):
+        self.pending.clear()
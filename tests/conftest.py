@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# `api` is imported from the repository root and the Scrapy project's
+# `scraper` package from scraper/, as in the images (PYTHONPATH=/scraper)
+for path in (ROOT, os.path.join(ROOT, 'scraper')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from api.coalesce import SingleFlight
+from api.pagination import (
+    InvalidCursor, decode_cursor, decode_search_cursor, encode_cursor, encode_search_cursor
+)
+
+
+def test_cursor_round_trip():
+    scraped_at = datetime(2026, 10, 17, 12, 30, 5, 123456)
+
+    token = encode_cursor(scraped_at, 42)
+
+    assert '=' not in token
+    assert decode_cursor(token) == (scraped_at, 42)
+
+
+def test_search_cursor_round_trip():
+    assert decode_search_cursor(encode_search_cursor(0.25, 7)) == (0.25, 7)
+    assert decode_search_cursor(encode_search_cursor(None, 7)) == (None, 7)
+
+
+@pytest.mark.parametrize('token', ['', 'not-a-cursor', encode_search_cursor(0.5, 3), 'W10'])
+def test_invalid_cursors_are_rejected(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
+
+
+@pytest.mark.parametrize('token', ['', '!!!', encode_cursor(datetime(2026, 1, 1), 3)])
+def test_invalid_search_cursors_are_rejected(token):
+    with pytest.raises(InvalidCursor):
+        decode_search_cursor(token)
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight('quotes')
+    started = []
+
+    async def load(value):
+        started.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        return await asyncio.gather(*(flight.do('key', load, 21) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42] * 5
+    assert started == [21]
+    assert flight.metrics() == {'in_flight': 0, 'calls': 1, 'coalesced': 4}
+
+
+def test_different_keys_and_later_calls_run_separately():
+    flight = SingleFlight('quotes')
+
+    async def load(value):
+        await asyncio.sleep(0)
+        return value
+
+    async def main():
+        first = await asyncio.gather(flight.do('a', load, 1), flight.do('b', load, 2))
+        second = await flight.do('a', load, 3)
+        return first, second
+
+    assert asyncio.run(main()) == ([1, 2], 3)
+    assert flight.metrics()['calls'] == 3
+    assert flight.metrics()['coalesced'] == 0
+
+
+def test_errors_reach_every_waiting_caller():
+    flight = SingleFlight('quotes')
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('database unavailable')
+
+    async def main():
+        return await asyncio.gather(*(flight.do('key', fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.metrics()['in_flight'] == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flight = SingleFlight('quotes')
+
+    async def load():
+        await asyncio.sleep(0.02)
+        return 'done'
+
+    async def main():
+        first = asyncio.ensure_future(flight.do('key', load))
+        second = asyncio.ensure_future(flight.do('key', load))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ('done', True)
+
+
+def test_disabled_flight_runs_every_call():
+    flight = SingleFlight('quotes', enabled=False)
+    started = []
+
+    async def load():
+        started.append(1)
+        await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(flight.do('key', load) for _ in range(3)))
+
+    asyncio.run(main())
+    assert len(started) == 3
+    assert flight.metrics()['coalesced'] == 0
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from scraper.dedup import BloomFilter, FilterFull, HashSet64, SeenItemFilterPipeline, item_hash
+
+
+def random_keys(count, seed=7):
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(count)]
+
+
+def test_item_hash_is_stable_and_key_sensitive():
+    assert item_hash('To be', '/author/x') == item_hash('To be', '/author/x')
+    assert item_hash('To be', '/author/x') != item_hash('To be', '/author/y')
+    assert 0 <= item_hash('To be', '/author/x') < 2 ** 64
+
+
+def test_hashset_add_and_contains():
+    keys = HashSet64(expected=16)
+
+    assert keys.add(42) is True
+    assert keys.add(42) is False
+    assert 42 in keys
+    assert 43 not in keys
+    assert len(keys) == 1
+
+
+def test_hashset_stores_zero_as_one():
+    keys = HashSet64()
+
+    assert keys.add(0) is True
+    assert 0 in keys
+    assert keys.add(1) is False
+
+
+def test_hashset_grows_without_losing_keys():
+    keys = HashSet64(expected=16)
+    values = random_keys(5000)
+    capacity = keys.capacity
+
+    for value in values:
+        keys.add(value)
+
+    assert keys.capacity > capacity
+    assert len(keys) == len(set(values))
+    assert all(value in keys for value in values)
+    assert sorted(keys) == sorted(set(values))
+
+
+def test_hashset_refuses_to_grow_past_max_bytes():
+    keys = HashSet64(expected=16, max_bytes=HashSet64.estimate_bytes(16) + 1)
+    values = random_keys(100)
+
+    with pytest.raises(FilterFull):
+        for value in values:
+            keys.add(value)
+    # The key that hit the limit was still stored
+    assert all(value in keys for value in values[:len(keys)])
+    assert keys.nbytes <= keys.max_bytes
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    values = random_keys(10_000)
+
+    for value in values:
+        bloom.add(value)
+
+    assert all(value in bloom for value in values)
+
+
+def test_bloom_filter_false_positive_rate_near_target():
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    for value in random_keys(10_000):
+        bloom.add(value)
+
+    others = random_keys(20_000, seed=11)
+    false_positives = sum(value in bloom for value in others)
+
+    assert false_positives / len(others) < 0.03
+    assert bloom.false_positive_rate < 0.03
+
+
+def test_bloom_filter_respects_max_bytes():
+    bloom = BloomFilter(1_000_000, error_rate=0.001, max_bytes=4096)
+
+    assert bloom.nbytes <= 4096
+
+
+def test_exact_filter_switches_to_bloom_when_full():
+    pipeline = SeenItemFilterPipeline(db_config=None, memory_budget_mb=1 / 64)
+    pipeline.keys = pipeline.create_filter(0)
+    assert pipeline.keys.structure == 'exact'
+    values = random_keys(5000)
+
+    for value in values:
+        pipeline.add(value)
+
+    assert pipeline.keys.structure == 'bloom'
+    assert pipeline.keys.nbytes <= pipeline.memory_budget
+    assert all(value in pipeline.keys for value in values)
+    assert pipeline.add(values[0]) is False
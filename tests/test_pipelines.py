@@ -0,0 +1,99 @@
+import psycopg2
+import pytest
+
+from scraper.pipelines import PostgresPipeline
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(' '.join(sql.split()))
+
+
+class RejectingPipeline(PostgresPipeline):
+    """
+    write_batch stand-in: fails the whole batch if any row has a bad title,
+    like a COPY or INSERT the database rejects
+    """
+
+    batches = None
+
+    @classmethod
+    def write_batch(cls, cursor, rows, run_id=None, partitioned=False):
+        cls.batches.append(list(rows))
+        for row in rows:
+            if row[0] == 'bad':
+                raise psycopg2.DataError(f"invalid row {row!r}")
+            if row[0] == 'lost':
+                raise psycopg2.OperationalError("server closed the connection")
+        return len(rows)
+
+
+@pytest.fixture
+def pipeline():
+    RejectingPipeline.batches = []
+    return RejectingPipeline
+
+
+def rows(*titles):
+    return [(title, f'/author/{i}', 1_700_000_000 + i) for i, title in enumerate(titles)]
+
+
+def test_clean_batch_is_written_once(pipeline):
+    cursor = RecordingCursor()
+    batch = rows('a', 'b', 'c')
+
+    assert pipeline.write_rows(cursor, batch) == (3, [])
+    assert pipeline.batches == [batch]
+    assert cursor.statements == ['SAVEPOINT quotes_batch', 'RELEASE SAVEPOINT quotes_batch']
+
+
+def test_only_the_bad_row_is_rejected(pipeline):
+    cursor = RecordingCursor()
+    batch = rows('a', 'b', 'c', 'bad', 'e', 'f', 'g', 'h')
+
+    inserted, rejected = pipeline.write_rows(cursor, batch)
+
+    assert inserted == 7
+    assert [row for row, _ in rejected] == [batch[3]]
+    assert isinstance(rejected[0][1], psycopg2.DataError)
+
+
+def test_several_bad_rows_are_isolated(pipeline):
+    batch = rows('bad', 'b', 'c', 'd', 'e', 'bad', 'g', 'bad', 'i')
+
+    inserted, rejected = pipeline.write_rows(RecordingCursor(), batch)
+
+    assert inserted == 6
+    assert [row for row, _ in rejected] == [batch[0], batch[5], batch[7]]
+
+
+def test_all_rows_bad(pipeline):
+    batch = rows('bad', 'bad', 'bad')
+
+    assert [row for row, _ in pipeline.write_rows(RecordingCursor(), batch)[1]] == batch
+
+
+def test_savepoints_are_balanced_and_staging_cleared(pipeline):
+    cursor = RecordingCursor()
+
+    _, rejected = pipeline.write_rows(cursor, rows('a', 'bad', 'c', 'd'))
+
+    opened = cursor.statements.count('SAVEPOINT quotes_batch')
+    closed = sum(
+        statement in ('RELEASE SAVEPOINT quotes_batch', 'ROLLBACK TO SAVEPOINT quotes_batch')
+        for statement in cursor.statements
+    )
+    assert opened == closed
+    # Each split clears the staging table after both of its halves
+    splits = cursor.statements.count('ROLLBACK TO SAVEPOINT quotes_batch') - len(rejected)
+    assert splits == 2
+    assert cursor.statements.count('DELETE FROM quotes_staging') == 2 * splits
+
+
+def test_connection_errors_fail_the_whole_batch(pipeline):
+    with pytest.raises(psycopg2.OperationalError):
+        pipeline.write_rows(RecordingCursor(), rows('a', 'lost', 'c'))
+    assert len(pipeline.batches) == 1
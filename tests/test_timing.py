@@ -0,0 +1,124 @@
+import random
+
+from scraper.timing import PROMETHEUS_BUCKETS, LatencyHistogram, TimedResolver, TimingRegistry
+
+
+class Spider:
+    name = 'quotes'
+
+
+class FakeStats:
+    def __init__(self):
+        self.values = {}
+
+    def set_value(self, key, value):
+        self.values[key] = value
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+
+    assert histogram.percentile(50) == 0.0
+    assert histogram.cumulative((0.1, 1)) == [0, 0]
+
+
+def test_buckets_keep_values_within_relative_precision():
+    for value in (2e-6, 0.00037, 0.0123, 0.5, 1.0, 7.3, 120.0):
+        index = LatencyHistogram.bucket_index(value)
+        upper = LatencyHistogram.bucket_upper(index)
+        assert value <= upper <= value * (1 + 1 / LatencyHistogram.SUB_BUCKETS) + 1e-12
+        assert LatencyHistogram.bucket_index(upper * 0.999999) == index
+
+
+def test_percentiles_match_sorted_values():
+    rng = random.Random(3)
+    values = [rng.lognormvariate(-4, 1) for _ in range(10_000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    ordered = sorted(values)
+    for q in (50, 90, 99):
+        exact = ordered[int(len(ordered) * q / 100) - 1]
+        assert exact <= histogram.percentile(q) <= exact * 1.07
+    assert histogram.percentile(100) == histogram.max == max(values)
+    assert histogram.min == min(values)
+    assert histogram.count == len(values)
+
+
+def test_negative_values_count_as_zero():
+    histogram = LatencyHistogram()
+    histogram.record(-0.5)
+
+    assert histogram.min == 0.0
+    assert histogram.percentile(50) == 0.0
+
+
+def test_merge_equals_recording_everything_in_one():
+    rng = random.Random(5)
+    values = [rng.random() for _ in range(1000)]
+    first, second, combined = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, value in enumerate(values):
+        (first if i % 2 else second).record(value)
+        combined.record(value)
+
+    first.merge(second)
+
+    assert first.counts == combined.counts
+    assert first.count == combined.count
+    assert (first.min, first.max) == (combined.min, combined.max)
+    assert abs(first.total - combined.total) < 1e-9
+
+
+def test_cumulative_counts_are_monotonic_and_complete():
+    histogram = LatencyHistogram()
+    for value in (0.0005, 0.003, 0.003, 0.2, 4.0, 100.0):
+        histogram.record(value)
+
+    counts = histogram.cumulative(PROMETHEUS_BUCKETS)
+
+    assert counts == sorted(counts)
+    assert counts[0] == 1
+    assert counts[-1] == 5
+
+
+def test_registry_summarizes_into_stats_at_close():
+    registry = TimingRegistry(stats=FakeStats())
+    registry.spider_opened(Spider())
+    for ms in range(1, 101):
+        registry.observe('download', ms / 1000, domain='example.com')
+
+    registry.spider_closed(Spider(), 'finished')
+
+    values = registry.stats.values
+    assert values['timing/download/example.com/count'] == 100
+    assert 50 <= values['timing/download/example.com/p50_ms'] <= 54
+    assert values['timing/download/example.com/max_ms'] == 100.0
+
+
+def test_dns_lookups_only_reach_open_registries():
+    first, second = TimingRegistry(), TimingRegistry()
+    first.spider_opened(Spider())
+    TimedResolver._record(None, 'example.com', 0.0)
+    first.spider_closed(Spider(), 'finished')
+    second.spider_opened(Spider())
+    TimedResolver._record(None, 'example.org', 0.0)
+    second.spider_closed(Spider(), 'finished')
+
+    assert [labels for _, labels in first.histograms] == [(('domain', 'example.com'),)]
+    assert [labels for _, labels in second.histograms] == [(('domain', 'example.org'),)]
+
+
+def test_prometheus_text_lists_every_bucket():
+    registry = TimingRegistry()
+    registry.spider_name = 'quotes'
+    registry.observe('parse', 0.002, domain='example.com', callback='parse')
+
+    lines = registry.prometheus_text().splitlines()
+
+    assert lines[1] == '# TYPE scraper_parse_seconds histogram'
+    buckets = [line for line in lines if line.startswith('scraper_parse_seconds_bucket')]
+    assert len(buckets) == len(PROMETHEUS_BUCKETS) + 1
+    assert buckets[-1] == (
+        'scraper_parse_seconds_bucket{spider="quotes",callback="parse",domain="example.com",le="+Inf"} 1'
+    )